@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片预处理微基准：对比原有的加载+全尺寸LANCZOS缩放路径与解码时缩小的预处理路径
+
+每种方法在独立的子进程中运行，分别统计单张耗时和进程峰值内存。
+
+用法:
+    python benchmarks/bench_image_preprocess.py --megapixels 24 --repeat 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_DIR)
+
+def make_test_image(path, megapixels, orientation):
+    """生成带EXIF方向信息的测试JPEG（渐变加噪声，接近相机照片的压缩率）"""
+    from PIL import Image
+    
+    width = int((megapixels * 1e6 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 64)
+    image = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    image.save(path, format='JPEG', quality=92, exif=exif.tobytes())
+    return width, height
+
+def run_method(method, image_path, repeat, max_size):
+    """在当前进程中运行一种预处理方法，返回统计结果"""
+    from loguru import logger
+    from utils import image_utils
+    
+    logger.remove()
+    timings = []
+    payload = None
+    
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if method == 'legacy':
+            image = image_utils.load_image(image_path)
+            resized = image_utils.resize_image(image, max_size)
+            payload = image_utils.encode_image(resized)
+            image.close()
+        else:
+            payload = image_utils.prepare_image_payload(image_path, {'max_size': max_size})
+        timings.append(time.perf_counter() - start)
+    
+    timings.sort()
+    return {
+        'method': method,
+        'median_ms': timings[len(timings) // 2] * 1000,
+        'min_ms': timings[0] * 1000,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'output_size': [payload.width, payload.height],
+        'output_bytes': payload.size
+    }
+
+def run_pool(image_path, count, workers, max_size):
+    """用ImagePreprocessor进程池批量处理count张图片，返回吞吐量"""
+    from loguru import logger
+    from utils.image_utils import ImagePreprocessor
+    
+    logger.remove()
+    preprocessor = ImagePreprocessor({'max_size': max_size, 'process_workers': workers})
+    try:
+        # 预热：启动子进程
+        preprocessor.process(image_path)
+        start = time.perf_counter()
+        futures = [preprocessor.submit(image_path) for _ in range(count)]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        preprocessor.close()
+    
+    return {
+        'method': f'pool x{workers}',
+        'images': count,
+        'images_per_second': count / elapsed
+    }
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='图片预处理微基准')
+    parser.add_argument('--megapixels', type=float, default=24, help='测试图片像素数（百万）')
+    parser.add_argument('--repeat', type=int, default=5, help='每种方法的重复次数')
+    parser.add_argument('--max-size', type=int, default=1024, help='缩放后的最长边')
+    parser.add_argument('--pool-workers', type=int, default=0, help='额外测试进程池吞吐量的进程数，为0时不测试')
+    parser.add_argument('--image', help='使用已有图片代替生成的测试图片')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--make-image', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.make_image:
+        width, height = make_test_image(args.make_image, args.megapixels, orientation=6)
+        print(json.dumps([width, height]))
+        return
+    
+    if args.worker:
+        print(json.dumps(run_method(args.worker, args.image, args.repeat, args.max_size)))
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = args.image
+        if not image_path:
+            image_path = os.path.join(tmp_dir, 'bench.jpg')
+            # 在子进程中生成测试图片：Linux的峰值内存统计会经exec继承给子进程
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--make-image', image_path, '--megapixels', str(args.megapixels)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            width, height = json.loads(output.strip().splitlines()[-1])
+            print(f"测试图片: {width}x{height}，{os.path.getsize(image_path) / 1e6:.1f} MB，EXIF方向6")
+        
+        results = []
+        for method in ('legacy', 'fast'):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', method, '--image', image_path,
+                 '--repeat', str(args.repeat), '--max-size', str(args.max_size)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        
+        for result in results:
+            print(
+                f"{result['method']:>8}: 中位数 {result['median_ms']:8.1f} ms，最快 {result['min_ms']:8.1f} ms，"
+                f"峰值内存 {result['peak_rss_mb']:7.1f} MB，输出 {result['output_size'][0]}x{result['output_size'][1]}"
+            )
+        print(f"加速比: {results[0]['median_ms'] / results[1]['median_ms']:.1f}x")
+        
+        if args.pool_workers > 0:
+            pool_result = run_pool(image_path, args.repeat * args.pool_workers, args.pool_workers, args.max_size)
+            results.append(pool_result)
+            print(f"{pool_result['method']:>8}: {pool_result['images_per_second']:.1f} 张/秒")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
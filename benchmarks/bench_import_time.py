@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准：用python -X importtime运行命令行入口，统计模块导入耗时和总用时
+
+默认运行`main.py --list-providers`，该命令不应导入requests、PIL或任何提供商模块。
+指定--budget-ms时，导入总耗时超出预算则以非零状态退出，可用于CI检查。
+
+用法:
+    python benchmarks/bench_import_time.py --repeat 5 --budget-ms 300
+    python benchmarks/bench_import_time.py -- --help
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_SCRIPT = os.path.join(ROOT_DIR, 'src', 'main.py')
+DEFAULT_CONFIG = os.path.join(ROOT_DIR, 'config', 'config.yaml')
+
+# 这些模块出现在--list-providers的导入记录中说明延迟导入失效
+HEAVY_MODULES = ['requests', 'PIL', 'jwt', 'llm.llm_client', 'video.kling_generator', 'pipeline.batch_pipeline']
+
+def parse_importtime(stderr):
+    """
+    解析-X importtime的输出
+    
+    Args:
+        stderr: 子进程的标准错误输出
+    
+    Returns:
+        {模块名: (自身耗时微秒, 累计耗时微秒, 嵌套层级)}
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # 模块名前有一个空格，之后每层嵌套缩进两个空格
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), level)
+    return modules
+
+def run_once(command_args):
+    """运行一次入口命令，返回墙钟耗时（秒）和导入记录"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', MAIN_SCRIPT] + command_args,
+        capture_output=True, text=True, cwd=ROOT_DIR
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"命令执行失败（退出码{result.returncode}）: {result.stderr[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='命令行启动耗时基准')
+    parser.add_argument('--repeat', type=int, default=5, help='运行次数，取中位数')
+    parser.add_argument('--top', type=int, default=15, help='输出累计耗时最多的顶层模块数')
+    parser.add_argument('--budget-ms', type=float, help='导入总耗时预算（毫秒），超出时以非零状态退出')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='配置文件路径')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('command', nargs='*', help='传给main.py的参数，默认为--list-providers')
+    args = parser.parse_args()
+    
+    command_args = args.command or ['--list-providers', '--config', args.config]
+    
+    runs = []
+    for _ in range(args.repeat):
+        runs.append(run_once(command_args))
+    runs.sort(key=lambda run: sum(module[0] for module in run[1].values()))
+    wall_time, modules = runs[len(runs) // 2]
+    
+    import_ms = sum(self_us for self_us, _, _ in modules.values()) / 1000
+    top_level = sorted(
+        ((name, cumulative_us) for name, (_, cumulative_us, level) in modules.items() if level == 0),
+        key=lambda item: item[1], reverse=True
+    )
+    heavy = [name for name in HEAVY_MODULES if name in modules]
+    
+    print(f"命令: main.py {' '.join(command_args)}")
+    print(f"墙钟耗时: {wall_time * 1000:.1f} ms，导入耗时: {import_ms:.1f} ms，导入模块数: {len(modules)}")
+    print("累计耗时最多的顶层模块:")
+    for name, cumulative_us in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    if heavy:
+        print(f"已导入的重量级模块: {', '.join(heavy)}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'command': command_args,
+                'wall_ms': wall_time * 1000,
+                'import_ms': import_ms,
+                'module_count': len(modules),
+                'top_modules': [{'name': name, 'cumulative_ms': us / 1000} for name, us in top_level[:args.top]],
+                'heavy_modules': heavy
+            }, f, ensure_ascii=False, indent=2)
+    
+    if args.budget_ms is not None and import_ms > args.budget_ms:
+        print(f"导入耗时超出预算: {import_ms:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
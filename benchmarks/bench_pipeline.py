@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端流水线基准：启动本地模拟服务，用main.py的批处理模式处理不同数量的图片，
+在不同并发度下测量吞吐量、各阶段耗时分位数、请求数和峰值内存
+
+每组参数在独立的子进程中运行main.py，配置由config.yaml复制而来，
+只把LLM和可灵的endpoint指向模拟服务，并关闭缓存、任务日志和回调。
+并发度同时设置describe/render阶段的线程数、渲染名额（render_slots）和
+可灵的max_in_flight。
+
+用法:
+    python benchmarks/bench_pipeline.py --images 8,32 --concurrency 2,8 --render-time uniform:2,4
+    python benchmarks/bench_pipeline.py --llm Claude --rate-limit-rate 0.05 --json results.json
+"""
+
+import os
+import re
+import sys
+import copy
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+MAIN_SCRIPT = os.path.join(ROOT_DIR, 'src', 'main.py')
+DEFAULT_CONFIG = os.path.join(ROOT_DIR, 'config', 'config.yaml')
+
+sys.path.insert(0, BENCH_DIR)
+from mock_servers import MockServer, add_mock_arguments, mock_config_from_args, expected
+
+# 从指标摘要中提取分位数的耗时直方图及其分组标签
+LATENCY_METRICS = {
+    'job': ('image_to_video_pipeline_job_seconds', 'status'),
+    'stage': ('image_to_video_pipeline_stage_seconds', 'stage'),
+    'queue_wait': ('image_to_video_pipeline_queue_wait_seconds', 'stage'),
+    'llm_request': ('image_to_video_llm_request_seconds', 'status'),
+    'video_render': ('image_to_video_video_render_seconds', None),
+    'video_wait': ('image_to_video_video_wait_seconds', None),
+    'video_download': ('image_to_video_video_download_seconds', None)
+}
+
+_ELAPSED_RE = re.compile(r'^总用时: ([\d.]+)秒', re.MULTILINE)
+
+def parse_int_list(text):
+    """解析逗号分隔的整数列表"""
+    return [int(value) for value in text.split(',') if value.strip()]
+
+def make_images(directory, count, size):
+    """生成count张内容互不相同的测试JPEG"""
+    from PIL import Image
+    
+    os.makedirs(directory, exist_ok=True)
+    width, height = size, size * 3 // 4
+    gradient = Image.linear_gradient('L').resize((width, height))
+    for index in range(count):
+        noise = Image.effect_noise((width, height), 32 + index % 64)
+        shade = Image.new('L', (width, height), (index * 37) % 256)
+        image = Image.merge('RGB', (gradient, noise, shade))
+        image.save(os.path.join(directory, f"bench_{index:04d}.jpg"), format='JPEG', quality=85)
+
+def build_config(base_config, mock_url, mock_config, concurrency, work_dir):
+    """
+    基于原配置生成指向模拟服务的配置
+    
+    Args:
+        base_config: 原配置字典
+        mock_url: 模拟服务地址
+        mock_config: 模拟服务配置
+        concurrency: 并发度
+        work_dir: 本次运行的临时目录
+    
+    Returns:
+        配置字典
+    """
+    config = copy.deepcopy(base_config)
+    
+    for provider in config['llm']['providers'].values():
+        claude = 'claude' in str(provider.get('type') or provider.get('name', '')).lower()
+        provider['endpoint'] = f"{mock_url}/v1/messages" if claude else f"{mock_url}/v1/chat/completions"
+        rate_limit = provider.setdefault('rate_limit', {})
+        rate_limit['max_in_flight'] = max(rate_limit.get('max_in_flight', 0), concurrency)
+    
+    for provider in config['video_generator']['providers'].values():
+        provider['endpoint'] = mock_url
+        provider['secret_key'] = 'bench-secret-key-with-32-bytes!!'
+        provider['default_render_eta'] = max(1, expected(mock_config['render_time']))
+        provider['eta_history_file'] = os.path.join(work_dir, 'eta_history.json')
+        provider.setdefault('callback', {})['enabled'] = False
+        provider.setdefault('rate_limit', {})['max_in_flight'] = concurrency
+    
+    pipeline = config.setdefault('pipeline', {})
+    workers = pipeline.setdefault('workers', {})
+    workers['describe'] = concurrency
+    workers['render'] = concurrency
+    pipeline.setdefault('scheduler', {})['render_slots'] = concurrency
+    
+    for cache in (config.get('cache') or {}).values():
+        cache['enabled'] = False
+    config.setdefault('journal', {})['enabled'] = False
+    config.setdefault('logging', {})['file'] = os.path.join(work_dir, 'app.log')
+    config['metrics'] = dict(
+        config.get('metrics') or {},
+        enabled=True,
+        prometheus_file=None,
+        summary_file=os.path.join(work_dir, 'metrics_summary.json')
+    )
+    return config
+
+def run_main(config_path, input_dir, output_dir, llm, log_path):
+    """
+    在子进程中运行批处理，返回墙钟耗时、退出码和子进程的峰值内存（MB）
+    
+    用os.wait4取得该子进程（含其已回收的子进程）的资源统计，各次运行互不影响。
+    """
+    command = [
+        sys.executable, MAIN_SCRIPT, '--config', config_path, '--input-dir', input_dir,
+        '--output-dir', output_dir, '--no-cache', '--no-journal'
+    ]
+    if llm:
+        command += ['--llm', llm]
+    
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, cwd=ROOT_DIR)
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # Linux下ru_maxrss的单位为KB，macOS下为字节
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return elapsed, process.returncode, peak_rss_mb
+
+def summarize_metrics(summary):
+    """从指标摘要中提取任务数和各耗时直方图的分位数"""
+    jobs = {
+        entry['labels'].get('status'): entry['value']
+        for entry in summary.get('image_to_video_pipeline_jobs_total', [])
+    }
+    latency = {}
+    for key, (name, label) in LATENCY_METRICS.items():
+        groups = {}
+        for entry in summary.get(name, []):
+            group = entry['labels'].get(label, 'all') if label else 'all'
+            if label == 'stage' and key == 'stage' and entry['labels'].get('status') != 'ok':
+                group = f"{group}_{entry['labels'].get('status')}"
+            groups[group] = {field: entry[field] for field in ('count', 'mean', 'p50', 'p95', 'p99', 'max')}
+        if groups:
+            latency[key] = groups
+    return jobs, latency
+
+def run_case(server, base_config, mock_config, image_pool, count, concurrency, llm, work_root):
+    """运行一组参数，返回结果字典"""
+    work_dir = tempfile.mkdtemp(prefix=f"n{count}_c{concurrency}_", dir=work_root)
+    input_dir = os.path.join(work_dir, 'images')
+    output_dir = os.path.join(work_dir, 'videos')
+    os.makedirs(input_dir)
+    os.makedirs(output_dir)
+    for name in sorted(os.listdir(image_pool))[:count]:
+        shutil.copy(os.path.join(image_pool, name), input_dir)
+    
+    config = build_config(base_config, server.url, mock_config, concurrency, work_dir)
+    config_path = os.path.join(work_dir, 'config.yaml')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    
+    server.reset()
+    log_path = os.path.join(work_dir, 'stdout.log')
+    wall_seconds, returncode, peak_rss_mb = run_main(config_path, input_dir, output_dir, llm, log_path)
+    
+    with open(log_path, 'r', encoding='utf-8') as f:
+        output = f.read()
+    match = _ELAPSED_RE.search(output)
+    pipeline_seconds = float(match.group(1)) if match else wall_seconds
+    
+    summary_path = config['metrics']['summary_file']
+    summary = {}
+    if os.path.exists(summary_path):
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+    jobs, latency = summarize_metrics(summary)
+    succeeded = jobs.get('succeeded', 0)
+    
+    return {
+        'images': count,
+        'concurrency': concurrency,
+        'returncode': returncode,
+        'succeeded': succeeded,
+        'failed': jobs.get('failed', 0),
+        'wall_seconds': wall_seconds,
+        'pipeline_seconds': pipeline_seconds,
+        'images_per_hour': succeeded / pipeline_seconds * 3600 if pipeline_seconds else 0.0,
+        'peak_rss_mb': peak_rss_mb,
+        'latency': latency,
+        'mock': server.stats(),
+        'work_dir': work_dir,
+        'output_tail': output[-2000:] if returncode != 0 else None
+    }
+
+def print_result(result):
+    """输出一组结果的摘要"""
+    job_latency = result['latency'].get('job', {}).get('succeeded') or {}
+    request_parts = []
+    for endpoint, statuses in result['mock']['requests'].items():
+        errors = sum(count for status, count in statuses.items() if status not in ('200', '206'))
+        request_parts.append(f"{endpoint} {sum(statuses.values())}" + (f"（错误{errors}）" if errors else ''))
+    print(
+        f"图片 {result['images']:>4}，并发 {result['concurrency']:>3}: 成功{result['succeeded']}/失败{result['failed']}，"
+        f"用时 {result['pipeline_seconds']:7.2f}秒，吞吐量 {result['images_per_hour']:9.1f}张/小时，"
+        f"任务p50 {job_latency.get('p50') or 0:.2f}秒，p95 {job_latency.get('p95') or 0:.2f}秒，"
+        f"峰值内存 {result['peak_rss_mb']:.1f} MB"
+    )
+    print(f"    请求数: {'，'.join(request_parts)}")
+    if result['returncode'] != 0:
+        print(f"    main.py退出码{result['returncode']}，输出末尾:\n{result['output_tail']}")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='端到端流水线基准（本地模拟服务）')
+    parser.add_argument('--images', type=parse_int_list, default=[8, 32], help='图片数量，逗号分隔')
+    parser.add_argument('--concurrency', type=parse_int_list, default=[2, 8], help='并发度，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=1, help='每组参数的运行次数')
+    parser.add_argument('--llm', help='使用的LLM提供商名称，默认使用配置文件中的默认值')
+    parser.add_argument('--image-size', type=int, default=1600, help='测试图片宽度（像素）')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='作为基础的配置文件')
+    parser.add_argument('--json', default='bench_pipeline_results.json', help='结果JSON文件')
+    parser.add_argument('--keep', action='store_true', help='保留各次运行的临时目录（配置、日志、视频）')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    
+    with open(args.config, 'r', encoding='utf-8') as f:
+        base_config = yaml.safe_load(f)
+    mock_config = mock_config_from_args(args)
+    
+    work_root = tempfile.mkdtemp(prefix='bench_pipeline_')
+    server = MockServer(mock_config).start()
+    print(f"模拟服务: {server.url}，临时目录: {work_root}")
+    
+    results = []
+    try:
+        image_pool = os.path.join(work_root, 'image_pool')
+        make_images(image_pool, max(args.images), args.image_size)
+        
+        for count in args.images:
+            for concurrency in args.concurrency:
+                for _ in range(args.repeat):
+                    result = run_case(server, base_config, mock_config, image_pool, count, concurrency, args.llm, work_root)
+                    print_result(result)
+                    results.append(result)
+    finally:
+        server.stop()
+        if not args.keep:
+            shutil.rmtree(work_root, ignore_errors=True)
+            for result in results:
+                result['work_dir'] = None
+    
+    with open(args.json, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'llm': args.llm or base_config['llm'].get('default'),
+            'mock_config': mock_config,
+            'results': results
+        }, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.json}")
+    
+    if any(result['returncode'] != 0 for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
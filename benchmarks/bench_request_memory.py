@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM请求内存基准：对比由requests序列化JSON（json=payload）与流式请求体（StreamingJSONBody）
+发送大图片时，每个并发请求带来的峰值内存
+
+每种方式在独立的子进程中运行：先为每个并发请求准备一份图片数据，记录当前内存，
+再同时发出请求，用峰值内存减去发送前的内存，除以并发数得到每个请求的额外内存。
+请求发往本地模拟服务（见mock_servers.py），只测量客户端进程。
+
+用法:
+    python benchmarks/bench_request_memory.py --image-mb 8 --concurrency 1,8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+MODES = ('legacy', 'streaming')
+
+def _proc_status_mb(field):
+    """读取/proc/self/status中的内存字段（MB），不可用时返回None"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def current_rss_mb():
+    """当前常驻内存（MB），无法读取/proc时退回到峰值内存"""
+    rss = _proc_status_mb('VmRSS')
+    return peak_rss_mb() if rss is None else rss
+
+def peak_rss_mb():
+    """进程峰值内存（MB）"""
+    # Linux下ru_maxrss会继承fork时父进程的内存，exec后不会重置，优先使用VmHWM
+    peak = _proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    # macOS下ru_maxrss的单位为字节
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def run_worker(mode, url, image_mb, concurrency, provider):
+    """在当前进程中发出concurrency个并发请求，返回内存统计"""
+    from loguru import logger
+    from llm.llm_client import get_llm_client
+    from utils.image_utils import ImagePayload
+    
+    logger.remove()
+    claude = provider == 'claude'
+    client = get_llm_client({
+        'name': f"bench-{mode}",
+        'type': provider,
+        'endpoint': f"{url}/v1/messages" if claude else f"{url}/v1/chat/completions",
+        'api_key': 'bench',
+        'model': 'bench-model',
+        'stream_request_body': mode == 'streaming',
+        'http': {'pool_size': concurrency, 'retries': 0},
+        'rate_limit': {'rpm': 1000000, 'max_in_flight': concurrency}
+    })
+    
+    # 每个请求一份独立的图片数据（随机字节，与真实的JPEG一样不可压缩）
+    images = [ImagePayload(os.urandom(int(image_mb * 1024 * 1024)), 'image/jpeg', 4096, 3072) for _ in range(concurrency)]
+    # 预热连接和代码路径，避免首次请求的一次性开销计入
+    client._request_description(ImagePayload(b'\xff' * 1024, 'image/jpeg', 32, 32))
+    
+    baseline = current_rss_mb()
+    barrier = threading.Barrier(concurrency)
+    errors = []
+    
+    def send(image):
+        barrier.wait()
+        try:
+            client._request_description(image)
+        except Exception as e:
+            errors.append(str(e))
+    
+    threads = [threading.Thread(target=send, args=(image,)) for image in images]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    
+    peak = peak_rss_mb()
+    return {
+        'mode': mode,
+        'provider': provider,
+        'image_mb': image_mb,
+        'concurrency': concurrency,
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak,
+        'extra_mb_per_request': max(0.0, peak - baseline) / concurrency,
+        'seconds': elapsed,
+        'errors': errors
+    }
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='LLM请求内存基准')
+    parser.add_argument('--image-mb', type=float, default=8, help='每张图片的大小（MB）')
+    parser.add_argument('--concurrency', default='1,8', help='并发请求数，逗号分隔')
+    parser.add_argument('--provider', choices=['openai', 'claude'], default='openai', help='请求格式')
+    parser.add_argument('--json', help='将结果写入JSON文件')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    concurrency_levels = [int(value) for value in args.concurrency.split(',') if value.strip()]
+    
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.url, args.image_mb, concurrency_levels[0], args.provider)))
+        return
+    
+    from mock_servers import MockServer
+    
+    # 服务端收到请求后短暂延迟，保证并发请求的请求体同时在客户端内存中
+    server = MockServer({'endpoints': {'llm': {'latency': 0.2}}}).start()
+    results = []
+    try:
+        for concurrency in concurrency_levels:
+            for mode in MODES:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--worker', mode, '--url', server.url,
+                     '--image-mb', str(args.image_mb), '--concurrency', str(concurrency), '--provider', args.provider],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                results.append(result)
+                print(
+                    f"{mode:>9} x{concurrency:<3}: 发送前 {result['baseline_rss_mb']:7.1f} MB，峰值 {result['peak_rss_mb']:7.1f} MB，"
+                    f"每个请求额外 {result['extra_mb_per_request']:6.1f} MB（图片 {args.image_mb:g} MB），"
+                    f"用时 {result['seconds']:.2f}秒" + (f"，失败{len(result['errors'])}个" if result['errors'] else '')
+                )
+    finally:
+        server.stop()
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
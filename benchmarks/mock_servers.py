@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试用的本地模拟服务
+
+在一个端口上同时模拟OpenAI的/v1/chat/completions、Claude的/v1/messages
+和可灵的/v1/videos/text2video（创建、单个/列表查询）以及视频下载接口。
+创建任务时带有callback_url的，渲染结束后向该地址POST任务状态，模拟可灵的回调推送。
+各接口的响应延迟、失败率（500）、限流率（429）以及视频渲染时长均可配置，
+并按接口和状态码统计请求数，用于在不访问真实服务的情况下测量流水线的吞吐量。
+
+延迟和渲染时长的分布写法:
+    0.5                                  固定0.5秒
+    {"dist": "uniform", "min": 2, "max": 4}
+    {"dist": "lognormal", "median": 0.8, "sigma": 0.4}
+    {"dist": "exponential", "mean": 1.0}
+命令行中也可以写成 fixed:0.5、uniform:2,4、lognormal:0.8,0.4、exponential:1.0
+
+用法:
+    python benchmarks/mock_servers.py --port 18800 --llm-latency lognormal:0.8,0.4 --render-time uniform:2,4
+"""
+
+import re
+import math
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 默认模拟配置，endpoints中各接口的配置项：
+# latency为响应延迟分布，failure_rate为返回500的比例，rate_limit_rate为返回429的比例
+DEFAULT_MOCK_CONFIG = {
+    'endpoints': {
+        'llm': {'latency': {'dist': 'lognormal', 'median': 0.8, 'sigma': 0.4}, 'failure_rate': 0.0, 'rate_limit_rate': 0.0},
+        'kling_create': {'latency': 0.05, 'failure_rate': 0.0, 'rate_limit_rate': 0.0},
+        'kling_query': {'latency': 0.02, 'failure_rate': 0.0, 'rate_limit_rate': 0.0},
+        'video': {'latency': 0.01, 'failure_rate': 0.0, 'rate_limit_rate': 0.0}
+    },
+    'render_time': {'dist': 'uniform', 'min': 2, 'max': 4},  # 视频任务从创建到成功的时长
+    'render_failure_rate': 0.0,  # 渲染结果为failed的任务比例
+    'retry_after': 1,  # 429响应的Retry-After（秒）
+    'stream_chunks': 20,  # 流式响应拆分的事件数
+    'stream_interval': 0.01,  # 流式事件之间的间隔（秒）
+    'video_bytes': 1000000,  # 模拟视频文件大小
+    'post_callbacks': True,  # 是否向任务的callback_url推送渲染结果
+    'seed': None  # 随机数种子，便于复现
+}
+
+# 可灵的限流业务错误码
+KLING_RATE_LIMIT_CODE = 1302
+KLING_NOT_FOUND_CODE = 1201
+
+_LATENCY_RE = re.compile(r'^(fixed|uniform|lognormal|exponential):([\d.,]+)$')
+
+def parse_distribution(text):
+    """
+    解析命令行中的分布写法
+    
+    Args:
+        text: 如"0.5"、"uniform:2,4"、"lognormal:0.8,0.4"
+    
+    Returns:
+        分布配置（数值或字典）
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    
+    match = _LATENCY_RE.match(text.strip())
+    if not match:
+        raise ValueError(f"无法解析的分布: {text}")
+    dist = match.group(1)
+    values = [float(value) for value in match.group(2).split(',')]
+    names = {
+        'fixed': ['value'],
+        'uniform': ['min', 'max'],
+        'lognormal': ['median', 'sigma'],
+        'exponential': ['mean']
+    }[dist]
+    if len(values) != len(names):
+        raise ValueError(f"分布{dist}需要{len(names)}个参数: {text}")
+    return dict(zip(names, values), dist=dist)
+
+def sample(spec, rng):
+    """
+    按分布配置抽取一个样本（秒，不小于0）
+    
+    Args:
+        spec: 数值或分布字典
+        rng: random.Random实例
+    
+    Returns:
+        样本值
+    """
+    if spec is None:
+        return 0.0
+    if isinstance(spec, (int, float)):
+        return max(0.0, float(spec))
+    
+    dist = spec.get('dist', 'fixed')
+    if dist == 'fixed':
+        value = spec.get('value', 0)
+    elif dist == 'uniform':
+        value = rng.uniform(spec['min'], spec['max'])
+    elif dist == 'lognormal':
+        value = rng.lognormvariate(0, spec.get('sigma', 0.5)) * spec['median']
+    elif dist == 'exponential':
+        value = rng.expovariate(1 / spec['mean']) if spec['mean'] > 0 else 0
+    else:
+        raise ValueError(f"不支持的分布: {dist}")
+    return max(0.0, float(value))
+
+def expected(spec):
+    """分布的期望值（秒），用于设置预计渲染耗时等"""
+    if spec is None:
+        return 0.0
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    
+    dist = spec.get('dist', 'fixed')
+    if dist == 'uniform':
+        return (spec['min'] + spec['max']) / 2
+    if dist == 'lognormal':
+        return spec['median'] * math.exp(spec.get('sigma', 0.5) ** 2 / 2)
+    if dist == 'exponential':
+        return spec['mean']
+    return float(spec.get('value', 0))
+
+def merge_config(config):
+    """将模拟配置与默认配置合并（endpoints按接口逐项合并）"""
+    merged = dict(DEFAULT_MOCK_CONFIG, **{key: value for key, value in (config or {}).items() if key != 'endpoints'})
+    merged['endpoints'] = {
+        name: dict(defaults, **((config or {}).get('endpoints', {}).get(name) or {}))
+        for name, defaults in DEFAULT_MOCK_CONFIG['endpoints'].items()
+    }
+    return merged
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """模拟服务的请求处理器"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    @property
+    def mock(self):
+        return self.server.mock
+    
+    def _send_json(self, code, obj, headers=None):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw) if raw else {}
+    
+    def _simulate(self, endpoint):
+        """
+        模拟接口延迟，并按配置的比例返回429或500
+        
+        Returns:
+            已发送错误响应时返回True
+        """
+        mock = self.mock
+        config = mock.config['endpoints'][endpoint]
+        delay, roll = mock.draw(config['latency'])
+        if delay:
+            time.sleep(delay)
+        
+        if roll < config['rate_limit_rate']:
+            mock.count(endpoint, 429)
+            self._send_json(
+                429, {'code': KLING_RATE_LIMIT_CODE, 'message': 'rate limited', 'error': {'type': 'rate_limit_error'}},
+                headers={'Retry-After': str(mock.config['retry_after'])}
+            )
+            return True
+        if roll < config['rate_limit_rate'] + config['failure_rate']:
+            mock.count(endpoint, 500)
+            self._send_json(500, {'code': 5000, 'message': 'internal error', 'error': {'type': 'api_error'}})
+            return True
+        return False
+    
+    def do_POST(self):
+        path = urlparse(self.path).path
+        try:
+            body = self._read_body()
+        except ValueError:
+            return self._send_json(400, {'code': 1000, 'message': 'invalid json'})
+        
+        if path.endswith('/chat/completions') or path.endswith('/messages'):
+            if not self._simulate('llm'):
+                self._describe(body, claude=path.endswith('/messages'))
+        elif path == '/v1/videos/text2video':
+            if not self._simulate('kling_create'):
+                task = self.mock.create_task(body)
+                self.mock.count('kling_create', 200)
+                self._send_json(200, {'code': 0, 'data': {
+                    'task_id': task['task_id'], 'task_status': 'submitted', 'created_at': task['created_at']
+                }})
+        else:
+            self._send_json(404, {'code': 1000, 'message': 'not found'})
+    
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith('/videos/'):
+            if not self._simulate('video'):
+                self._send_video()
+        elif path == '/v1/videos/text2video':
+            if not self._simulate('kling_query'):
+                self.mock.count('kling_query', 200)
+                self._send_json(200, {'code': 0, 'data': self.mock.task_infos(self._base_url())})
+        elif path.startswith('/v1/videos/text2video/'):
+            if not self._simulate('kling_query'):
+                info = self.mock.task_info(path.rsplit('/', 1)[1], self._base_url())
+                if info is None:
+                    self.mock.count('kling_query', 404)
+                    return self._send_json(404, {'code': KLING_NOT_FOUND_CODE, 'message': 'task not found'})
+                self.mock.count('kling_query', 200)
+                self._send_json(200, {'code': 0, 'data': info})
+        else:
+            self._send_json(404, {'code': 1000, 'message': 'not found'})
+    
+    def _base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def _describe(self, body, claude):
+        """返回图片描述；一条消息中有多张图片或要求生成分镜列表时返回JSON数组"""
+        messages = body.get('messages') or []
+        content = messages[-1].get('content') if messages else ''
+        images = 0
+        shots = None
+        if isinstance(content, list):
+            images = sum(1 for part in content if isinstance(part, dict) and part.get('type') in ('image', 'image_url'))
+            for part in content:
+                match = re.search(r'拆分为(\d+)个镜头', part.get('text') or '') if isinstance(part, dict) else None
+                if match:
+                    shots = int(match.group(1))
+        
+        if shots:
+            texts = [f"镜头{index + 1}：主体缓缓转身，暖色侧光，镜头缓慢推进。" for index in range(shots)]
+            text = '```json\n' + json.dumps(texts, ensure_ascii=False) + '\n```'
+        elif images > 1:
+            texts = [f"第{index + 1}张图片的视频脚本：镜头缓缓推进，光影变化。" for index in range(images)]
+            text = '```json\n' + json.dumps(texts, ensure_ascii=False) + '\n```'
+        else:
+            text = "视频脚本：镜头缓缓推进，人物在光影中转身，背景音乐渐起。"
+        
+        self.mock.count('llm', 200)
+        if body.get('stream'):
+            return self._stream(text, claude)
+        if claude:
+            self._send_json(200, {'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn'})
+        else:
+            self._send_json(200, {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}}]})
+    
+    def _stream(self, text, claude):
+        """以SSE分块返回描述"""
+        chunks = max(1, self.mock.config['stream_chunks'])
+        step = max(1, -(-len(text) // chunks))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for start in range(0, len(text), step):
+                piece = text[start:start + step]
+                if claude:
+                    event = {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': piece}}
+                else:
+                    event = {'choices': [{'index': 0, 'delta': {'content': piece}}]}
+                self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+                time.sleep(self.mock.config['stream_interval'])
+            if claude:
+                self._write_chunk(b'event: message_stop\ndata: {"type": "message_stop"}\n\n')
+            else:
+                self._write_chunk(b'data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    
+    def _write_chunk(self, data):
+        self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        self.wfile.flush()
+    
+    def _send_video(self):
+        """返回模拟视频，支持单段Range请求"""
+        data = self.mock.video_data
+        total = len(data)
+        start, end = 0, total - 1
+        status = 200
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), total - 1) if match.group(2) else total - 1
+            status = 206
+        
+        self.mock.count('video', status, end - start + 1)
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"mock-video"')
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{total}")
+        self.end_headers()
+        try:
+            self.wfile.write(data[start:end + 1])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+class MockServer:
+    """
+    模拟LLM和可灵接口的本地HTTP服务
+    
+    所有接口共用一个端口，providers的endpoint指向http://127.0.0.1:<port>即可。
+    """
+    
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        """
+        初始化模拟服务
+        
+        Args:
+            config: 模拟配置字典，见DEFAULT_MOCK_CONFIG
+            host: 监听地址
+            port: 监听端口，为0时自动分配
+        """
+        self.config = merge_config(config)
+        self.rng = random.Random(self.config['seed'])
+        self.video_data = memoryview(bytes(range(256)) * (self.config['video_bytes'] // 256 + 1))[:self.config['video_bytes']]
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._external_ids = {}
+        self._counts = {}
+        self._bytes_sent = 0
+        
+        self.httpd = ThreadingHTTPServer((host, port), _MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self._thread = None
+    
+    @property
+    def url(self):
+        """服务地址"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-server', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止服务"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def draw(self, latency_spec):
+        """抽取一次延迟和一个[0, 1)的随机数（共享随机数生成器需加锁）"""
+        with self._lock:
+            return sample(latency_spec, self.rng), self.rng.random()
+    
+    def count(self, endpoint, status, sent_bytes=0):
+        """按接口和状态码统计请求数"""
+        with self._lock:
+            key = (endpoint, status)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._bytes_sent += sent_bytes
+    
+    def create_task(self, body):
+        """创建模拟视频任务，按配置抽取渲染时长和最终状态"""
+        now = time.time()
+        with self._lock:
+            render_time = sample(self.config['render_time'], self.rng)
+            failed = self.rng.random() < self.config['render_failure_rate']
+            task = {
+                'task_id': uuid.uuid4().hex,
+                'external_task_id': body.get('external_task_id'),
+                'created_at': int(now * 1000),
+                'done_at': now + render_time,
+                'failed': failed
+            }
+            self._tasks[task['task_id']] = task
+            if task['external_task_id']:
+                self._external_ids[task['external_task_id']] = task['task_id']
+        
+        if body.get('callback_url') and self.config['post_callbacks']:
+            timer = threading.Timer(render_time, self._post_callback, args=(task, body['callback_url']))
+            timer.daemon = True
+            timer.start()
+        return task
+    
+    def _post_callback(self, task, callback_url):
+        """渲染结束后向callback_url推送任务状态（与查询接口的data字段相同）"""
+        body = json.dumps(self._info(task, self.url), ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(callback_url, data=body, headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0  # 连接失败
+        self.count('callback', status)
+    
+    def _info(self, task, base_url):
+        now = time.time()
+        info = {
+            'task_id': task['task_id'],
+            'task_info': {'external_task_id': task['external_task_id']},
+            'created_at': task['created_at']
+        }
+        if now < task['done_at']:
+            info.update(task_status='processing', updated_at=int(now * 1000))
+        elif task['failed']:
+            info.update(task_status='failed', task_status_msg='mock render failure', updated_at=int(task['done_at'] * 1000))
+        else:
+            info.update(task_status='succeed', updated_at=int(task['done_at'] * 1000), task_result={'videos': [{
+                'id': task['task_id'],
+                'url': f"{base_url}/videos/{task['task_id']}.mp4",
+                'duration': '5'
+            }]})
+        return info
+    
+    def task_info(self, task_id, base_url):
+        """按任务ID或external_task_id查询任务，不存在时返回None"""
+        with self._lock:
+            task = self._tasks.get(task_id) or self._tasks.get(self._external_ids.get(task_id))
+        return self._info(task, base_url) if task else None
+    
+    def task_infos(self, base_url):
+        """任务列表（最新的在前）"""
+        with self._lock:
+            tasks = sorted(self._tasks.values(), key=lambda task: task['created_at'], reverse=True)
+        return [self._info(task, base_url) for task in tasks]
+    
+    def stats(self):
+        """
+        获取请求统计
+        
+        Returns:
+            字典：requests为{接口: {状态码: 请求数}}，tasks为创建的视频任务数，video_bytes_sent为视频下载发送的字节数
+        """
+        with self._lock:
+            requests_by_endpoint = {}
+            for (endpoint, status), count in sorted(self._counts.items()):
+                requests_by_endpoint.setdefault(endpoint, {})[str(status)] = count
+            return {
+                'requests': requests_by_endpoint,
+                'tasks': len(self._tasks),
+                'video_bytes_sent': self._bytes_sent
+            }
+    
+    def reset(self):
+        """清空任务和请求统计"""
+        with self._lock:
+            self._tasks.clear()
+            self._external_ids.clear()
+            self._counts.clear()
+            self._bytes_sent = 0
+
+def add_mock_arguments(parser):
+    """添加模拟服务的命令行参数"""
+    parser.add_argument('--mock-config', help='模拟服务配置JSON文件，见DEFAULT_MOCK_CONFIG')
+    parser.add_argument('--llm-latency', type=parse_distribution, help='LLM接口的延迟分布')
+    parser.add_argument('--kling-latency', type=parse_distribution, help='可灵创建/查询接口的延迟分布')
+    parser.add_argument('--render-time', type=parse_distribution, help='视频渲染时长分布')
+    parser.add_argument('--failure-rate', type=float, help='LLM和可灵接口返回500的比例')
+    parser.add_argument('--rate-limit-rate', type=float, help='LLM和可灵接口返回429的比例')
+    parser.add_argument('--video-bytes', type=int, help='模拟视频文件大小')
+    parser.add_argument('--seed', type=int, help='随机数种子')
+
+def mock_config_from_args(args):
+    """由命令行参数生成模拟配置"""
+    config = {}
+    if args.mock_config:
+        with open(args.mock_config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    config = merge_config(config)
+    
+    endpoints = config['endpoints']
+    if args.llm_latency is not None:
+        endpoints['llm']['latency'] = args.llm_latency
+    if args.kling_latency is not None:
+        endpoints['kling_create']['latency'] = args.kling_latency
+        endpoints['kling_query']['latency'] = args.kling_latency
+    for name in ('llm', 'kling_create', 'kling_query'):
+        if args.failure_rate is not None:
+            endpoints[name]['failure_rate'] = args.failure_rate
+        if args.rate_limit_rate is not None:
+            endpoints[name]['rate_limit_rate'] = args.rate_limit_rate
+    if args.render_time is not None:
+        config['render_time'] = args.render_time
+    if args.video_bytes is not None:
+        config['video_bytes'] = args.video_bytes
+    if args.seed is not None:
+        config['seed'] = args.seed
+    return config
+
+def main():
+    """主函数：单独运行模拟服务，按Ctrl+C停止并输出请求统计"""
+    parser = argparse.ArgumentParser(description='LLM和可灵接口的本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=18800, help='监听端口')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    
+    server = MockServer(mock_config_from_args(args), args.host, args.port)
+    print(f"模拟服务已启动: {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats(), ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import json
+import hashlib
+from loguru import logger
+from utils.disk_cache import DiskCache
+
+class DescriptionCache(DiskCache):
+    """
+    LLM描述缓存
+    
+    以处理后的图片字节哈希以及provider、model、system_prompt、max_tokens、temperature
+    作为键，重复处理同一张图片时直接返回之前生成的描述。
+    """
+    
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None, max_age=None, refresh=False):
+        """
+        初始化描述缓存
+        
+        Args:
+            cache_dir: 缓存目录
+            max_entries: 最多保存的条目数
+            max_bytes: 最多占用的字节数
+            max_age: 条目最长保存时间（秒）
+            refresh: 为True时不读取缓存，只写入新生成的描述
+        """
+        super().__init__(cache_dir, max_entries, max_bytes, max_age, name='描述缓存', refresh=refresh)
+    
+    @staticmethod
+    def make_key(client, payload, variant=None):
+        """
+        生成缓存键
+        
+        Args:
+            client: LLMClient实例
+            payload: ImagePayload对象
+            variant: 区分同一张图片不同请求内容的字典（如分镜列表的镜头数），为None时为普通描述
+            
+        Returns:
+            十六进制的SHA-256字符串
+        """
+        key_data = {
+            'image': payload.sha256,
+            'provider': client.name,
+            'model': client.model,
+            'system_prompt': client.system_prompt,
+            'max_tokens': client.max_tokens,
+            'temperature': client.temperature
+        }
+        # 流式接收时描述会在长度上限处截断，上限不同的描述不能共用
+        if client.stream and client.max_description_chars:
+            key_data['max_description_chars'] = client.max_description_chars
+        if variant is not None:
+            key_data['variant'] = variant
+        raw = json.dumps(key_data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+    
+    def get_description(self, key):
+        """
+        读取缓存的描述
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            描述文本，未命中时返回None
+        """
+        meta = self.get(key)
+        if meta is None:
+            logger.info(f"描述缓存未命中: {key[:12]}")
+            return None
+        
+        logger.info(f"描述缓存命中: {key[:12]}")
+        return meta.get('description')
+    
+    def put_description(self, key, description, client):
+        """
+        写入描述
+        
+        Args:
+            key: 缓存键
+            description: 描述文本
+            client: 生成描述的LLMClient实例
+        """
+        try:
+            self.put(key, {
+                'description': description,
+                'provider': client.name,
+                'model': client.model
+            })
+        except Exception as e:
+            # 缓存写入失败不影响主流程
+            logger.warning(f"写入描述缓存失败: {e}")
+
+def create_description_cache(cache_config, refresh=False):
+    """
+    根据配置创建描述缓存
+    
+    Args:
+        cache_config: 描述缓存配置字典（enabled、dir、max_entries、max_bytes、max_age_days）
+        refresh: 是否忽略已有缓存
+        
+    Returns:
+        DescriptionCache实例，未启用时返回None
+    """
+    if not cache_config.get('enabled', True):
+        return None
+    
+    max_age_days = cache_config.get('max_age_days')
+    return DescriptionCache(
+        cache_config.get('dir', 'cache/descriptions'),
+        max_entries=cache_config.get('max_entries'),
+        max_bytes=cache_config.get('max_bytes'),
+        max_age=max_age_days * 86400 if max_age_days else None,
+        refresh=refresh
+    )
@@ -0,0 +1,256 @@
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError, wait
+from loguru import logger
+from utils.tracing import get_tracer
+from .llm_client import RequestCancelledError
+from .description_cache import DescriptionCache
+
+# 对冲请求的默认配置
+DEFAULT_HEDGE_CONFIG = {
+    'percentile': 95,  # 按主提供商最近延迟的该百分位数决定何时发出备用请求
+    'initial_delay': 10,  # 延迟样本不足时的等待时间（秒）
+    'min_delay': 1,
+    'max_delay': 60,
+    'window': 200,  # 参与统计的最近延迟样本数
+    'min_samples': 20,  # 样本数达到该值后才按百分位数计算
+    'max_workers': 32
+}
+
+class HedgedLLMClient:
+    """
+    对冲请求的LLM客户端
+    
+    先向主提供商发送请求，超过延迟阈值仍未返回时，用同一个已编码的图片
+    向备用提供商发送请求，取先成功返回的结果并放弃另一个请求。
+    延迟阈值取主提供商最近请求延迟的百分位数，因此只有长尾请求才会触发对冲。
+    
+    对外提供与LLMClient相同的generate_description接口，可直接用于流水线。
+    """
+    
+    def __init__(self, primary, backup, hedge_config=None):
+        """
+        初始化对冲客户端
+        
+        Args:
+            primary: 主提供商的LLMClient实例
+            backup: 备用提供商的LLMClient实例
+            hedge_config: 对冲配置字典（percentile、initial_delay、min_delay、max_delay、
+                window、min_samples、max_workers）
+        """
+        cfg = dict(DEFAULT_HEDGE_CONFIG)
+        cfg.update(hedge_config or {})
+        
+        self.primary = primary
+        self.backup = backup
+        self.name = f"{primary.name}+{backup.name}"
+        self.model = primary.model
+        self.percentile = cfg['percentile']
+        self.initial_delay = cfg['initial_delay']
+        self.min_delay = cfg['min_delay']
+        self.max_delay = cfg['max_delay']
+        self.min_samples = cfg['min_samples']
+        
+        self._latencies = deque(maxlen=cfg['window'])
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=cfg['max_workers'], thread_name_prefix="llm-hedge")
+        self.stats = {'requests': 0, 'hedged': 0, 'backup_wins': 0, 'saved_seconds': 0.0}
+        
+        logger.info(f"启用对冲请求: 主提供商{primary.name}，备用提供商{backup.name}，延迟阈值取P{self.percentile}")
+    
+    @property
+    def description_cache(self):
+        """描述缓存（与主、备用客户端共用）"""
+        return self.primary.description_cache
+    
+    @description_cache.setter
+    def description_cache(self, cache):
+        self.primary.description_cache = cache
+        self.backup.description_cache = cache
+    
+    @property
+    def max_description_chars(self):
+        """描述的最大长度（字符）"""
+        return self.primary.max_description_chars
+    
+    @max_description_chars.setter
+    def max_description_chars(self, value):
+        self.primary.max_description_chars = value
+        self.backup.max_description_chars = value
+    
+    def hedge_delay(self):
+        """
+        计算发出备用请求前的等待时间
+        
+        Returns:
+            等待时间（秒）
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+        
+        if len(samples) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+            delay = samples[index]
+        return min(self.max_delay, max(self.min_delay, delay))
+    
+    def generate_description(self, image):
+        """
+        根据图片生成描述，主、备用提供商的缓存都未命中时发送对冲请求
+        
+        Args:
+            image: ImagePayload对象或图片文件路径
+        
+        Returns:
+            生成的描述文本
+        """
+        with get_tracer().span('llm.generate_description', **{'llm.provider': self.primary.name, 'llm.backup': self.backup.name}):
+            payload_image = self.primary._prepare_image(image)
+            
+            cache = self.description_cache
+            if cache is not None:
+                for client in (self.primary, self.backup):
+                    description = cache.get_description(DescriptionCache.make_key(client, payload_image))
+                    if description is not None:
+                        return description
+            
+            winner, description = self._race(payload_image)
+            
+            if cache is not None:
+                cache.put_description(DescriptionCache.make_key(winner, payload_image), description, winner)
+            return description
+    
+    def generate_shot_list(self, image, count, shot_seconds):
+        """
+        根据图片生成长视频的分镜列表（不发送对冲请求，主提供商失败时改用备用提供商）
+        
+        Args:
+            image: ImagePayload对象或图片文件路径
+            count: 镜头数
+            shot_seconds: 每个镜头的时长（秒）
+        
+        Returns:
+            镜头描述列表
+        """
+        payload_image = self.primary._prepare_image(image)
+        try:
+            return self.primary.generate_shot_list(payload_image, count, shot_seconds)
+        except Exception as e:
+            logger.warning(f"主提供商{self.primary.name}生成分镜列表失败，改用备用提供商{self.backup.name}: {e}")
+            return self.backup.generate_shot_list(payload_image, count, shot_seconds)
+    
+    def _call(self, client, image, cancel_event):
+        """
+        在工作线程中调用单个提供商
+        
+        参与竞争的请求总是以流式接收（不论提供商的stream配置），cancel_event被设置后
+        在下一个事件处中止并关闭连接，落败的请求不会一直占用提供商的并发名额。
+        """
+        client._call_state.cancel_event = cancel_event
+        client._call_state.options = {'stream': True}
+        try:
+            return client._request_description(image)
+        finally:
+            client._call_state.cancel_event = None
+            client._call_state.options = None
+    
+    def _race(self, image):
+        """
+        发送对冲请求（工作线程中沿用当前的追踪上下文，请求span记在调用方的span下）
+        
+        Returns:
+            (胜出的LLMClient实例, 描述文本)
+        """
+        start_time = time.time()
+        delay = self.hedge_delay()
+        
+        # 备用提供商胜出的时间，主提供商之后返回时用于计算节省的时间
+        race = {'backup_won_after': None}
+        primary_cancel = threading.Event()
+        primary_future = self._executor.submit(contextvars.copy_context().run, self._call, self.primary, image, primary_cancel)
+        primary_future.add_done_callback(lambda f: self._record_primary(f, start_time, race))
+        
+        with self._lock:
+            self.stats['requests'] += 1
+        
+        try:
+            # 主提供商在阈值内返回（或失败）时不发送备用请求
+            return self.primary, primary_future.result(timeout=delay)
+        except TimeoutError:
+            pass
+        except Exception as e:
+            logger.warning(f"主提供商{self.primary.name}请求失败，改用备用提供商{self.backup.name}: {e}")
+            return self.backup, self.backup._request_description(image)
+        
+        logger.info(f"主提供商{self.primary.name}超过{delay:.1f}秒未返回，向备用提供商{self.backup.name}发送对冲请求")
+        backup_cancel = threading.Event()
+        backup_future = self._executor.submit(contextvars.copy_context().run, self._call, self.backup, image, backup_cancel)
+        with self._lock:
+            self.stats['hedged'] += 1
+        
+        contenders = {
+            primary_future: (self.primary, primary_cancel),
+            backup_future: (self.backup, backup_cancel)
+        }
+        pending = set(contenders)
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                client, _ = contenders[future]
+                try:
+                    description = future.result()
+                except Exception as e:
+                    logger.warning(f"对冲请求中{client.name}失败: {e}")
+                    last_error = e
+                    continue
+                
+                # 放弃另一个请求：在下一个流式事件处中止并释放并发名额
+                for other in pending:
+                    other_client, other_cancel = contenders[other]
+                    other_cancel.set()
+                    logger.debug(f"放弃{other_client.name}的请求")
+                
+                elapsed = time.time() - start_time
+                if client is self.backup:
+                    race['backup_won_after'] = elapsed
+                    with self._lock:
+                        self.stats['backup_wins'] += 1
+                    logger.info(f"对冲请求由备用提供商{client.name}胜出，用时{elapsed:.2f}秒，主提供商{self.primary.name}此时仍未返回")
+                else:
+                    logger.info(f"对冲请求由主提供商{client.name}胜出，用时{elapsed:.2f}秒")
+                return client, description
+        
+        raise last_error
+    
+    def _record_primary(self, future, start_time, race):
+        """记录主提供商的请求延迟，主提供商落败后返回时统计对冲节省的时间"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None and not isinstance(error, RequestCancelledError):
+            return
+        
+        # 被放弃的请求只知道延迟不低于放弃时的用时，仍计入样本，避免阈值被低估
+        latency = time.time() - start_time
+        with self._lock:
+            self._latencies.append(latency)
+        
+        backup_won_after = race['backup_won_after']
+        if error is None and backup_won_after is not None:
+            saved = latency - backup_won_after
+            with self._lock:
+                self.stats['saved_seconds'] += saved
+            logger.info(f"主提供商{self.primary.name}在{latency:.2f}秒后返回，对冲请求节省{saved:.2f}秒")
+    
+    def log_stats(self):
+        """输出对冲请求统计"""
+        with self._lock:
+            stats = dict(self.stats)
+        logger.info(
+            f"对冲请求统计: 请求{stats['requests']}次，发出备用请求{stats['hedged']}次，"
+            f"备用提供商胜出{stats['backup_wins']}次，可统计的节省时间共{stats['saved_seconds']:.2f}秒"
+        )
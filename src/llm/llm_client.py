@@ -1,13 +1,47 @@
-import requests
+import os
 import json
-import base64
+import time
+import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from loguru import logger
-from .openai_compatible_client import OpenAICompatibleClient
+from utils.http_client import get_session
+from utils.provider_registry import load_provider_class
+from utils.rate_limiter import get_governor
+from utils.metrics import get_metrics
+from utils.tracing import get_tracer, SPAN_KIND_CLIENT
+from utils.streaming_body import Base64Data, StreamingJSONBody
+from .description_cache import DescriptionCache
+
+# 生成单条描述时的指令
+DESCRIBE_INSTRUCTION = "请根据这张图片生成一段视频脚本或旁白。"
+
+# 长视频模式下生成分镜列表的指令，每个镜头单独渲染后按顺序拼接
+SHOT_LIST_INSTRUCTION = (
+    "请根据这张图片创作一段约{duration}秒的连贯视频，拆分为{count}个镜头，每个镜头时长{seconds}秒。"
+    "只输出一个JSON数组，按播放顺序包含{count}个字符串，每个字符串是对应镜头的画面描述"
+    "（主体、动作、场景、光线和运镜），可以单独用于生成该镜头，不要输出其他内容。"
+)
+
+# 批量生成描述时的指令，要求按图片顺序返回JSON字符串数组
+BATCH_INSTRUCTION = (
+    "下面依次给出{count}张图片，请分别为每张图片生成一段视频脚本或旁白。"
+    "只输出一个JSON数组，按图片顺序包含{count}个字符串，每个字符串是对应图片的脚本，不要输出其他内容。"
+)
+
+# 截断描述时优先使用的句子结尾标点
+SENTENCE_END_MARKS = ('。', '！', '？', '.', '!', '?', '\n')
+
+class RequestCancelledError(RuntimeError):
+    """请求在完成前被调用方取消（如对冲请求中另一个提供商已先返回）"""
+    pass
 
 class LLMClient(ABC):
     """LLM客户端抽象基类"""
     
+    # 是否支持在一次请求中为多张图片生成描述（为True的子类需实现_generate_batch_descriptions）
+    supports_batch = False
+    
     def __init__(self, config):
         """
         初始化LLM客户端
@@ -23,17 +57,420 @@ class LLMClient(ABC):
         self.max_tokens = config.get('max_tokens', 1000)
         self.temperature = config.get('temperature', 0.7)
         self.system_prompt = config.get('system_prompt', '')
+        # 是否以SSE流式接收描述
+        self.stream = config.get('stream', False)
+        # 描述的最大长度（字符），流式接收时达到该长度即停止；
+        # 未配置时由流水线设置为视频模型可用的prompt长度
+        self.max_description_chars = config.get('max_description_chars')
+        # 批量生成描述时每次请求打包的图片数，为1或客户端不支持打包（supports_batch为False）时不打包
+        self.batch_size = max(1, int(config.get('batch_size', 1)))
+        # 发送请求时分块编码图片并流式写出请求体，不在内存中生成完整的base64字符串和JSON
+        self.stream_request_body = config.get('stream_request_body', True)
+        # 描述缓存，由get_llm_client设置
+        self.description_cache = None
+        # 按提供商共享的连接池
+        self.session = get_session(self.name, config.get('http'))
+        # 按提供商共享的限流器
+        self.governor = get_governor(self.name, config.get('rate_limit'))
+        # 每个调用线程的状态，cancel_event被设置后流式请求提前结束，options覆盖本次请求的指令等参数
+        self._call_state = threading.local()
         
         if not self.endpoint or not self.api_key:
             raise ValueError(f"LLM配置不完整: endpoint={self.endpoint}, api_key={'已设置' if self.api_key else '未设置'}")
     
+    def _prepare_image(self, image):
+        """
+        获取发送给LLM的图片数据
+        
+        Args:
+            image: ImagePayload对象，或图片文件路径（按默认配置加载、缩放并编码）
+            
+        Returns:
+            ImagePayload对象
+        """
+        if isinstance(image, (str, os.PathLike)):
+            # 按需导入，已有编码数据时不需要加载PIL
+            from utils.image_utils import prepare_image_payload
+            return prepare_image_payload(image)
+        return image
+    
+    def _request_options(self):
+        """
+        本次请求使用的指令、max_tokens、描述长度上限和是否流式接收（生成分镜列表、对冲请求等调用会临时覆盖）
+        
+        Returns:
+            字典：instruction、max_tokens、max_description_chars、stream
+        """
+        options = {
+            'instruction': DESCRIBE_INSTRUCTION,
+            'max_tokens': self.max_tokens,
+            'max_description_chars': self.max_description_chars,
+            'stream': self.stream
+        }
+        options.update(getattr(self._call_state, 'options', None) or {})
+        return options
+    
+    def _image_base64(self, image):
+        """请求体中的base64图片数据（流式请求体时为Base64Data，发送时才分块编码）"""
+        if self.stream_request_body:
+            return Base64Data(image.data)
+        return image.base64
+    
+    def _image_data_url(self, image):
+        """请求体中data URL格式的图片（流式请求体时为Base64Data）"""
+        if self.stream_request_body:
+            return Base64Data(image.data, prefix=f"data:{image.media_type};base64,")
+        return image.data_url
+    
+    def _body_kwargs(self, payload):
+        """请求体参数：流式请求体或由requests序列化的JSON"""
+        if self.stream_request_body:
+            return {'data': StreamingJSONBody(payload)}
+        return {'json': payload}
+    
+    def _post(self, headers, payload):
+        """
+        在限流控制下向endpoint发送请求，被限流时按Retry-After等待后重试
+        
+        Args:
+            headers: 请求头字典（需包含Content-Type: application/json）
+            payload: 请求体字典，图片数据可以是Base64Data
+            
+        Returns:
+            requests.Response对象
+        """
+        body = self._body_kwargs(payload)
+        response = self.governor.send(lambda: self.session.post(self.endpoint, headers=headers, **body))
+        get_tracer().set_attributes(**{'http.status_code': response.status_code})
+        return response
+    
+    @contextmanager
+    def _post_stream(self, headers, payload):
+        """
+        在限流控制下发送流式请求，响应体在with块内由_read_stream逐段读取
+        
+        读取响应体期间一直占用并发名额，退出with块时关闭连接并释放名额。
+        
+        Args:
+            headers: 请求头字典
+            payload: 请求体字典（需已包含stream字段）
+            
+        Yields:
+            requests.Response对象
+        """
+        body = self._body_kwargs(payload)
+        with self.governor.stream(lambda: self.session.post(self.endpoint, headers=headers, stream=True, **body)) as response:
+            get_tracer().set_attributes(**{'http.status_code': response.status_code})
+            yield response
+    
+    @staticmethod
+    def _iter_sse_events(response):
+        """
+        逐个解析SSE响应中的data事件
+        
+        Args:
+            response: 以stream=True发送请求得到的requests.Response对象
+            
+        Yields:
+            每个data事件解析后的JSON对象
+        """
+        # 按字节分行后再解码：SSE响应通常不声明charset，且多字节字符可能跨块
+        for line in response.iter_lines(chunk_size=1024):
+            if not line or not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip().decode('utf-8')
+            if data == '[DONE]':
+                return
+            try:
+                yield json.loads(data)
+            except ValueError:
+                logger.warning(f"无法解析的流式事件: {data[:200]}")
+    
+    def _read_stream(self, response, extract_delta):
+        """
+        读取流式响应并拼接描述，记录首字延迟和生成速度
+        
+        描述达到max_description_chars后立即关闭连接，不再等待剩余的输出。
+        
+        Args:
+            response: 以stream=True发送请求得到的requests.Response对象
+            extract_delta: 从单个事件中提取(增量文本, 输出token数)的函数，
+                token数未知时为None
+            
+        Returns:
+            生成的描述文本
+        """
+        start_time = time.time()
+        first_token_at = None
+        parts = []
+        length = 0
+        chunks = 0
+        output_tokens = None
+        truncated = False
+        cancel_event = getattr(self._call_state, 'cancel_event', None)
+        max_chars = self._request_options()['max_description_chars']
+        
+        try:
+            for event in self._iter_sse_events(response):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelledError(f"{self.name}的请求已取消")
+                text, tokens = extract_delta(event)
+                if tokens is not None:
+                    output_tokens = tokens
+                if not text:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                parts.append(text)
+                length += len(text)
+                chunks += 1
+                if max_chars and length >= max_chars:
+                    truncated = True
+                    break
+        finally:
+            # 提前结束时连接上还有未读完的数据，关闭后不会放回连接池
+            response.close()
+        
+        description = ''.join(parts)
+        if truncated:
+            description = truncate_description(description, max_chars)
+        
+        end_time = time.time()
+        if first_token_at is None:
+            logger.warning(f"{self.name}流式响应中没有文本")
+        else:
+            get_metrics().histogram('image_to_video_llm_ttft_seconds', "LLM流式响应的首字延迟（秒）").observe(
+                first_token_at - start_time, provider=self.name, model=self.model
+            )
+            get_tracer().set_attributes(**{'llm.ttft_seconds': first_token_at - start_time, 'llm.stream_chunks': chunks})
+            tokens = output_tokens or chunks
+            generation_seconds = max(end_time - first_token_at, 1e-6)
+            logger.info(
+                f"{self.name}流式生成完成，首字延迟: {first_token_at - start_time:.2f}秒，"
+                f"速度: {tokens / generation_seconds:.1f} tokens/秒，总用时: {end_time - start_time:.2f}秒"
+                + (f"，达到{max_chars}字符上限后提前结束" if truncated else "")
+            )
+        return description
+    
+    def generate_description(self, image):
+        """
+        根据图片生成描述，启用描述缓存时优先从缓存读取
+        
+        Args:
+            image: ImagePayload对象或图片文件路径
+            
+        Returns:
+            生成的描述文本
+        """
+        with get_tracer().span('llm.generate_description', **{'llm.provider': self.name, 'llm.model': self.model}) as span:
+            payload_image = self._prepare_image(image)
+            
+            if self.description_cache is None:
+                return self._request_description(payload_image)
+            
+            key = DescriptionCache.make_key(self, payload_image)
+            description = self.description_cache.get_description(key)
+            span.set_attributes(**{'cache.hit': description is not None})
+            if description is not None:
+                return description
+            
+            description = self._request_description(payload_image)
+            self.description_cache.put_description(key, description, self)
+            return description
+    
+    def generate_descriptions(self, images, return_exceptions=False):
+        """
+        批量生成描述：缓存未命中的图片每batch_size张打包为一次请求，
+        解析失败时改为逐张请求
+        
+        Args:
+            images: ImagePayload对象或图片文件路径的列表
+            return_exceptions: 为True时单张图片失败不抛出，结果中对应位置为异常对象
+            
+        Returns:
+            与images顺序一致的描述文本列表
+        """
+        payload_images = [self._prepare_image(image) for image in images]
+        results = [None] * len(payload_images)
+        keys = [None] * len(payload_images)
+        missing = []
+        
+        for i, payload_image in enumerate(payload_images):
+            if self.description_cache is not None:
+                keys[i] = DescriptionCache.make_key(self, payload_image)
+                results[i] = self.description_cache.get_description(keys[i])
+            if results[i] is None:
+                missing.append(i)
+        
+        batch_size = self.batch_size if self.supports_batch else 1
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            descriptions = self._describe_chunk([payload_images[i] for i in chunk])
+            for i, description in zip(chunk, descriptions):
+                results[i] = description
+                if self.description_cache is not None and not isinstance(description, Exception):
+                    self.description_cache.put_description(keys[i], description, self)
+        
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+    
+    def generate_shot_list(self, image, count, shot_seconds):
+        """
+        根据图片生成长视频的分镜列表，启用描述缓存时优先从缓存读取
+        
+        每个镜头的描述不超过max_description_chars，可以单独提交渲染。
+        
+        Args:
+            image: ImagePayload对象或图片文件路径
+            count: 镜头数
+            shot_seconds: 每个镜头的时长（秒）
+            
+        Returns:
+            按播放顺序排列的镜头描述列表（LLM给出的镜头数可能少于count）
+        """
+        with get_tracer().span('llm.generate_shot_list', **{
+            'llm.provider': self.name,
+            'llm.model': self.model,
+            'video.shots': count
+        }) as span:
+            payload_image = self._prepare_image(image)
+            
+            key = None
+            if self.description_cache is not None:
+                key = DescriptionCache.make_key(self, payload_image, variant={
+                    'shots': count,
+                    'shot_seconds': shot_seconds,
+                    'max_shot_chars': self.max_description_chars
+                })
+                cached = self.description_cache.get_description(key)
+                span.set_attributes(**{'cache.hit': cached is not None})
+                if cached is not None:
+                    return json.loads(cached)
+            
+            # 回复是一个JSON数组，流式接收时不能在描述长度上限处截断，改为逐个截断镜头描述
+            self._call_state.options = {
+                'instruction': SHOT_LIST_INSTRUCTION.format(duration=count * shot_seconds, count=count, seconds=shot_seconds),
+                'max_tokens': self.max_tokens * count,
+                'max_description_chars': None
+            }
+            try:
+                text = self._request_description(payload_image)
+            finally:
+                self._call_state.options = None
+            
+            shots = parse_shot_list(text, count)
+            if self.max_description_chars:
+                shots = [truncate_description(shot, self.max_description_chars) for shot in shots]
+            logger.info(f"{self.name}生成{len(shots)}个镜头的分镜列表")
+            
+            if key is not None:
+                self.description_cache.put_description(key, json.dumps(shots, ensure_ascii=False), self)
+            return shots
+    
+    def _describe_chunk(self, images):
+        """
+        为一组图片生成描述，多张图片时先尝试打包为一次请求
+        
+        Args:
+            images: ImagePayload对象列表
+            
+        Returns:
+            描述文本列表，逐张请求失败的位置为异常对象
+        """
+        if len(images) > 1 and self.supports_batch:
+            start_time = time.time()
+            try:
+                with get_tracer().span('llm.request', kind=SPAN_KIND_CLIENT, **{
+                    'llm.provider': self.name,
+                    'llm.model': self.model,
+                    'llm.mode': 'batch',
+                    'llm.images': len(images)
+                }):
+                    descriptions = self._generate_batch_descriptions(images)
+            except Exception as e:
+                self._record_request('batch', 'error', time.time() - start_time)
+                logger.warning(f"{self.name}批量生成描述失败，改为逐张生成: {e}")
+            else:
+                elapsed = time.time() - start_time
+                self._record_request('batch', 'ok', elapsed)
+                logger.info(f"{self.name}批量生成{len(images)}条描述，用时: {elapsed:.2f}秒")
+                return descriptions
+        
+        descriptions = []
+        for image in images:
+            try:
+                descriptions.append(self._request_description(image))
+            except Exception as e:
+                descriptions.append(e)
+        return descriptions
+    
+    def _request_description(self, image):
+        """
+        调用提供商生成一条描述，并记录请求耗时指标
+        
+        Args:
+            image: ImagePayload对象
+            
+        Returns:
+            生成的描述文本
+        """
+        start_time = time.time()
+        status = 'error'
+        try:
+            with get_tracer().span('llm.request', kind=SPAN_KIND_CLIENT, **{
+                'llm.provider': self.name,
+                'llm.model': self.model,
+                'llm.mode': 'single',
+                'llm.stream': self._request_options()['stream']
+            }) as span:
+                description = self._generate_description(image)
+                span.set_attributes(**{'llm.description_chars': len(description)})
+            status = 'ok'
+            return description
+        except RequestCancelledError:
+            status = 'cancelled'
+            raise
+        finally:
+            self._record_request('single', status, time.time() - start_time)
+    
+    def _record_request(self, mode, status, seconds):
+        """记录一次LLM请求的耗时和结果（mode为single或batch）"""
+        metrics = get_metrics()
+        labels = {'provider': self.name, 'model': self.model, 'mode': mode, 'status': status}
+        metrics.histogram('image_to_video_llm_request_seconds', "LLM请求耗时（秒）").observe(seconds, **labels)
+        metrics.counter('image_to_video_llm_requests_total', "LLM请求次数").inc(**labels)
+    
+    def _batch_content(self, images, image_part):
+        """
+        构建批量请求的用户消息内容：指令后依次为每张图片的编号和图片
+        
+        Args:
+            images: ImagePayload对象列表
+            image_part: 将ImagePayload转换为消息中图片部分的函数
+            
+        Returns:
+            消息内容列表
+        """
+        content = [{"type": "text", "text": BATCH_INSTRUCTION.format(count=len(images))}]
+        for i, image in enumerate(images, 1):
+            content.append({"type": "text", "text": f"图片{i}:"})
+            content.append(image_part(image))
+        return content
+    
+    def log_stats(self):
+        """输出客户端的运行统计（默认没有）"""
+        pass
+    
     @abstractmethod
-    def generate_description(self, image_path):
+    def _generate_description(self, image):
         """
-        根据图片生成描述
+        调用LLM根据图片生成描述
         
         Args:
-            image_path: 图片文件路径
+            image: ImagePayload对象
             
         Returns:
             生成的描述文本
@@ -43,23 +480,22 @@ class LLMClient(ABC):
 class OpenAIClient(LLMClient):
     """OpenAI API客户端"""
     
-    def generate_description(self, image_path):
+    supports_batch = True
+    
+    def _generate_description(self, image):
         """
         使用OpenAI API根据图片生成描述
         
         Args:
-            image_path: 图片文件路径
+            image: ImagePayload对象
             
         Returns:
             生成的描述文本
         """
         logger.info(f"使用{self.name}生成图片描述")
+        options = self._request_options()
         
         try:
-            # 读取并编码图片
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-            
             headers = {
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {self.api_key}"
@@ -77,22 +513,30 @@ class OpenAIClient(LLMClient):
                         "content": [
                             {
                                 "type": "text",
-                                "text": "请根据这张图片生成一段视频脚本或旁白。"
+                                "text": options['instruction']
                             },
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": self._image_data_url(image)
                                 }
                             }
                         ]
                     }
                 ],
-                "max_tokens": self.max_tokens,
+                "max_tokens": options['max_tokens'],
                 "temperature": self.temperature
             }
             
-            response = requests.post(self.endpoint, headers=headers, json=payload)
+            if options['stream']:
+                payload["stream"] = True
+                with self._post_stream(headers, payload) as response:
+                    response.raise_for_status()
+                    description = self._read_stream(response, self._stream_delta)
+                logger.info(f"成功生成描述，长度: {len(description)}")
+                return description
+            
+            response = self._post(headers, payload)
             response.raise_for_status()
             
             result = response.json()
@@ -101,30 +545,83 @@ class OpenAIClient(LLMClient):
             logger.info(f"成功生成描述，长度: {len(description)}")
             return description
             
+        except RequestCancelledError:
+            raise
         except Exception as e:
             logger.error(f"生成描述失败: {e}")
             raise
+    
+    def _generate_batch_descriptions(self, images):
+        """
+        使用OpenAI API在一次请求中为多张图片生成描述
+        
+        Args:
+            images: ImagePayload对象列表
+            
+        Returns:
+            与images顺序一致的描述文本列表
+        """
+        logger.info(f"使用{self.name}批量生成{len(images)}张图片的描述")
+        
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": self.system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": self._batch_content(
+                        images,
+                        lambda image: {"type": "image_url", "image_url": {"url": self._image_data_url(image)}}
+                    )
+                }
+            ],
+            "max_tokens": self.max_tokens * len(images),
+            "temperature": self.temperature
+        }
+        
+        response = self._post(headers, payload)
+        response.raise_for_status()
+        
+        result = response.json()
+        return parse_batch_descriptions(result['choices'][0]['message']['content'], len(images))
+    
+    @staticmethod
+    def _stream_delta(event):
+        """从chat completions流式事件中提取增量文本"""
+        if 'error' in event:
+            raise RuntimeError(f"流式响应出错: {event['error']}")
+        choices = event.get('choices') or []
+        text = (choices[0].get('delta') or {}).get('content') if choices else None
+        tokens = (event.get('usage') or {}).get('completion_tokens')
+        return text, tokens
 
 class ClaudeClient(LLMClient):
     """Anthropic Claude API客户端"""
     
-    def generate_description(self, image_path):
+    supports_batch = True
+    
+    def _generate_description(self, image):
         """
         使用Claude API根据图片生成描述
         
         Args:
-            image_path: 图片文件路径
+            image: ImagePayload对象
             
         Returns:
             生成的描述文本
         """
         logger.info(f"使用{self.name}生成图片描述")
+        options = self._request_options()
         
         try:
-            # 读取并编码图片
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-            
             headers = {
                 "Content-Type": "application/json",
                 "x-api-key": self.api_key,
@@ -140,24 +637,32 @@ class ClaudeClient(LLMClient):
                         "content": [
                             {
                                 "type": "text",
-                                "text": "请根据这张图片生成一段视频脚本或旁白。"
+                                "text": options['instruction']
                             },
                             {
                                 "type": "image",
                                 "source": {
                                     "type": "base64",
-                                    "media_type": "image/jpeg",
-                                    "data": base64_image
+                                    "media_type": image.media_type,
+                                    "data": self._image_base64(image)
                                 }
                             }
                         ]
                     }
                 ],
-                "max_tokens": self.max_tokens,
+                "max_tokens": options['max_tokens'],
                 "temperature": self.temperature
             }
             
-            response = requests.post(self.endpoint, headers=headers, json=payload)
+            if options['stream']:
+                payload["stream"] = True
+                with self._post_stream(headers, payload) as response:
+                    response.raise_for_status()
+                    description = self._read_stream(response, self._stream_delta)
+                logger.info(f"成功生成描述，长度: {len(description)}")
+                return description
+            
+            response = self._post(headers, payload)
             response.raise_for_status()
             
             result = response.json()
@@ -166,28 +671,175 @@ class ClaudeClient(LLMClient):
             logger.info(f"成功生成描述，长度: {len(description)}")
             return description
             
+        except RequestCancelledError:
+            raise
         except Exception as e:
             logger.error(f"生成描述失败: {e}")
             raise
+    
+    def _generate_batch_descriptions(self, images):
+        """
+        使用Claude API在一次请求中为多张图片生成描述
+        
+        Args:
+            images: ImagePayload对象列表
+            
+        Returns:
+            与images顺序一致的描述文本列表
+        """
+        logger.info(f"使用{self.name}批量生成{len(images)}张图片的描述")
+        
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01"
+        }
+        
+        payload = {
+            "model": self.model,
+            "system": self.system_prompt,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": self._batch_content(
+                        images,
+                        lambda image: {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": image.media_type,
+                                "data": self._image_base64(image)
+                            }
+                        }
+                    )
+                }
+            ],
+            "max_tokens": self.max_tokens * len(images),
+            "temperature": self.temperature
+        }
+        
+        response = self._post(headers, payload)
+        response.raise_for_status()
+        
+        result = response.json()
+        return parse_batch_descriptions(result['content'][0]['text'], len(images))
+    
+    @staticmethod
+    def _stream_delta(event):
+        """从Messages API流式事件中提取增量文本"""
+        event_type = event.get('type')
+        if event_type == 'error':
+            raise RuntimeError(f"流式响应出错: {event.get('error')}")
+        if event_type == 'content_block_delta':
+            return (event.get('delta') or {}).get('text'), None
+        if event_type == 'message_delta':
+            return None, (event.get('usage') or {}).get('output_tokens')
+        return None, None
+
+def parse_batch_descriptions(text, count):
+    """
+    从批量请求的回复中解析每张图片的描述
+    
+    Args:
+        text: LLM回复文本，应为JSON字符串数组（允许包含在代码块中）
+        count: 图片数量
+        
+    Returns:
+        描述文本列表
+    """
+    start = text.find('[')
+    end = text.rfind(']')
+    if start < 0 or end < start:
+        raise ValueError("批量回复中没有JSON数组")
+    
+    items = json.loads(text[start:end + 1])
+    if not isinstance(items, list) or len(items) != count:
+        raise ValueError(f"批量回复的描述数量不符: 期望{count}条，实际{len(items) if isinstance(items, list) else 0}条")
+    
+    descriptions = []
+    for item in items:
+        if isinstance(item, dict):
+            item = item.get('description') or item.get('script')
+        if not isinstance(item, str) or not item.strip():
+            raise ValueError("批量回复中包含空的描述")
+        descriptions.append(item.strip())
+    return descriptions
+
+def parse_shot_list(text, max_count):
+    """
+    从回复中解析分镜列表
+    
+    Args:
+        text: LLM回复文本，应为JSON字符串数组（允许包含在代码块中，元素也可以是带prompt或description字段的对象）
+        max_count: 最多保留的镜头数
+        
+    Returns:
+        镜头描述列表
+    """
+    start = text.find('[')
+    end = text.rfind(']')
+    if start < 0 or end < start:
+        raise ValueError("分镜回复中没有JSON数组")
+    
+    items = json.loads(text[start:end + 1])
+    if not isinstance(items, list) or not items:
+        raise ValueError("分镜回复中没有镜头")
+    if len(items) > max_count:
+        logger.warning(f"分镜回复包含{len(items)}个镜头，只保留前{max_count}个")
+        items = items[:max_count]
+    
+    shots = []
+    for item in items:
+        if isinstance(item, dict):
+            item = item.get('prompt') or item.get('description')
+        if not isinstance(item, str) or not item.strip():
+            raise ValueError("分镜回复中包含空的镜头描述")
+        shots.append(item.strip())
+    return shots
 
-def get_llm_client(config):
+def truncate_description(description, max_chars):
+    """
+    将描述截断到max_chars以内，尽量在句子结尾处截断
+    
+    Args:
+        description: 描述文本
+        max_chars: 最大长度（字符）
+        
+    Returns:
+        截断后的描述文本
+    """
+    if len(description) <= max_chars:
+        return description
+    
+    cut = description[:max_chars]
+    end = max(cut.rfind(mark) for mark in SENTENCE_END_MARKS)
+    # 句子结尾太靠前时直接按长度截断，避免丢掉过多内容
+    if end >= max_chars // 2:
+        cut = cut[:end + 1]
+    return cut.rstrip()
+
+def get_llm_client(config, description_cache=None, backup_config=None, hedge_config=None):
     """
     根据配置创建LLM客户端
     
     Args:
         config: LLM配置字典
+        description_cache: DescriptionCache实例，为None时不使用缓存
+        backup_config: 备用LLM配置字典，提供时创建对冲请求客户端
+        hedge_config: 对冲配置字典
         
     Returns:
-        LLMClient实例
+        LLMClient实例，提供backup_config时为HedgedLLMClient实例
     """
-    name = config.get('name', '').lower()
-    
-    if 'compatible' in name or 'openai-api-compatible' in name:
-        return OpenAICompatibleClient(config)
-    elif 'openai' in name:
-        return OpenAIClient(config)
-    elif 'claude' in name or 'anthropic' in name:
-        return ClaudeClient(config)
-    else:
-        logger.error(f"不支持的LLM类型: {name}")
-        raise ValueError(f"不支持的LLM类型: {name}")
+    if backup_config is not None:
+        from .hedged_client import HedgedLLMClient
+        client = HedgedLLMClient(get_llm_client(config), get_llm_client(backup_config), hedge_config)
+        client.description_cache = description_cache
+        return client
+    
+    # 按配置中的type（或name）从注册表加载，只导入被选中的提供商模块
+    client_class = load_provider_class('llm', config)
+    client = client_class(config)
+    
+    client.description_cache = description_cache
+    return client
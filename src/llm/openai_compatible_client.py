@@ -1,8 +1,6 @@
-import requests
 import json
-import base64
 from loguru import logger
-from .llm_client import LLMClient
+from .llm_client import LLMClient, RequestCancelledError, parse_batch_descriptions
 
 class OpenAICompatibleClient(LLMClient):
     """兼容OpenAI API格式的LLM客户端，可用于调用任何兼容OpenAI API的服务"""
@@ -18,40 +16,49 @@ class OpenAICompatibleClient(LLMClient):
         # 额外的配置项
         self.image_format = config.get('image_format', 'base64')  # 图片格式：base64或url
         self.vision_api = config.get('vision_api', True)  # 是否支持视觉API
+        # 不支持图片输入时打包没有意义
+        self.supports_batch = self.vision_api
         self.api_version = config.get('api_version', '')  # API版本，某些兼容服务需要
         self.organization = config.get('organization', '')  # 组织ID，某些服务需要
         
         logger.info(f"初始化兼容OpenAI API的LLM客户端: {self.name}")
     
-    def generate_description(self, image_path):
+    def _build_headers(self):
+        """构建请求头"""
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        # 添加认证信息
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        
+        # 添加组织ID（如果有）
+        if self.organization:
+            headers["OpenAI-Organization"] = self.organization
+        
+        # 添加API版本（如果有）
+        if self.api_version:
+            headers["OpenAI-Version"] = self.api_version
+        
+        return headers
+    
+    def _generate_description(self, image):
         """
         使用兼容OpenAI API的服务根据图片生成描述
         
         Args:
-            image_path: 图片文件路径
+            image: ImagePayload对象
             
         Returns:
             生成的描述文本
         """
         logger.info(f"使用{self.name}生成图片描述")
+        options = self._request_options()
         
         try:
             # 构建请求头
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            # 添加认证信息
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-            
-            # 添加组织ID（如果有）
-            if self.organization:
-                headers["OpenAI-Organization"] = self.organization
-            
-            # 添加API版本（如果有）
-            if self.api_version:
-                headers["OpenAI-Version"] = self.api_version
+            headers = self._build_headers()
             
             # 构建消息内容
             messages = [
@@ -63,22 +70,18 @@ class OpenAICompatibleClient(LLMClient):
             
             # 根据是否支持视觉API构建不同的用户消息
             if self.vision_api:
-                # 读取并编码图片
-                with open(image_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                
                 # 构建支持视觉的消息格式
                 user_message = {
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": "请根据这张图片生成一段视频脚本或旁白。"
+                            "text": options['instruction']
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": self._image_data_url(image)
                             }
                         }
                     ]
@@ -97,12 +100,20 @@ class OpenAICompatibleClient(LLMClient):
             payload = {
                 "model": self.model,
                 "messages": messages,
-                "max_tokens": self.max_tokens,
+                "max_tokens": options['max_tokens'],
                 "temperature": self.temperature
             }
             
+            if options['stream']:
+                payload["stream"] = True
+                with self._post_stream(headers, payload) as response:
+                    response.raise_for_status()
+                    description = self._read_stream(response, self._stream_delta)
+                logger.info(f"成功生成描述，长度: {len(description)}")
+                return description
+            
             # 发送请求
-            response = requests.post(self.endpoint, headers=headers, json=payload)
+            response = self._post(headers, payload)
             response.raise_for_status()
             
             # 解析响应
@@ -126,6 +137,65 @@ class OpenAICompatibleClient(LLMClient):
             logger.info(f"成功生成描述，长度: {len(description)}")
             return description
             
+        except RequestCancelledError:
+            raise
         except Exception as e:
             logger.error(f"生成描述失败: {e}")
             raise
+    
+    def _generate_batch_descriptions(self, images):
+        """
+        使用兼容OpenAI API的服务在一次请求中为多张图片生成描述
+        
+        Args:
+            images: ImagePayload对象列表
+            
+        Returns:
+            与images顺序一致的描述文本列表
+        """
+        logger.info(f"使用{self.name}批量生成{len(images)}张图片的描述")
+        
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": self.system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": self._batch_content(
+                        images,
+                        lambda image: {"type": "image_url", "image_url": {"url": self._image_data_url(image)}}
+                    )
+                }
+            ],
+            "max_tokens": self.max_tokens * len(images),
+            "temperature": self.temperature
+        }
+        
+        response = self._post(self._build_headers(), payload)
+        response.raise_for_status()
+        
+        result = response.json()
+        if 'choices' in result and len(result['choices']) > 0:
+            choice = result['choices'][0]
+            text = choice['message']['content'] if 'message' in choice else choice.get('text', '')
+        else:
+            text = result.get('response', '')
+        return parse_batch_descriptions(text, len(images))
+    
+    @staticmethod
+    def _stream_delta(event):
+        """从流式事件中提取增量文本，兼容chat和completions两种格式"""
+        if 'error' in event:
+            raise RuntimeError(f"流式响应出错: {event['error']}")
+        tokens = (event.get('usage') or {}).get('completion_tokens')
+        choices = event.get('choices') or []
+        if choices:
+            choice = choices[0]
+            text = (choice.get('delta') or {}).get('content')
+            if text is None:
+                text = choice.get('text')
+            return text, tokens
+        return event.get('response'), tokens
@@ -0,0 +1,102 @@
+from loguru import logger
+from utils.provider_router import ProviderRouter
+from utils.tracing import get_tracer
+from .llm_client import RequestCancelledError
+from .description_cache import DescriptionCache
+
+class RoutedLLMClient:
+    """
+    按优先级和健康状况在多个LLM提供商之间切换的客户端
+    
+    每次请求依次尝试优先级列表中未熔断的提供商，失败时自动换下一个。
+    对外提供与LLMClient相同的generate_description接口，可直接用于流水线。
+    """
+    
+    def __init__(self, clients, breaker_config=None):
+        """
+        初始化路由客户端
+        
+        Args:
+            clients: 按优先级排列的LLMClient实例列表
+            breaker_config: 熔断器配置字典
+        """
+        self.clients = {client.name: client for client in clients}
+        self.router = ProviderRouter("LLM", list(self.clients), breaker_config)
+        self.primary = clients[0]
+        self.name = self.primary.name
+        self.model = self.primary.model
+        
+        logger.info(f"启用LLM提供商路由，优先级: {' > '.join(self.clients)}")
+    
+    @property
+    def description_cache(self):
+        """描述缓存（所有提供商共用）"""
+        return self.primary.description_cache
+    
+    @description_cache.setter
+    def description_cache(self, cache):
+        for client in self.clients.values():
+            client.description_cache = cache
+    
+    @property
+    def max_description_chars(self):
+        """描述的最大长度（字符）"""
+        return self.primary.max_description_chars
+    
+    @max_description_chars.setter
+    def max_description_chars(self, value):
+        for client in self.clients.values():
+            client.max_description_chars = value
+    
+    def generate_description(self, image):
+        """
+        根据图片生成描述，各提供商的缓存都未命中时按优先级请求健康的提供商
+        
+        Args:
+            image: ImagePayload对象或图片文件路径
+        
+        Returns:
+            生成的描述文本
+        """
+        with get_tracer().span('llm.generate_description', **{'llm.providers': ','.join(self.clients)}):
+            payload_image = self.primary._prepare_image(image)
+            
+            cache = self.description_cache
+            if cache is not None:
+                for client in self.clients.values():
+                    description = cache.get_description(DescriptionCache.make_key(client, payload_image))
+                    if description is not None:
+                        return description
+            
+            name, description = self.router.call(
+                lambda name: self.clients[name]._request_description(payload_image),
+                neutral_errors=(RequestCancelledError,)
+            )
+            
+            if cache is not None:
+                client = self.clients[name]
+                cache.put_description(DescriptionCache.make_key(client, payload_image), description, client)
+            return description
+    
+    def generate_shot_list(self, image, count, shot_seconds):
+        """
+        根据图片生成长视频的分镜列表，按优先级请求健康的提供商
+        
+        Args:
+            image: ImagePayload对象或图片文件路径
+            count: 镜头数
+            shot_seconds: 每个镜头的时长（秒）
+        
+        Returns:
+            镜头描述列表
+        """
+        payload_image = self.primary._prepare_image(image)
+        _, shots = self.router.call(
+            lambda name: self.clients[name].generate_shot_list(payload_image, count, shot_seconds),
+            neutral_errors=(RequestCancelledError,)
+        )
+        return shots
+    
+    def log_stats(self):
+        """输出各提供商的健康状况"""
+        self.router.log_stats()
@@ -10,20 +10,34 @@ from loguru import logger
 
 from utils.config import Config
 from utils.logger import setup_logger
-from utils.image_utils import load_image, resize_image
-from llm.llm_client import get_llm_client
-from video.video_generator import get_video_generator
+from utils.metrics import configure_metrics
+from utils.tracing import configure_tracing
+
+# 客户端、缓存和流水线模块（及其依赖的requests、PIL等）在用到时才导入，
+# 列出提供商、查看帮助等命令只需加载配置和日志模块
 
 def parse_args():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description='图片转视频生成器')
     parser.add_argument('--image', '-i', help='输入图片路径')
     parser.add_argument('--output', '-o', help='输出视频路径')
+    parser.add_argument('--input-dir', help='批处理模式：处理目录中的所有图片')
+    parser.add_argument('--manifest', help='批处理模式：从清单文件读取图片列表（每行一个路径或JSON对象）')
+    parser.add_argument('--output-dir', help='批处理模式：输出视频目录，默认为图片所在目录')
     parser.add_argument('--llm', help='使用的LLM提供商名称')
     parser.add_argument('--video-model', help='使用的视频生成模型提供商名称')
     parser.add_argument('--config', '-c', help='配置文件路径')
-    parser.add_argument('--save-description', '-s', help='保存生成的描述文本到文件')
+    parser.add_argument('--save-description', '-s', help='保存生成的描述文本到文件（批处理模式下为目录，文件名为输出视频名加输出路径的短哈希）')
     parser.add_argument('--list-providers', '-l', action='store_true', help='列出所有可用的提供商')
+    parser.add_argument('--no-cache', action='store_true', help='不使用描述缓存和视频缓存')
+    parser.add_argument('--refresh', action='store_true', help='忽略已缓存的描述和视频以及任务日志中的进度，重新生成并更新缓存')
+    parser.add_argument('--no-journal', action='store_true', help='不记录任务日志（中断后无法续跑）')
+    parser.add_argument('--priority', help='批处理模式：任务的优先级（见配置文件中的pipeline.scheduler.classes）')
+    parser.add_argument('--tenant', help='批处理模式：任务所属的租户')
+    parser.add_argument('--long-form', action='store_true', help='长视频模式：生成分镜列表，各镜头同时渲染后拼接为一个视频')
+    parser.add_argument('--duration', type=float, help='长视频模式的目标时长（秒），默认使用配置文件中的long_form.duration')
+    parser.add_argument('--serve', action='store_true', help='服务模式：常驻进程，通过本地HTTP接口提交任务')
+    parser.add_argument('--port', type=int, help='服务模式的监听端口，默认使用配置文件中的serve.port')
     return parser.parse_args()
 
 def get_default_image():
@@ -61,6 +75,242 @@ def get_default_image():
     logger.info(f"使用默认图片: {selected_image}")
     return selected_image
 
+def get_routed_providers(routing_config, preferred):
+    """
+    获取启用路由时按优先级排列的提供商名称列表
+    
+    Args:
+        routing_config: 路由配置字典
+        preferred: 命令行指定的提供商名称，指定时排在最前
+        
+    Returns:
+        提供商名称列表，未启用路由或只有一个提供商时返回None
+    """
+    if not routing_config.get('enabled'):
+        return None
+    
+    providers = list(routing_config.get('providers') or [])
+    if preferred:
+        providers = [preferred] + [name for name in providers if name != preferred]
+    return providers if len(providers) > 1 else None
+
+def create_llm_client(args, config, llm_config):
+    """
+    创建LLM客户端，并按命令行参数配置描述缓存；
+    启用提供商路由时创建RoutedLLMClient，启用对冲请求时同时创建备用提供商的客户端
+    
+    Args:
+        args: 命令行参数
+        config: Config实例
+        llm_config: LLM配置字典
+        
+    Returns:
+        LLMClient实例
+    """
+    from llm.llm_client import get_llm_client
+    from llm.routed_client import RoutedLLMClient
+    from llm.description_cache import create_description_cache
+    
+    description_cache = None
+    if not args.no_cache:
+        description_cache = create_description_cache(config.get_cache_config('description'), refresh=args.refresh)
+    
+    routing_config = config.get_routing_config('llm')
+    providers = get_routed_providers(routing_config, args.llm)
+    if providers:
+        if config.get_llm_hedge_config().get('enabled'):
+            logger.warning("已启用LLM提供商路由，不再使用对冲请求")
+        clients = [get_llm_client(config.get_llm_config(name)) for name in providers]
+        client = RoutedLLMClient(clients, routing_config['circuit_breaker'])
+        client.description_cache = description_cache
+        return client
+    
+    hedge_config = config.get_llm_hedge_config()
+    backup_config = None
+    if hedge_config.get('enabled') and hedge_config.get('backup'):
+        backup_config = config.get_llm_config(hedge_config['backup'])
+        if backup_config is llm_config:
+            logger.warning(f"备用提供商与主提供商相同，不启用对冲请求: {llm_config['name']}")
+            backup_config = None
+    
+    return get_llm_client(llm_config, description_cache, backup_config, hedge_config)
+
+def create_video_generator(args, config, video_config):
+    """
+    创建视频生成器，并按命令行参数配置视频缓存；启用提供商路由时创建RoutedVideoGenerator，
+    长视频模式下再包装为LongFormVideoGenerator
+    
+    Args:
+        args: 命令行参数
+        config: Config实例
+        video_config: 视频生成模型配置字典
+        
+    Returns:
+        视频生成器实例
+    """
+    from video.video_generator import get_video_generator
+    from video.video_cache import create_video_cache
+    from video.routed_generator import RoutedVideoGenerator
+    
+    video_cache = None
+    if not args.no_cache:
+        video_cache = create_video_cache(config.get_cache_config('video'), refresh=args.refresh)
+    
+    routing_config = config.get_routing_config('video_generator')
+    providers = get_routed_providers(routing_config, args.video_model)
+    if providers:
+        generators = [get_video_generator(config.get_video_generator_config(name)) for name in providers]
+        generator = RoutedVideoGenerator(generators, routing_config['circuit_breaker'])
+        generator.video_cache = video_cache
+    else:
+        generator = get_video_generator(video_config, video_cache)
+    
+    long_form_config = dict(config.get_long_form_config())
+    if args.duration is not None:
+        long_form_config['duration'] = args.duration
+    if args.long_form or long_form_config.get('enabled'):
+        from video.long_form import LongFormVideoGenerator
+        generator = LongFormVideoGenerator(generator, long_form_config)
+    return generator
+
+def create_pipeline(args, config, llm_client, video_generator, description_dir=None):
+    """
+    创建流水线，并按命令行参数配置任务日志
+    
+    Args:
+        args: 命令行参数
+        config: Config实例
+        llm_client: LLMClient实例
+        video_generator: 视频生成器实例
+        description_dir: 保存描述文本的目录
+        
+    Returns:
+        BatchPipeline实例
+    """
+    from utils.job_journal import create_job_journal
+    from pipeline.batch_pipeline import BatchPipeline
+    
+    journal = None
+    if not args.no_journal:
+        journal = create_job_journal(config.get_journal_config())
+    
+    return BatchPipeline(
+        llm_client,
+        video_generator,
+        config.get_pipeline_config(),
+        description_dir=description_dir,
+        image_config=config.get_image_config(),
+        journal=journal,
+        refresh=args.refresh
+    )
+
+def log_run_stats(llm_client, video_generator):
+    """输出缓存命中、对冲请求、提供商健康状况和连接复用统计以及各阶段的耗时指标，并写出追踪数据"""
+    from utils.http_client import log_connection_stats
+    from utils.metrics import get_metrics
+    from utils.tracing import get_tracer
+    
+    llm_client.log_stats()
+    video_generator.log_stats()
+    if llm_client.description_cache is not None:
+        llm_client.description_cache.log_stats()
+    if video_generator.video_cache is not None:
+        video_generator.video_cache.log_stats()
+    log_connection_stats()
+    
+    metrics = get_metrics()
+    metrics.log_summary()
+    metrics.write_files()
+    get_tracer().flush()
+
+def run_batch(args, config):
+    """
+    批处理模式：通过重叠执行的流水线处理多张图片
+    
+    Args:
+        args: 命令行参数
+        config: Config实例
+    """
+    from pipeline.batch_pipeline import load_jobs_from_dir, load_jobs_from_manifest
+    
+    if args.input_dir:
+        if not os.path.isdir(args.input_dir):
+            logger.error(f"输入目录不存在: {args.input_dir}")
+            print(f"错误: 输入目录不存在: {args.input_dir}")
+            return
+        jobs = load_jobs_from_dir(args.input_dir, args.output_dir, args.priority, args.tenant)
+    else:
+        if not os.path.exists(args.manifest):
+            logger.error(f"清单文件不存在: {args.manifest}")
+            print(f"错误: 清单文件不存在: {args.manifest}")
+            return
+        jobs = load_jobs_from_manifest(args.manifest, args.output_dir, args.priority, args.tenant)
+    
+    if not jobs:
+        logger.warning("没有需要处理的图片")
+        print("错误: 没有找到需要处理的图片")
+        return
+    
+    llm_config = config.get_llm_config(args.llm)
+    video_config = config.get_video_generator_config(args.video_model)
+    
+    llm_client = create_llm_client(args, config, llm_config)
+    video_generator = create_video_generator(args, config, video_config)
+    
+    pipeline = create_pipeline(args, config, llm_client, video_generator, description_dir=args.save_description)
+    summary = pipeline.run(jobs)
+    log_run_stats(llm_client, video_generator)
+    
+    print(f"\n批处理完成: 共{summary['total']}张，成功{summary['succeeded']}张，失败{summary['failed']}张")
+    for failure in summary['failures']:
+        print(f"  失败: {failure['image']} (阶段: {failure['stage']}) - {failure['error']}")
+    print(f"总用时: {summary['elapsed']:.2f}秒，吞吐量: {summary['images_per_hour']:.1f}张/小时")
+    if pipeline.deduper is not None:
+        print(f"近似图片复用描述: {summary['llm_calls_saved']}张，节省{summary['llm_calls_saved']}次LLM请求")
+
+def check_serve_port(args, config, port):
+    """
+    检查服务模式的监听端口是否与使用中的视频生成模型的回调服务器端口冲突
+    
+    Args:
+        args: 命令行参数
+        config: Config实例
+        port: 服务模式的监听端口
+    """
+    if not port:
+        return
+    providers = get_routed_providers(config.get_routing_config('video_generator'), args.video_model) or [args.video_model]
+    for name in providers:
+        callback_config = config.get_video_generator_config(name).get('callback') or {}
+        if callback_config.get('enabled') and int(callback_config.get('port') or 0) == int(port):
+            raise ValueError(
+                f"服务模式端口{port}与视频生成模型的回调服务器端口相同，"
+                f"请修改serve.port（或使用--port）或callback.port"
+            )
+
+def run_server(args, config):
+    """
+    服务模式：创建一次客户端和流水线，通过HTTP接口持续接收任务
+    
+    Args:
+        args: 命令行参数
+        config: Config实例
+    """
+    from pipeline.job_server import JobServer, DEFAULT_SERVE_CONFIG
+    
+    serve_config = dict(DEFAULT_SERVE_CONFIG, **config.get_serve_config())
+    if args.port is not None:
+        serve_config['port'] = args.port
+    check_serve_port(args, config, serve_config['port'])
+    
+    llm_client = create_llm_client(args, config, config.get_llm_config(args.llm))
+    video_generator = create_video_generator(args, config, config.get_video_generator_config(args.video_model))
+    pipeline = create_pipeline(args, config, llm_client, video_generator, description_dir=args.save_description)
+    
+    server = JobServer(pipeline, serve_config)
+    server.serve_forever()
+    log_run_stats(llm_client, video_generator)
+
 def main():
     """主函数"""
     # 解析命令行参数
@@ -71,6 +321,8 @@ def main():
     
     # 设置日志
     setup_logger(config.get_logging_config())
+    configure_metrics(config.get_metrics_config())
+    configure_tracing(config.get_tracing_config())
     
     # 如果只是列出提供商，则显示后退出
     if args.list_providers:
@@ -87,6 +339,16 @@ def main():
         
         return
     
+    # 服务模式
+    if args.serve:
+        run_server(args, config)
+        return
+    
+    # 批处理模式
+    if args.input_dir or args.manifest:
+        run_batch(args, config)
+        return
+    
     # 检查输入图片
     if not args.image:
         # 如果未指定输入图片，则使用默认图片
@@ -115,39 +377,30 @@ def main():
     # 获取视频生成模型配置
     video_config = config.get_video_generator_config(args.video_model)
     
-    try:
-        # 步骤1: 加载并处理图片
-        logger.info(f"正在处理图片: {args.image}")
-        image = load_image(args.image)
-        image = resize_image(image)
-        
-        # 步骤2: 使用LLM生成描述
-        logger.info(f"使用{llm_config['name']}生成描述")
-        llm_client = get_llm_client(llm_config)
-        start_time = time.time()
-        description = llm_client.generate_description(args.image)
-        end_time = time.time()
-        logger.info(f"描述生成完成，用时: {end_time - start_time:.2f}秒")
-        
-        # 如果需要，保存描述文本
-        if args.save_description:
-            with open(args.save_description, 'w', encoding='utf-8') as f:
-                f.write(description)
-            logger.info(f"描述已保存到: {args.save_description}")
-        
-        # 步骤3: 使用视频生成模型生成视频
-        logger.info(f"使用{video_config['name']}生成视频")
-        video_generator = get_video_generator(video_config)
-        start_time = time.time()
-        output_path = video_generator.generate_video(description, args.output)
-        end_time = time.time()
-        logger.info(f"视频生成完成，用时: {end_time - start_time:.2f}秒")
-        
-        logger.info(f"处理完成！视频已保存到: {output_path}")
-        
-    except Exception as e:
-        logger.error(f"处理过程中出错: {e}")
-        raise
+    from pipeline.batch_pipeline import BatchJob
+    
+    llm_client = create_llm_client(args, config, llm_config)
+    video_generator = create_video_generator(args, config, video_config)
+    pipeline = create_pipeline(args, config, llm_client, video_generator)
+    
+    # 依次执行：加载并处理图片、使用LLM生成描述、使用视频生成模型生成视频
+    logger.info(f"正在处理图片: {args.image}，使用{llm_config['name']}生成描述，使用{video_config['name']}生成视频")
+    start_time = time.time()
+    job = pipeline.process(BatchJob(0, args.image, args.output))
+    end_time = time.time()
+    log_run_stats(llm_client, video_generator)
+    
+    # 如果需要，保存描述文本
+    if args.save_description and job.description is not None:
+        with open(args.save_description, 'w', encoding='utf-8') as f:
+            f.write(job.description)
+        logger.info(f"描述已保存到: {args.save_description}")
+    
+    if job.error is not None:
+        logger.error(f"处理过程中出错: {job.error}")
+        raise job.error
+    
+    logger.info(f"处理完成！视频已保存到: {args.output}，总用时: {end_time - start_time:.2f}秒")
 
 if __name__ == "__main__":
     main()
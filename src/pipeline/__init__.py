@@ -0,0 +1 @@
+# 批处理流水线模块
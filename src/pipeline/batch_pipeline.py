@@ -0,0 +1,897 @@
+import os
+import json
+import hashlib
+import time
+import queue
+import threading
+from loguru import logger
+
+from utils.image_utils import ImagePreprocessor, prepare_image_payload, list_image_files
+from utils import job_journal
+from utils.job_journal import JobJournal
+from utils.metrics import get_metrics, DEFAULT_BYTES_BUCKETS
+from utils.tracing import get_tracer
+from video.task_poller import TaskFailedError
+from video.long_form import format_shot_list
+from .job_scheduler import JobScheduler, STOP as _STOP
+from .dedupe import DescriptionDeduper, DEFAULT_DEDUPE_CONFIG
+
+# 各阶段默认并发数
+DEFAULT_STAGE_WORKERS = {
+    'load': 2,
+    'describe': 4,
+    'render': 8,
+    'download': 2
+}
+
+class BatchJob:
+    """批处理中的单张图片任务"""
+    
+    def __init__(self, index, image_path, output_path, priority=None, tenant=None):
+        """
+        初始化批处理任务
+        
+        Args:
+            index: 任务序号
+            image_path: 输入图片路径
+            output_path: 输出视频路径
+            priority: 优先级名称，为None时使用调度配置中的默认级别
+            tenant: 租户名称，为None时使用默认租户
+        """
+        self.index = index
+        self.image_path = image_path
+        self.output_path = output_path
+        self.priority = priority
+        self.tenant = tenant
+        self.image = None
+        self.description = None
+        self.task = None
+        self.render_result = None
+        self.cached_video = None
+        self.job_id = None
+        self.record = None  # 任务日志中的记录，用于断点续跑
+        self.resumed = False  # 是否从任务日志中恢复为已完成
+        self.stage = None
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        self.queued_at = None  # 进入当前所在队列的时间，用于统计排队耗时
+        self.span = None  # 任务的根span，提交时创建，结束时导出
+        self.finished = threading.Event()  # 任务结束（成功或失败）时置位
+    
+    @property
+    def succeeded(self):
+        """任务是否成功完成"""
+        return self.error is None and self.end_time is not None
+    
+    @property
+    def elapsed(self):
+        """任务从进入流水线到结束的用时（秒）"""
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+    
+    @property
+    def trace_id(self):
+        """任务的trace ID，提交前为None"""
+        return self.span.trace_id if self.span is not None else None
+
+class BatchPipeline:
+    """
+    图片转视频批处理流水线
+    
+    将加载/缩放、生成描述、提交并等待视频渲染、下载视频拆分为独立阶段，
+    阶段之间通过有界队列连接，每个阶段有独立的并发数，
+    从而让第N+1张图片的LLM调用与第N张图片的视频渲染重叠进行。
+    """
+    
+    STAGES = ['load', 'describe', 'render', 'download']
+    
+    def __init__(self, llm_client, video_generator, config=None, description_dir=None, image_config=None, journal=None, refresh=False):
+        """
+        初始化批处理流水线
+        
+        Args:
+            llm_client: LLMClient实例
+            video_generator: 视频生成器实例，需提供submit_task/wait_for_task/download_video
+            config: 流水线配置字典（queue_size、workers、describe_batch_wait、scheduler）
+            description_dir: 保存描述文本的目录，为None时不保存
+            image_config: 图片处理配置字典
+            journal: JobJournal实例，为None时不记录任务日志（无法断点续跑）
+            refresh: 为True时重置任务日志中的记录，所有任务从头重新生成
+        """
+        config = config or {}
+        self.llm_client = llm_client
+        self.video_generator = video_generator
+        # 流式生成描述时，达到视频模型可用的prompt长度即停止
+        if getattr(llm_client, 'max_description_chars', None) is None:
+            llm_client.max_description_chars = getattr(video_generator, 'max_prompt_length', None)
+        self.queue_size = config.get('queue_size', 8)
+        self.workers = dict(DEFAULT_STAGE_WORKERS)
+        self.workers.update(config.get('workers') or {})
+        # LLM客户端支持批量生成描述时，凑批最多等待的时间（秒）
+        self.describe_batch_size = getattr(llm_client, 'batch_size', 1) if getattr(llm_client, 'supports_batch', False) else 1
+        # 长视频模式下为每张图片生成分镜列表，不打包请求
+        self.shot_count = getattr(video_generator, 'shot_count', None)
+        if self.shot_count:
+            self.describe_batch_size = 1
+        self.describe_batch_wait = config.get('describe_batch_wait', 0.5)
+        # 各阶段队列按优先级和租户调度，渲染阶段按render_slots限制同时渲染的任务数
+        self.scheduler_config = config.get('scheduler') or {}
+        self.render_slots = self.scheduler_config.get('render_slots')
+        self.priority_classes = JobScheduler(self.scheduler_config).class_names
+        self.description_dir = description_dir
+        # 近似重复的图片复用代表图片的描述，加载时在缩放后的图片上计算感知哈希
+        self.dedupe_config = dict(DEFAULT_DEDUPE_CONFIG, **(config.get('dedupe') or {}))
+        self.deduper = None
+        if self.dedupe_config['enabled']:
+            self.deduper = DescriptionDeduper(self.dedupe_config)
+            image_config = dict(image_config or {}, perceptual_hash=self.deduper.hash_method)
+        self.image_config = image_config
+        self.journal = journal
+        self.refresh = refresh
+        # 批处理时的图片预处理器（配置了process_workers时使用进程池）
+        self.preprocessor = None
+        
+        self._handlers = {
+            'load': self._load_stage,
+            'describe': self._describe_stage,
+            'render': self._render_stage,
+            'download': self._download_stage
+        }
+        self._results_lock = threading.Lock()
+        self._shutdown_lock = threading.Lock()
+        self._stopping = False
+        self._finished_count = 0
+        self._active = {stage: 0 for stage in self.STAGES}  # 各阶段正在处理的任务数
+        
+        # start()后运行中的队列和线程
+        self._intake = None
+        self._queues = None
+        self._feeder = None
+        self._stage_threads = None
+    
+    def _journal_update(self, job, **fields):
+        """更新任务日志（未启用时忽略）"""
+        if self.journal is not None and job.job_id:
+            self.journal.update(job.job_id, **fields)
+    
+    def _restore(self, job, rerun_done=False):
+        """
+        从任务日志恢复任务进度
+        
+        Args:
+            job: BatchJob实例
+            rerun_done: 为True时已完成的任务重新生成，而不是跳过
+        
+        Returns:
+            任务是否已经全部完成
+        """
+        if self.journal is None:
+            return False
+        
+        job.job_id = JobJournal.make_job_id(job.image_path, job.output_path)
+        if self.refresh:
+            job.record = self.journal.reset(job.job_id, job.image_path, job.output_path)
+            return False
+        
+        record = self.journal.start(job.job_id, job.image_path, job.output_path)
+        if record['stage'] == job_journal.STAGE_DONE and rerun_done:
+            record = self.journal.reset(job.job_id, job.image_path, job.output_path)
+        job.record = record
+        
+        if record['stage'] == job_journal.STAGE_DONE and os.path.exists(job.output_path):
+            return True
+        
+        if record['description']:
+            job.description = record['description']
+        if record['stage'] == job_journal.STAGE_RENDERED and record['video_url']:
+            job.render_result = {'task_id': record['task_id'], 'video_url': record['video_url']}
+            job.task = {'task_id': record['task_id']}
+        
+        if record['stage'] != job_journal.STAGE_PENDING:
+            logger.info(f"从任务日志恢复: {job.image_path}，阶段: {record['stage']}")
+        return False
+    
+    def _load_stage(self, job):
+        """阶段1: 加载、缩放并编码图片（已有描述或图片数据时跳过）"""
+        if job.description is not None or job.image is not None:
+            return
+        if self.preprocessor is not None:
+            job.image = self.preprocessor.process(job.image_path)
+        else:
+            job.image = prepare_image_payload(job.image_path, self.image_config)
+        
+        # 加载和编码可能在预处理子进程中完成，耗时随ImagePayload带回后在这里记录
+        metrics = get_metrics()
+        metrics.histogram('image_to_video_image_load_seconds', "加载并缩放图片的耗时（秒）").observe(job.image.load_seconds)
+        metrics.histogram('image_to_video_image_encode_seconds', "编码图片的耗时（秒）").observe(job.image.encode_seconds)
+        metrics.histogram('image_to_video_image_encoded_bytes', "编码后的图片大小（字节）", DEFAULT_BYTES_BUCKETS).observe(job.image.size)
+        get_tracer().set_attributes(**{
+            'image.load_seconds': job.image.load_seconds,
+            'image.encode_seconds': job.image.encode_seconds,
+            'image.bytes': job.image.size,
+            'image.width': job.image.width,
+            'image.height': job.image.height
+        })
+    
+    def _describe_stage(self, job):
+        """阶段2: 使用LLM生成描述，长视频模式下生成分镜列表（已有描述时跳过，近似重复的图片复用代表图片的描述）"""
+        if job.description is None:
+            cluster, is_new = self._claim_cluster(job)
+            if cluster is not None and not is_new:
+                job.description = self._reuse_description(job, cluster)
+            
+            if job.description is None:
+                try:
+                    job.description = self._generate_description(job)
+                except Exception as e:
+                    if is_new:
+                        self.deduper.fail(cluster, e)
+                    raise
+                if is_new:
+                    self.deduper.resolve(cluster, job.description)
+            self._journal_update(job, stage=job_journal.STAGE_DESCRIBED, description=job.description, error=None)
+        self._save_description(job)
+    
+    def _generate_description(self, job):
+        """请求LLM生成描述，长视频模式下生成分镜列表"""
+        if self.shot_count:
+            shots = self.llm_client.generate_shot_list(job.image, self.shot_count, self.video_generator.shot_seconds)
+            return format_shot_list(shots)
+        return self.llm_client.generate_description(job.image)
+    
+    def _claim_cluster(self, job):
+        """
+        按感知哈希为任务查找近似重复图片的代表
+        
+        Returns:
+            (DescriptionCluster, 是否为新代表)，未启用去重或图片没有感知哈希时为(None, False)
+        """
+        if self.deduper is None or job.image is None or job.image.perceptual_hash is None:
+            return None, False
+        return self.deduper.claim(job.image.perceptual_hash, job.image_path)
+    
+    def _reuse_description(self, job, cluster):
+        """
+        等待并复用代表图片的描述
+        
+        Returns:
+            代表图片的描述，代表图片失败时返回None
+        """
+        description = self.deduper.wait(cluster)
+        if description is not None:
+            get_tracer().set_attributes(**{'dedupe.representative': cluster.image_path})
+            logger.debug(f"{job.image_path}与{cluster.image_path}近似，复用其描述")
+        return description
+    
+    def _describe_batch(self, jobs):
+        """
+        阶段2（批量）: 将多张图片打包请求LLM生成描述
+        
+        Args:
+            jobs: BatchJob列表
+        
+        Returns:
+            {BatchJob: 异常}，只包含失败的任务
+        """
+        pending = [job for job in jobs if job.description is None]
+        errors = {}
+        
+        # 近似重复的图片不参与请求，等本批或其他批次中的代表图片生成描述后复用
+        clusters = {job: self._claim_cluster(job) for job in pending}
+        followers = [job for job in pending if clusters[job][0] is not None and not clusters[job][1]]
+        pending = [job for job in pending if job not in followers]
+        
+        if pending:
+            try:
+                results = self.llm_client.generate_descriptions([job.image for job in pending], return_exceptions=True)
+            except Exception as e:
+                results = [e] * len(pending)
+            
+            for job, result in zip(pending, results):
+                cluster, is_new = clusters[job]
+                if isinstance(result, Exception):
+                    if is_new:
+                        self.deduper.fail(cluster, result)
+                    errors[job] = result
+                    continue
+                if is_new:
+                    self.deduper.resolve(cluster, result)
+                job.description = result
+                self._journal_update(job, stage=job_journal.STAGE_DESCRIBED, description=job.description, error=None)
+        
+        for job in followers:
+            description = self._reuse_description(job, clusters[job][0])
+            if description is None:
+                try:
+                    description = self._generate_description(job)
+                except Exception as e:
+                    errors[job] = e
+                    continue
+            job.description = description
+            self._journal_update(job, stage=job_journal.STAGE_DESCRIBED, description=job.description, error=None)
+        
+        for job in jobs:
+            if job in errors:
+                continue
+            try:
+                self._save_description(job)
+            except Exception as e:
+                errors[job] = e
+        return errors
+    
+    def _save_description(self, job):
+        """释放图片数据，并按需保存描述文本"""
+        # 描述生成后不再需要图片数据，尽早释放内存
+        job.image = None
+        
+        if self.description_dir:
+            description_path = os.path.join(self.description_dir, _description_filename(job.output_path))
+            with open(description_path, 'w', encoding='utf-8') as f:
+                f.write(job.description)
+    
+    def _submit(self, job):
+        """提交视频生成任务，或重新关联任务日志中已提交的任务"""
+        record = job.record or {}
+        
+        if record.get('task_id') and record.get('stage') == job_journal.STAGE_SUBMITTED:
+            job.task = self.video_generator.attach_task(record['task_id'], record.get('submitted_at'))
+            return
+        
+        external_task_id = None
+        if job.job_id:
+            external_task_id = self.video_generator.make_external_task_id(
+                job.job_id, job.description, record.get('attempts', 0)
+            )
+            # 先记录external_task_id再提交，提交后进程中断也能找回任务
+            self._journal_update(job, stage=job_journal.STAGE_SUBMITTING, external_task_id=external_task_id)
+        
+        # 上次停在提交中时，之前的创建请求可能已成功，先按external_task_id查询再提交，避免重复计费
+        resume = record.get('stage') == job_journal.STAGE_SUBMITTING
+        job.task = self.video_generator.submit_task(job.description, external_task_id=external_task_id, resume=resume)
+        self._journal_update(
+            job,
+            stage=job_journal.STAGE_SUBMITTED,
+            task_id=job.task['task_id'],
+            submitted_at=job.task.get('submitted_at')
+        )
+    
+    def _render_stage(self, job):
+        """阶段3: 提交视频生成任务并等待渲染完成（视频缓存命中或已渲染时跳过）"""
+        if job.render_result is not None:
+            return
+        
+        job.cached_video = self.video_generator.fetch_cached_video(job.description, job.output_path)
+        if job.cached_video:
+            return
+        
+        self._submit(job)
+        try:
+            job.render_result = self.video_generator.wait_for_task(job.task)
+        except TaskFailedError:
+            # 服务端任务失败，下次运行时用新的external_task_id重新提交
+            if job.record is not None:
+                job.record['attempts'] = job.record.get('attempts', 0) + 1
+                job.record['stage'] = job_journal.STAGE_DESCRIBED
+                self._journal_update(job, stage=job_journal.STAGE_DESCRIBED, task_id=None, attempts=job.record['attempts'])
+            raise
+        self._journal_update(job, stage=job_journal.STAGE_RENDERED, video_url=job.render_result['video_url'])
+    
+    def _download_stage(self, job):
+        """阶段4: 下载生成的视频并加入视频缓存"""
+        if not job.cached_video:
+            self.video_generator.download_video(job.render_result['video_url'], job.output_path)
+            self.video_generator.cache_video(job.description, job.output_path, job.task['task_id'])
+        self._journal_update(job, stage=job_journal.STAGE_DONE, error=None)
+    
+    def _finish(self, job, error=None):
+        """记录任务结果"""
+        job.error = error
+        job.end_time = time.time()
+        job.image = None
+        
+        if error is not None:
+            self._journal_update(job, error=str(error))
+        
+        status = 'resumed' if job.resumed else 'succeeded' if error is None else 'failed'
+        metrics = get_metrics()
+        metrics.counter('image_to_video_pipeline_jobs_total', "流水线结束的任务数").inc(status=status)
+        if error is not None:
+            metrics.counter('image_to_video_pipeline_failures_total', "各阶段失败的任务数").inc(stage=job.stage or 'intake')
+        if not job.resumed and job.start_time is not None:
+            metrics.histogram('image_to_video_pipeline_job_seconds', "任务从进入流水线到结束的用时（秒）").observe(
+                job.elapsed, status=status
+            )
+        if job.span is not None:
+            job.span.set_attributes(**{'job.status': status, 'job.stage': job.stage})
+            if error is not None:
+                job.span.record_error(error)
+            job.span.end(job.end_time)
+        
+        with self._results_lock:
+            self._finished_count += 1
+            done = self._finished_count
+        
+        if job.resumed:
+            logger.info(f"[{done}] 任务日志显示已完成，跳过: {job.image_path} -> {job.output_path}（使用--refresh重新生成）")
+        elif error is None:
+            logger.info(f"[{done}] 成功: {job.image_path} -> {job.output_path}，用时: {job.elapsed:.2f}秒，trace: {job.trace_id}")
+        else:
+            logger.error(f"[{done}] 失败: {job.image_path}，阶段: {job.stage}，错误: {error}，trace: {job.trace_id}")
+        job.finished.set()
+    
+    def _start_trace(self, job):
+        """创建任务的根span（重新排队的任务沿用原有的span）"""
+        if job.span is None:
+            job.span = get_tracer().start_span(
+                'job',
+                **{
+                    'job.index': job.index,
+                    'job.image_path': job.image_path,
+                    'job.output_path': job.output_path,
+                    'job.priority': job.priority,
+                    'job.tenant': job.tenant
+                }
+            )
+    
+    def _enqueue(self, target_queue, job):
+        """任务放入队列，记录入队时间"""
+        job.queued_at = time.time()
+        target_queue.put(job)
+    
+    def _record_wait(self, stage, job):
+        """记录任务在阶段队列中的排队耗时（指标和span）"""
+        if job.queued_at is not None:
+            now = time.time()
+            get_metrics().histogram('image_to_video_pipeline_queue_wait_seconds', "任务在各阶段队列中的排队耗时（秒）").observe(
+                now - job.queued_at, stage=stage
+            )
+            if job.span is not None:
+                get_tracer().record(f"queue.{stage}", job.queued_at, now, parent=job.span, **{'pipeline.stage': stage})
+            job.queued_at = None
+    
+    def _record_stage(self, stage, seconds, status):
+        """记录阶段处理耗时"""
+        get_metrics().histogram('image_to_video_pipeline_stage_seconds', "各阶段处理单个任务的耗时（秒）").observe(
+            seconds, stage=stage, status=status
+        )
+    
+    def _set_active(self, stage, delta):
+        """更新阶段正在处理的任务数"""
+        with self._results_lock:
+            self._active[stage] += delta
+    
+    def _stage_worker(self, stage, in_queue, out_queue):
+        """阶段工作线程：从输入队列取任务，处理后放入下一阶段队列"""
+        handler = self._handlers[stage]
+        
+        while True:
+            job = in_queue.get()
+            if job is _STOP:
+                break
+            
+            job.stage = stage
+            self._record_wait(stage, job)
+            self._set_active(stage, 1)
+            stage_start = time.time()
+            try:
+                with get_tracer().span(f"stage.{stage}", parent=job.span, **{'pipeline.stage': stage}):
+                    handler(job)
+            except Exception as e:
+                # 单张图片失败不影响整个批次
+                self._record_stage(stage, time.time() - stage_start, 'error')
+                self._finish(job, e)
+                continue
+            finally:
+                self._set_active(stage, -1)
+                # 归还渲染名额（其他阶段的队列不限制名额，调用无效果）
+                in_queue.release()
+            
+            self._record_stage(stage, time.time() - stage_start, 'ok')
+            if out_queue is None:
+                self._finish(job)
+            else:
+                self._enqueue(out_queue, job)
+    
+    def _describe_batch_worker(self, in_queue, out_queue):
+        """批量生成描述的工作线程：每次最多凑齐describe_batch_size个任务后一起处理"""
+        stopped = False
+        
+        while not stopped:
+            job = in_queue.get()
+            if job is _STOP:
+                break
+            
+            batch = [job]
+            deadline = time.time() + self.describe_batch_wait
+            while len(batch) < self.describe_batch_size:
+                try:
+                    job = in_queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    # 处理完已取出的任务后退出
+                    stopped = True
+                    break
+                batch.append(job)
+            
+            for job in batch:
+                job.stage = 'describe'
+                self._record_wait('describe', job)
+            self._set_active('describe', len(batch))
+            stage_start = time.time()
+            tracer = get_tracer()
+            try:
+                # 整批的请求记在第一个任务的trace中，其他任务的阶段span通过link关联
+                with tracer.span('stage.describe_batch', parent=batch[0].span, **{'pipeline.batch_size': len(batch)}) as batch_span:
+                    errors = self._describe_batch(batch)
+            finally:
+                self._set_active('describe', -len(batch))
+            # 一批任务共用一次请求，每个任务都记录整批的耗时
+            elapsed = time.time() - stage_start
+            
+            for job in batch:
+                span = tracer.start_span('stage.describe', parent=job.span, start_time=stage_start, **{
+                    'pipeline.stage': 'describe',
+                    'pipeline.batch_size': len(batch)
+                })
+                span.add_link(batch_span)
+                if job in errors:
+                    span.record_error(errors[job])
+                    span.end()
+                    self._record_stage('describe', elapsed, 'error')
+                    self._finish(job, errors[job])
+                else:
+                    span.end()
+                    self._record_stage('describe', elapsed, 'ok')
+                    self._enqueue(out_queue, job)
+    
+    def _feed(self, intake, first_queue):
+        """将提交的任务依次放入第一阶段队列，任务日志中已完成的任务直接跳过"""
+        while True:
+            job = intake.get()
+            if job is _STOP:
+                break
+            self._record_wait('intake', job)
+            
+            if job.start_time is not None:
+                # 被抢占后重新排队的任务，保留已完成的进度
+                self._enqueue(first_queue, job)
+                continue
+            
+            job.start_time = time.time()
+            try:
+                if self._restore(job):
+                    job.resumed = True
+                    self._finish(job)
+                    continue
+            except Exception as e:
+                self._finish(job, e)
+                continue
+            self._enqueue(first_queue, job)
+    
+    def _requeue(self, job):
+        """
+        被高优先级任务挤出阶段队列的任务回到接收队列，按优先级和租户重新调度
+        
+        Returns:
+            是否已重新排队；流水线正在停止时接收队列不再被读取，返回False由阶段队列放回原处
+        """
+        with self._shutdown_lock:
+            if self._stopping:
+                return False
+            self._enqueue(self._intake, job)
+            return True
+    
+    def process(self, job):
+        """
+        在当前线程中依次执行各阶段处理单个任务（单张图片模式）
+        
+        Args:
+            job: BatchJob实例
+        
+        Returns:
+            处理完成的BatchJob，失败时job.error为异常
+        """
+        job.start_time = time.time()
+        self._start_trace(job)
+        
+        try:
+            # 单张图片模式下已完成的任务重新生成，中断的任务从任务日志中的阶段继续（重新关联渲染中的任务）
+            if self._restore(job, rerun_done=True):
+                job.resumed = True
+                self._finish(job)
+                return job
+            
+            for stage in self.STAGES:
+                job.stage = stage
+                stage_start = time.time()
+                with get_tracer().span(f"stage.{stage}", parent=job.span, **{'pipeline.stage': stage}):
+                    self._handlers[stage](job)
+                elapsed = time.time() - stage_start
+                self._record_stage(stage, elapsed, 'ok')
+                logger.info(f"阶段{stage}完成，用时: {elapsed:.2f}秒")
+        except Exception as e:
+            self._finish(job, e)
+            return job
+        
+        self._finish(job)
+        return job
+    
+    def start(self):
+        """
+        启动各阶段工作线程，之后可通过submit()持续提交任务
+        
+        Returns:
+            self
+        """
+        if self._queues is not None:
+            raise RuntimeError("流水线已启动")
+        
+        self._finished_count = 0
+        if self.deduper is not None:
+            # 每次运行重新建立索引，节省的LLM请求数按本次运行统计
+            self.deduper = DescriptionDeduper(self.dedupe_config)
+        if self.description_dir:
+            os.makedirs(self.description_dir, exist_ok=True)
+        
+        self._stopping = False
+        self._intake = JobScheduler(self.scheduler_config, name="接收队列")
+        self._queues = []
+        for stage in self.STAGES:
+            # 已渲染完成的任务不再抢占，避免重复下载前的排队
+            self._queues.append(JobScheduler(
+                self.scheduler_config,
+                maxsize=self.queue_size,
+                slots=self.render_slots if stage == 'render' else None,
+                on_preempt=self._requeue if stage != 'download' else None,
+                name=f"{stage}队列"
+            ))
+        self._stage_threads = []
+        
+        self.preprocessor = ImagePreprocessor(self.image_config)
+        workers = dict(self.workers)
+        # 使用进程池时，加载线程只负责等待结果，线程数不少于进程数
+        workers['load'] = max(int(workers.get('load', 1)), self.preprocessor.workers)
+        # 渲染线程只在拿到名额后才取出任务，线程数不少于名额数
+        if self.render_slots:
+            workers['render'] = max(int(workers.get('render', 1)), self.render_slots)
+        
+        for i, stage in enumerate(self.STAGES):
+            out_queue = self._queues[i + 1] if i + 1 < len(self.STAGES) else None
+            threads = []
+            for n in range(max(1, int(workers.get(stage, 1)))):
+                if stage == 'describe' and self.describe_batch_size > 1:
+                    target, args = self._describe_batch_worker, (self._queues[i], out_queue)
+                else:
+                    target, args = self._stage_worker, (stage, self._queues[i], out_queue)
+                thread = threading.Thread(
+                    target=target,
+                    args=args,
+                    name=f"pipeline-{stage}-{n}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+            self._stage_threads.append(threads)
+        
+        # 提交的任务先进入无界的接收队列，由feeder线程按优先级和租户逐个放入第一阶段队列
+        self._feeder = threading.Thread(target=self._feed, args=(self._intake, self._queues[0]), name="pipeline-feeder", daemon=True)
+        self._feeder.start()
+        
+        logger.info(f"流水线已启动，各阶段并发数: {workers}")
+        return self
+    
+    def submit(self, job):
+        """
+        向已启动的流水线提交任务（不阻塞），任务结束时job.finished置位
+        
+        Args:
+            job: BatchJob实例
+        """
+        if self._intake is None:
+            raise RuntimeError("流水线未启动")
+        self._start_trace(job)
+        self._enqueue(self._intake, job)
+    
+    def stop(self):
+        """等待已提交的任务全部完成后停止工作线程"""
+        if self._queues is None:
+            return
+        
+        # 接收队列关闭后不再有人读取，先停止抢占，被挤出的任务放回原阶段队列
+        with self._shutdown_lock:
+            self._stopping = True
+        for q in self._queues:
+            q.disable_preemption()
+        self._intake.put(_STOP)
+        self._feeder.join()
+        
+        # 逐阶段关闭：上一阶段全部结束后，再通知下一阶段结束
+        for i, threads in enumerate(self._stage_threads):
+            for _ in threads:
+                self._queues[i].put(_STOP)
+            for thread in threads:
+                thread.join()
+        
+        self.preprocessor.close()
+        self.preprocessor = None
+        self._intake = None
+        self._queues = None
+        self._feeder = None
+        self._stage_threads = None
+    
+    def stats(self):
+        """
+        获取流水线的运行状态
+        
+        Returns:
+            字典：pending为等待进入流水线的任务数，queued/active为各阶段排队中/处理中的任务数，
+            finished为已结束的任务数；流水线运行中时，intake为接收队列按优先级和租户的排队数，
+            render_slots为占用的渲染名额，preempted为被挤出重新排队的次数，
+            dedupe为近似图片去重的统计（未启用时为None）
+        """
+        with self._results_lock:
+            active = dict(self._active)
+            finished = self._finished_count
+        
+        intake, queues = self._intake, self._queues
+        if intake is None or queues is None:
+            return {'pending': 0, 'queued': {}, 'active': active, 'finished': finished}
+        
+        intake_stats = intake.stats()
+        render_stats = queues[self.STAGES.index('render')].stats()
+        return {
+            'pending': intake.qsize(),
+            'queued': {stage: q.qsize() for stage, q in zip(self.STAGES, queues)},
+            'active': active,
+            'finished': finished,
+            'intake': {'priorities': intake_stats['queued'], 'tenants': intake_stats['tenants']},
+            'render_slots': {'in_use': render_stats['in_use'], 'limit': render_stats['slots']},
+            'preempted': sum(q.stats()['preempted'] for q in queues),
+            'dedupe': self.deduper.stats() if self.deduper is not None else None
+        }
+    
+    def run(self, jobs):
+        """
+        运行流水线直到所有任务完成
+        
+        Args:
+            jobs: BatchJob列表
+        
+        Returns:
+            批处理统计信息字典
+        """
+        jobs = list(jobs)
+        start_time = time.time()
+        
+        self.start()
+        logger.info(f"批处理开始，共{len(jobs)}张图片")
+        for job in jobs:
+            self.submit(job)
+        self.stop()
+        
+        elapsed = time.time() - start_time
+        return self._summarize(jobs, elapsed)
+    
+    def _summarize(self, jobs, elapsed):
+        """汇总批处理结果"""
+        succeeded = [job for job in jobs if job.succeeded]
+        failed = [job for job in jobs if not job.succeeded]
+        throughput = len(succeeded) / elapsed * 3600 if elapsed > 0 else 0.0
+        
+        summary = {
+            'total': len(jobs),
+            'succeeded': len(succeeded),
+            'failed': len(failed),
+            'elapsed': elapsed,
+            'images_per_hour': throughput,
+            'llm_calls_saved': 0,
+            'failures': [
+                {'image': job.image_path, 'stage': job.stage, 'error': str(job.error)}
+                for job in failed
+            ]
+        }
+        
+        logger.info(
+            f"批处理完成: 成功{summary['succeeded']}，失败{summary['failed']}，"
+            f"总用时{elapsed:.2f}秒，吞吐量{throughput:.1f}张/小时"
+        )
+        if self.deduper is not None:
+            dedupe_stats = self.deduper.stats()
+            summary['llm_calls_saved'] = dedupe_stats['reused']
+            logger.info(
+                f"近似图片去重: {dedupe_stats['representatives']}组，复用描述{dedupe_stats['reused']}张"
+                f"（节省{dedupe_stats['reused']}次LLM请求），代表失败后单独请求{dedupe_stats['fallbacks']}张"
+            )
+        return summary
+
+def _description_filename(output_path):
+    """
+    根据输出视频路径生成描述文本的文件名
+    
+    不同目录下的同名图片（或清单中指定到不同目录的同名输出）会得到相同的文件名前缀，
+    因此附加输出路径的短哈希，保证每个任务的描述文件互不覆盖。
+    """
+    base_name = os.path.splitext(os.path.basename(output_path))[0]
+    digest = hashlib.sha1(os.path.abspath(output_path).encode('utf-8')).hexdigest()[:8]
+    return f"{base_name}_{digest}.txt"
+
+def _default_output_path(image_path, output_dir):
+    """根据输入图片路径生成默认输出视频路径"""
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    if output_dir:
+        return os.path.join(output_dir, f"{base_name}_video.mp4")
+    return os.path.join(os.path.dirname(image_path), f"{base_name}_video.mp4")
+
+def load_jobs_from_dir(input_dir, output_dir=None, priority=None, tenant=None):
+    """
+    从图片目录创建批处理任务
+    
+    Args:
+        input_dir: 图片目录
+        output_dir: 输出视频目录，为None时输出到图片所在目录
+        priority: 任务的优先级
+        tenant: 任务的租户
+    
+    Returns:
+        BatchJob列表
+    """
+    image_files = list_image_files(input_dir)
+    return [
+        BatchJob(i, path, _default_output_path(path, output_dir), priority, tenant)
+        for i, path in enumerate(image_files)
+    ]
+
+def load_jobs_from_manifest(manifest_path, output_dir=None, priority=None, tenant=None):
+    """
+    从清单文件创建批处理任务
+    
+    清单每行一个任务，可以是图片路径，也可以是JSON对象
+    （{"image": "...", "output": "...", "priority": "...", "tenant": "..."}），
+    空行和以#开头的行会被忽略。相对路径以清单文件所在目录为基准。
+    
+    Args:
+        manifest_path: 清单文件路径
+        output_dir: 未指定output时使用的输出目录
+        priority: 未指定priority时的优先级
+        tenant: 未指定tenant时的租户
+    
+    Returns:
+        BatchJob列表
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            
+            if line.startswith('{'):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"清单第{line_no}行不是合法的JSON: {e}")
+                image_path = entry.get('image')
+                output_path = entry.get('output')
+                job_priority = entry.get('priority', priority)
+                job_tenant = entry.get('tenant', tenant)
+                if not image_path:
+                    raise ValueError(f"清单第{line_no}行缺少image字段")
+            else:
+                image_path = line
+                output_path = None
+                job_priority, job_tenant = priority, tenant
+            
+            image_path = os.path.join(base_dir, image_path)
+            if output_path:
+                output_path = os.path.join(base_dir, output_path)
+            else:
+                output_path = _default_output_path(image_path, output_dir)
+            
+            jobs.append(BatchJob(len(jobs), image_path, output_path, job_priority, job_tenant))
+    
+    return jobs
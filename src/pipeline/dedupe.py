@@ -0,0 +1,128 @@
+import threading
+from concurrent.futures import Future
+from loguru import logger
+
+from utils.metrics import get_metrics
+from utils.perceptual_hash import BKTree, PERCEPTUAL_HASH_METHODS
+
+# 默认去重配置，对应config.yaml中的pipeline.dedupe部分
+DEFAULT_DEDUPE_CONFIG = {
+    'enabled': False,
+    'hash': 'dhash',       # 感知哈希算法：dhash或phash
+    'max_distance': 6,     # 汉明距离不超过该值的图片视为近似重复
+    'max_entries': 100000  # 索引中的代表图片数上限，超过时清空重建
+}
+
+class DescriptionCluster:
+    """一组近似重复图片的代表，future在代表图片的描述生成后完成"""
+    
+    def __init__(self, perceptual_hash, image_path):
+        self.perceptual_hash = perceptual_hash
+        self.image_path = image_path
+        self.future = Future()
+        self.members = 1
+
+class DescriptionDeduper:
+    """
+    按感知哈希把近似重复的图片归为一组，同组图片复用代表图片的描述
+    
+    第一张图片成为代表并请求LLM，之后汉明距离在max_distance内的图片等待代表的
+    描述生成后直接复用，不再请求LLM。代表图片生成描述失败时，等待的图片各自请求LLM，
+    该组不再接收新成员。索引使用BK树，查询不必与所有已有哈希逐一比较。
+    """
+    
+    def __init__(self, config=None):
+        """
+        初始化去重器
+        
+        Args:
+            config: 去重配置字典，见DEFAULT_DEDUPE_CONFIG
+        """
+        config = dict(DEFAULT_DEDUPE_CONFIG, **(config or {}))
+        if config['hash'] not in PERCEPTUAL_HASH_METHODS:
+            raise ValueError(f"不支持的感知哈希算法: {config['hash']}，可选: {', '.join(PERCEPTUAL_HASH_METHODS)}")
+        
+        self.hash_method = config['hash']
+        self.max_distance = int(config['max_distance'])
+        self.max_entries = config['max_entries']
+        
+        self._index = BKTree()
+        self._lock = threading.Lock()
+        self._stats = {'representatives': 0, 'reused': 0, 'fallbacks': 0}
+    
+    def claim(self, perceptual_hash, image_path):
+        """
+        为图片查找可复用描述的代表，找不到时该图片成为新的代表
+        
+        Args:
+            perceptual_hash: 图片的感知哈希
+            image_path: 图片路径（用于日志）
+        
+        Returns:
+            (DescriptionCluster, 是否为新代表)
+        """
+        # 查找和加入在同一把锁内完成，同时到达的近似图片只会产生一个代表
+        with self._lock:
+            for _, cluster in self._index.search(perceptual_hash, self.max_distance):
+                # 代表图片失败的组不再复用
+                if cluster.future.done() and cluster.future.exception() is not None:
+                    continue
+                cluster.members += 1
+                return cluster, False
+            
+            if self.max_entries and len(self._index) >= self.max_entries:
+                logger.info(f"去重索引已有{len(self._index)}张代表图片，清空重建")
+                self._index.clear()
+            cluster = DescriptionCluster(perceptual_hash, image_path)
+            self._index.add(perceptual_hash, cluster)
+            self._stats['representatives'] += 1
+            self._record('representative')
+            return cluster, True
+    
+    def wait(self, cluster):
+        """
+        等待代表图片的描述
+        
+        Args:
+            cluster: claim()返回的DescriptionCluster
+        
+        Returns:
+            代表图片的描述，代表图片失败时返回None（调用方自行请求LLM）
+        """
+        try:
+            description = cluster.future.result()
+        except Exception as e:
+            logger.warning(f"近似图片的代表{cluster.image_path}生成描述失败，改为单独请求: {e}")
+            self._count('fallbacks')
+            self._record('fallback')
+            return None
+        self._count('reused')
+        self._record('reused')
+        return description
+    
+    def resolve(self, cluster, description):
+        """代表图片的描述已生成"""
+        cluster.future.set_result(description)
+    
+    def fail(self, cluster, error):
+        """代表图片生成描述失败，唤醒等待的图片"""
+        cluster.future.set_exception(error)
+    
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+    
+    def _record(self, result):
+        """记录去重结果指标（reused即节省的LLM请求数）"""
+        get_metrics().counter('image_to_video_dedupe_total', "按感知哈希去重的图片数").inc(result=result)
+    
+    def stats(self):
+        """
+        获取去重统计
+        
+        Returns:
+            字典：representatives为请求了LLM的代表图片数，reused为复用描述（节省LLM请求）的图片数，
+            fallbacks为代表失败后单独请求的图片数
+        """
+        with self._lock:
+            return dict(self._stats)
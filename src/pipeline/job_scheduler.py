@@ -0,0 +1,252 @@
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+from loguru import logger
+
+# 队列结束标记：get()在队列中的任务全部取出后返回该标记
+STOP = object()
+
+# 默认调度配置，对应config.yaml中的pipeline.scheduler部分；
+# 只有一个优先级和一个租户时，调度器等同于先进先出队列
+DEFAULT_SCHEDULER_CONFIG = {
+    # 优先级从高到低：reserved_slots为只留给该级别及更高级别使用的渲染名额，
+    # preemptible为true时，该级别排队中的任务可被更高级别的任务挤出队列
+    'classes': [{'name': 'default'}],
+    'default_class': None,  # 未指定优先级的任务使用的级别，默认为最低级别
+    'default_tenant': 'default',
+    'tenant_weights': {},  # 租户权重，同一优先级内按权重轮转，未列出的租户权重为1
+    'render_slots': None  # 同时渲染的任务数，为None时不限制（仍受视频生成模型的rate_limit约束）
+}
+
+class JobScheduler:
+    """
+    按优先级和租户公平调度的任务队列
+    
+    出队时先选最高优先级，同一优先级内按租户加权轮转（Deficit Round Robin），
+    一个租户的大批任务不会饿死其他租户。可选的slots限制同时取出且未release()的任务数，
+    并按各级别的reserved_slots为高优先级保留名额；有界队列已满时，高优先级任务
+    会把最低的可抢占级别中最新排队的任务挤出，交给on_preempt回调重新排队。
+    
+    接口与queue.Queue的put/get/qsize兼容，可直接作为流水线各阶段之间的队列。
+    """
+    
+    def __init__(self, config=None, maxsize=0, slots=None, on_preempt=None, name='队列'):
+        """
+        初始化调度器
+        
+        Args:
+            config: 调度配置字典，见DEFAULT_SCHEDULER_CONFIG
+            maxsize: 队列长度上限，为0时不限制
+            slots: 同时取出且未释放的任务数上限，为None时不限制
+            on_preempt: 接收被挤出的任务的函数，为None时不抢占；返回False时不接收，任务放回本队列
+            name: 队列名称，用于日志
+        """
+        config = dict(DEFAULT_SCHEDULER_CONFIG, **(config or {}))
+        classes = config['classes'] or DEFAULT_SCHEDULER_CONFIG['classes']
+        
+        self.name = name
+        self.class_names = [entry['name'] for entry in classes]
+        self.default_class = config['default_class'] or self.class_names[-1]
+        self.default_tenant = config['default_tenant']
+        self.tenant_weights = dict(config['tenant_weights'] or {})
+        self.maxsize = maxsize
+        self.slots = slots
+        self.on_preempt = on_preempt
+        
+        if self.default_class not in self.class_names:
+            raise ValueError(f"默认优先级不在优先级列表中: {self.default_class}")
+        for tenant, weight in self.tenant_weights.items():
+            if weight <= 0:
+                raise ValueError(f"租户权重必须大于0: {tenant}={weight}")
+        
+        self._preemptible = [bool(entry.get('preemptible')) for entry in classes]
+        # 各级别可用的名额上限：总名额减去更高级别保留的名额
+        self._slot_limits = []
+        reserved = 0
+        for entry in classes:
+            self._slot_limits.append(None if slots is None else max(1, slots - reserved))
+            reserved += int(entry.get('reserved_slots') or 0)
+        
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._tenants = [OrderedDict() for _ in classes]  # 每个级别: 租户 -> 排队中的任务，按轮转顺序排列
+        self._deficits = [{} for _ in classes]
+        self._size = 0
+        self._in_use = 0
+        self._stops = 0
+        self._preempted = 0
+    
+    def disable_preemption(self):
+        """停止抢占，之后队列已满时put()只会阻塞等待（流水线停止时使用）"""
+        with self._lock:
+            self.on_preempt = None
+    
+    def rank_of(self, job):
+        """任务的优先级序号（0最高），未知的优先级按默认级别处理"""
+        priority = getattr(job, 'priority', None) or self.default_class
+        if priority not in self.class_names:
+            priority = self.default_class
+        return self.class_names.index(priority)
+    
+    def _tenant_of(self, job):
+        return getattr(job, 'tenant', None) or self.default_tenant
+    
+    def _append(self, job, rank):
+        """任务加入所属级别和租户的队尾（需持有锁）"""
+        tenant = self._tenant_of(job)
+        tenants = self._tenants[rank]
+        if tenant not in tenants:
+            tenants[tenant] = deque()
+            self._deficits[rank][tenant] = 0.0
+        tenants[tenant].append(job)
+        self._size += 1
+    
+    def _remove_tenant_job(self, rank, tenant, from_end=False):
+        """从租户队列取出一个任务，租户队列为空时移出轮转（需持有锁）"""
+        jobs = self._tenants[rank][tenant]
+        job = jobs.pop() if from_end else jobs.popleft()
+        if not jobs:
+            del self._tenants[rank][tenant]
+            del self._deficits[rank][tenant]
+        self._size -= 1
+        return job
+    
+    def _pop_next(self):
+        """按优先级和租户轮转取出下一个可以执行的任务，没有时返回None（需持有锁）"""
+        for rank, tenants in enumerate(self._tenants):
+            if not tenants:
+                continue
+            limit = self._slot_limits[rank]
+            if limit is not None and self._in_use >= limit:
+                # 更低级别的名额上限只会更小
+                return None
+            
+            deficits = self._deficits[rank]
+            while True:
+                tenant = next(iter(tenants))
+                if deficits[tenant] < 1:
+                    deficits[tenant] += self.tenant_weights.get(tenant, 1)
+                if deficits[tenant] >= 1:
+                    deficits[tenant] -= 1
+                    job = self._remove_tenant_job(rank, tenant)
+                    if tenant in tenants and deficits[tenant] < 1:
+                        tenants.move_to_end(tenant)
+                    return job
+                tenants.move_to_end(tenant)
+        return None
+    
+    def _take_victim(self, rank):
+        """
+        为rank级别的任务挤出一个排队中的任务（需持有锁）
+        
+        从低于rank的可抢占级别中选最低的一级，取排队最多的租户最新加入的任务。
+        """
+        if self.on_preempt is None:
+            return None
+        for victim_rank in range(len(self._tenants) - 1, rank, -1):
+            tenants = self._tenants[victim_rank]
+            if not self._preemptible[victim_rank] or not tenants:
+                continue
+            tenant = max(tenants, key=lambda name: len(tenants[name]))
+            return self._remove_tenant_job(victim_rank, tenant, from_end=True)
+        return None
+    
+    def put(self, job):
+        """
+        任务入队，队列已满时阻塞（可以抢占时先挤出低优先级任务）
+        
+        Args:
+            job: BatchJob实例，或结束标记STOP
+        """
+        victim = None
+        on_preempt = None
+        with self._not_full:
+            if job is STOP:
+                self._stops += 1
+                self._not_empty.notify_all()
+                return
+            
+            rank = self.rank_of(job)
+            if self.maxsize and self._size >= self.maxsize:
+                on_preempt = self.on_preempt
+                victim = self._take_victim(rank)
+            while victim is None and self.maxsize and self._size >= self.maxsize:
+                self._not_full.wait()
+            
+            self._append(job, rank)
+            if victim is not None:
+                self._preempted += 1
+            self._not_empty.notify()
+        
+        if victim is not None:
+            logger.info(f"{self.name}已满，{getattr(victim, 'image_path', victim)}被更高优先级的任务挤出，重新排队")
+            if on_preempt(victim) is False:
+                # 接收方已关闭（如流水线正在停止），任务放回本队列等待
+                self.put(victim)
+    
+    def get(self, timeout=None):
+        """
+        取出下一个任务，没有可执行的任务时阻塞
+        
+        Args:
+            timeout: 最长等待时间（秒），为None时一直等待
+        
+        Returns:
+            BatchJob实例；队列为空且已放入结束标记时返回STOP
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_empty:
+            while True:
+                job = self._pop_next()
+                if job is not None:
+                    if self.slots is not None:
+                        self._in_use += 1
+                    self._not_full.notify()
+                    return job
+                if self._stops and self._size == 0:
+                    self._stops -= 1
+                    return STOP
+                
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._not_empty.wait(remaining)
+    
+    def release(self):
+        """归还get()时占用的名额（只在设置了slots时需要）"""
+        if self.slots is None:
+            return
+        with self._not_empty:
+            self._in_use = max(0, self._in_use - 1)
+            self._not_empty.notify_all()
+    
+    def qsize(self):
+        """排队中的任务数"""
+        with self._lock:
+            return self._size
+    
+    def stats(self):
+        """
+        获取调度状态
+        
+        Returns:
+            字典：queued为各优先级排队中的任务数，tenants为各租户排队中的任务数，
+            in_use/slots为占用的名额和名额上限，preempted为累计被挤出的任务数
+        """
+        with self._lock:
+            tenants = {}
+            for class_tenants in self._tenants:
+                for tenant, jobs in class_tenants.items():
+                    tenants[tenant] = tenants.get(tenant, 0) + len(jobs)
+            return {
+                'queued': {
+                    name: sum(len(jobs) for jobs in class_tenants.values())
+                    for name, class_tenants in zip(self.class_names, self._tenants)
+                },
+                'tenants': tenants,
+                'in_use': self._in_use,
+                'slots': self.slots,
+                'preempted': self._preempted
+            }
@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import uuid
+import hmac
+import mimetypes
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from loguru import logger
+
+from utils.image_utils import IMAGE_EXTENSIONS
+from utils.metrics import get_metrics
+from .batch_pipeline import BatchJob
+
+# 服务模式默认配置，对应config.yaml中的serve部分
+DEFAULT_SERVE_CONFIG = {
+    'host': '127.0.0.1',
+    'port': 8780,
+    'token': None,
+    'upload_dir': 'cache/serve/uploads',
+    'output_dir': 'cache/serve/videos',
+    'max_pending_jobs': 100,
+    'keep_finished_jobs': 1000,
+    'max_upload_bytes': 50 * 1024 * 1024
+}
+
+# 任务状态
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+# 下载视频时每次写出的字节数
+VIDEO_CHUNK_SIZE = 256 * 1024
+
+class JobRejectedError(Exception):
+    """提交的任务无法接受，code为对应的HTTP状态码"""
+    
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+class _JobHandler(BaseHTTPRequestHandler):
+    """处理任务提交、状态查询和视频下载的HTTP请求"""
+    
+    def log_message(self, format, *args):
+        logger.debug(f"任务服务器: {format % args}")
+    
+    def _reply(self, code, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _reply_text(self, code, text, content_type):
+        data = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _error(self, code, message):
+        return self._reply(code, {"code": code, "message": message})
+    
+    def _authorized(self):
+        token = self.server.job_server.token
+        if not token:
+            return True
+        auth = self.headers.get('Authorization', '')
+        return hmac.compare_digest(auth, f"Bearer {token}")
+    
+    def _route(self):
+        """解析请求路径，返回(路径片段列表, 查询参数)"""
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        return parts, query
+    
+    def do_GET(self):
+        if not self._authorized():
+            return self._error(401, "unauthorized")
+        
+        server = self.server.job_server
+        parts, _ = self._route()
+        
+        if parts == ['status']:
+            return self._reply(200, server.status())
+        if parts == ['metrics']:
+            return self._reply_text(200, get_metrics().render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+        if parts == ['metrics', 'summary']:
+            return self._reply(200, get_metrics().summary())
+        
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            info = server.get_job(parts[1])
+            if info is None:
+                return self._error(404, "job not found")
+            if len(parts) == 2:
+                return self._reply(200, info)
+            if parts[2] == 'video':
+                return self._send_video(info)
+        
+        return self._error(404, "not found")
+    
+    def do_POST(self):
+        if not self._authorized():
+            return self._error(401, "unauthorized")
+        
+        server = self.server.job_server
+        parts, query = self._route()
+        if parts != ['jobs']:
+            return self._error(404, "not found")
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise JobRejectedError(400, f"无效的Content-Length: {length}")
+            if length > server.max_upload_bytes:
+                raise JobRejectedError(413, f"请求体超过上限: {length} > {server.max_upload_bytes}")
+            body = self.rfile.read(length)
+            
+            content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type == 'application/json':
+                # JSON请求：{"image_path": ..., "output_path": ...（output_dir下的相对路径）, "description": ...}
+                options = json.loads(body.decode('utf-8') or '{}')
+                info = server.submit(options.get('image_path'), options=options)
+            else:
+                # 其他类型视为图片文件本身，选项通过查询参数传入
+                filename = query.get('filename') or f"upload{mimetypes.guess_extension(content_type) or '.jpg'}"
+                info = server.submit(image_data=body, filename=filename, options=query)
+        except JobRejectedError as e:
+            return self._error(e.code, str(e))
+        except (ValueError, UnicodeDecodeError) as e:
+            return self._error(400, f"无法解析请求: {e}")
+        
+        self._reply(202, info)
+    
+    def _send_video(self, info):
+        if info['status'] != STATUS_SUCCEEDED:
+            return self._error(409, f"任务尚未成功完成，当前状态: {info['status']}")
+        
+        path = info['output_path']
+        try:
+            size = os.path.getsize(path)
+            video_file = open(path, 'rb')
+        except OSError:
+            return self._error(410, "视频文件已不存在")
+        
+        with video_file:
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(size))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+            self.end_headers()
+            while True:
+                chunk = video_file.read(VIDEO_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+class JobServer:
+    """
+    常驻服务模式的任务服务器
+    
+    在一个进程内保持配置、LLM/视频生成客户端和连接池常驻，
+    通过本地HTTP接口接收任务并交给持续运行的批处理流水线，并发数由流水线各阶段的线程数限制。
+    
+    接口：
+        POST /jobs            提交任务（JSON指定图片路径，或直接上传图片文件）
+        GET  /jobs/<id>       查询任务状态
+        GET  /jobs/<id>/video 下载生成的视频
+        GET  /status          查询排队和处理中的任务数
+        GET  /metrics         Prometheus文本格式的指标（/metrics/summary为JSON摘要）
+    """
+    
+    def __init__(self, pipeline, config=None):
+        """
+        初始化任务服务器
+        
+        Args:
+            pipeline: BatchPipeline实例（由服务器启动和停止）
+            config: 服务模式配置字典，见DEFAULT_SERVE_CONFIG
+        """
+        config = dict(DEFAULT_SERVE_CONFIG, **(config or {}))
+        self.pipeline = pipeline
+        self.host = config['host']
+        self.port = config['port']
+        self.token = config['token']
+        self.upload_dir = config['upload_dir']
+        self.output_dir = config['output_dir']
+        self.max_pending_jobs = config['max_pending_jobs']
+        self.keep_finished_jobs = config['keep_finished_jobs']
+        self.max_upload_bytes = config['max_upload_bytes']
+        
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # 任务ID -> 任务信息，按提交顺序排列
+        self._next_index = 0
+        self._counts = {'submitted': 0, 'rejected': 0}
+        self._started_at = None
+        self._server = None
+        self._thread = None
+    
+    @property
+    def url(self):
+        """服务器地址"""
+        return f"http://{self.host}:{self.port}"
+    
+    def _save_upload(self, job_id, image_data, filename):
+        """保存上传的图片，返回文件路径"""
+        extension = os.path.splitext(filename or '')[1].lower()
+        if extension not in IMAGE_EXTENSIONS:
+            raise JobRejectedError(415, f"不支持的图片类型: {filename}")
+        
+        os.makedirs(self.upload_dir, exist_ok=True)
+        path = os.path.join(self.upload_dir, f"{job_id}{extension}")
+        with open(path, 'wb') as f:
+            f.write(image_data)
+        return path
+    
+    def _resolve_output_path(self, job_id, output_path=None):
+        """
+        确定输出视频路径，只允许写入output_dir之内
+        
+        Args:
+            job_id: 任务ID，未指定output_path时用作文件名
+            output_path: 客户端指定的输出路径（相对output_dir）
+        
+        Returns:
+            输出视频的绝对路径
+        """
+        root = os.path.realpath(self.output_dir)
+        path = os.path.realpath(os.path.join(root, output_path or f"{job_id}.mp4"))
+        if os.path.commonpath([root, path]) != root or path == root:
+            raise JobRejectedError(400, f"output_path必须位于输出目录{self.output_dir}之内: {output_path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+    
+    def submit(self, image_path=None, image_data=None, filename=None, options=None):
+        """
+        提交一个任务
+        
+        Args:
+            image_path: 本地图片路径
+            image_data: 上传的图片字节（与image_path二选一）
+            filename: 上传图片的文件名，用于确定扩展名
+            options: 任务选项字典，output_path为输出视频路径（相对output_dir，不能指向目录之外），
+                description为已有描述（跳过LLM），priority为优先级，tenant为租户
+        
+        Returns:
+            任务信息字典
+        """
+        options = options or {}
+        if image_data is None and not image_path:
+            raise JobRejectedError(400, "缺少image_path或图片内容")
+        if image_data is None and not os.path.isfile(image_path):
+            raise JobRejectedError(400, f"图片文件不存在: {image_path}")
+        priority = options.get('priority')
+        if priority and priority not in self.pipeline.priority_classes:
+            raise JobRejectedError(400, f"未知的优先级: {priority}，可用: {', '.join(self.pipeline.priority_classes)}")
+        
+        job_id = uuid.uuid4().hex
+        output_path = self._resolve_output_path(job_id, options.get('output_path'))
+        upload_path = None
+        if image_data is not None:
+            upload_path = image_path = self._save_upload(job_id, image_data, filename)
+        
+        job = BatchJob(None, image_path, output_path, priority, options.get('tenant'))
+        if options.get('description'):
+            job.description = options['description']
+        
+        entry = {'id': job_id, 'job': job, 'submitted_at': time.time(), 'upload_path': upload_path}
+        # 检查未完成的任务数和登记任务在同一个锁内完成，并发提交时不会超过上限
+        with self._lock:
+            pending = sum(1 for other in self._jobs.values() if not other['job'].finished.is_set())
+            if pending >= self.max_pending_jobs:
+                self._counts['rejected'] += 1
+                rejected = True
+            else:
+                rejected = False
+                job.index = self._next_index
+                self._next_index += 1
+                self._jobs[job_id] = entry
+                self._counts['submitted'] += 1
+                self._evict_finished()
+        
+        if rejected:
+            if upload_path is not None:
+                os.remove(upload_path)
+            raise JobRejectedError(429, f"未完成的任务已达上限: {self.max_pending_jobs}")
+        
+        self.pipeline.submit(job)
+        logger.info(f"收到任务{job_id}: {image_path} -> {output_path}")
+        return self._job_info(entry)
+    
+    def _evict_finished(self):
+        """保留的已结束任务超过上限时，移除最早的记录及其上传的图片（需持有锁）"""
+        finished = [job_id for job_id, entry in self._jobs.items() if entry['job'].finished.is_set()]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished_jobs)]:
+            entry = self._jobs.pop(job_id)
+            if entry['upload_path'] and os.path.exists(entry['upload_path']):
+                os.remove(entry['upload_path'])
+    
+    def _job_info(self, entry):
+        """生成任务信息字典"""
+        job = entry['job']
+        if job.finished.is_set():
+            status = STATUS_SUCCEEDED if job.succeeded else STATUS_FAILED
+        elif job.start_time is None:
+            status = STATUS_QUEUED
+        else:
+            status = STATUS_RUNNING
+        
+        info = {
+            'id': entry['id'],
+            'status': status,
+            'stage': job.stage,
+            'priority': job.priority,
+            'tenant': job.tenant,
+            'trace_id': job.trace_id,
+            'image_path': job.image_path,
+            'output_path': job.output_path,
+            'submitted_at': entry['submitted_at'],
+            'description': job.description,
+            'error': str(job.error) if job.error is not None else None
+        }
+        if job.finished.is_set():
+            info['elapsed'] = job.end_time - entry['submitted_at']
+        if status == STATUS_SUCCEEDED:
+            info['video'] = f"/jobs/{entry['id']}/video"
+        return info
+    
+    def get_job(self, job_id):
+        """
+        查询任务信息
+        
+        Args:
+            job_id: 任务ID
+        
+        Returns:
+            任务信息字典，任务不存在时返回None
+        """
+        with self._lock:
+            entry = self._jobs.get(job_id)
+        return self._job_info(entry) if entry is not None else None
+    
+    def status(self):
+        """
+        获取服务器状态：各状态的任务数、流水线各阶段排队和处理中的任务数
+        
+        Returns:
+            状态字典
+        """
+        with self._lock:
+            entries = list(self._jobs.values())
+            counts = dict(self._counts)
+        
+        jobs = {STATUS_QUEUED: 0, STATUS_RUNNING: 0, STATUS_SUCCEEDED: 0, STATUS_FAILED: 0}
+        for entry in entries:
+            jobs[self._job_info(entry)['status']] += 1
+        
+        return {
+            'uptime': time.time() - self._started_at if self._started_at else 0.0,
+            'jobs': jobs,
+            'submitted': counts['submitted'],
+            'rejected': counts['rejected'],
+            'max_pending_jobs': self.max_pending_jobs,
+            'pipeline': self.pipeline.stats()
+        }
+    
+    def start(self):
+        """启动流水线和HTTP服务器"""
+        self.pipeline.start()
+        
+        self._server = ThreadingHTTPServer((self.host, self.port), _JobHandler)
+        self._server.daemon_threads = True
+        self._server.job_server = self
+        self.port = self._server.server_address[1]
+        self._started_at = time.time()
+        
+        self._thread = threading.Thread(target=self._server.serve_forever, name="job-server", daemon=True)
+        self._thread.start()
+        
+        logger.info(f"任务服务器已启动: {self.url}")
+        return self
+    
+    def stop(self):
+        """停止接收新任务，等待已提交的任务完成后停止流水线"""
+        server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        
+        logger.info("任务服务器已停止接收任务，等待进行中的任务完成")
+        self.pipeline.stop()
+    
+    def serve_forever(self):
+        """启动服务器并阻塞运行，直到收到Ctrl+C"""
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info("收到中断信号，正在停止任务服务器")
+        finally:
+            self.stop()
@@ -69,6 +69,65 @@ class Config:
             logger.error(f"未找到视频生成模型提供商配置: {provider}")
             raise ValueError(f"未找到视频生成模型提供商配置: {provider}")
     
+    def get_llm_hedge_config(self):
+        """获取LLM对冲请求配置"""
+        return self.config['llm'].get('hedge', {})
+    
+    def get_routing_config(self, kind):
+        """
+        获取提供商路由配置
+        
+        Args:
+            kind: 提供商类型，llm或video_generator
+            
+        Returns:
+            路由配置字典（enabled、providers、circuit_breaker）
+        """
+        routing = self.config.get('routing', {})
+        routing_config = dict(routing.get(kind, {}))
+        routing_config.setdefault('circuit_breaker', routing.get('circuit_breaker', {}))
+        return routing_config
+    
+    def get_image_config(self):
+        """获取图片处理配置"""
+        return self.config.get('image', {})
+    
+    def get_cache_config(self, name):
+        """
+        获取缓存配置
+        
+        Args:
+            name: 缓存名称，如description
+            
+        Returns:
+            缓存配置字典
+        """
+        return self.config.get('cache', {}).get(name, {})
+    
+    def get_journal_config(self):
+        """获取任务日志配置"""
+        return self.config.get('journal', {})
+    
+    def get_pipeline_config(self):
+        """获取批处理流水线配置"""
+        return self.config.get('pipeline', {})
+    
+    def get_long_form_config(self):
+        """获取长视频模式配置"""
+        return self.config.get('long_form', {})
+    
+    def get_metrics_config(self):
+        """获取指标配置"""
+        return self.config.get('metrics', {})
+    
+    def get_tracing_config(self):
+        """获取追踪配置"""
+        return self.config.get('tracing', {})
+    
+    def get_serve_config(self):
+        """获取服务模式配置"""
+        return self.config.get('serve', {})
+    
     def get_logging_config(self):
         """获取日志配置"""
         return self.config.get('logging', {})
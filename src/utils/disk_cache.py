@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from loguru import logger
+
+# 超出限制时一次淘汰到限制的这一比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+class DiskCache:
+    """
+    基于内容哈希的本地磁盘缓存
+    
+    每个条目由一个JSON元数据文件和可选的数据文件组成，按键的前两位分目录存放。
+    数据文件先写入，元数据文件最后原子写入，元数据存在即表示条目完整可见。
+    启动时扫描一次缓存目录建立内存中的LRU索引（按元数据文件修改时间排序），之后
+    命中和写入只更新索引；超出条目数或字节数限制时按LRU成批淘汰到限制的90%以下。
+    超过最长保存时间的条目视为未命中。
+    """
+    
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None, max_age=None, name='缓存', refresh=False):
+        """
+        初始化磁盘缓存
+        
+        Args:
+            cache_dir: 缓存目录
+            max_entries: 最多保存的条目数，为None时不限制
+            max_bytes: 最多占用的字节数，为None时不限制
+            max_age: 条目最长保存时间（秒），为None时不限制
+            name: 缓存名称，用于日志
+            refresh: 为True时不读取已有条目（总是未命中），只写入新条目
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.name = name
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        # 键 -> 条目占用的字节数，按访问时间从旧到新排列（只在设置了限制时维护）
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        if self.max_entries is not None or self.max_bytes is not None:
+            self._load_index()
+    
+    def _load_index(self):
+        """扫描缓存目录建立LRU索引，没有元数据文件的残留数据文件排在最前面优先淘汰"""
+        entries = {}
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if '.tmp' in name:
+                    continue
+                path = os.path.join(root, name)
+                key = name.split('.', 1)[0]
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = entries.setdefault(key, {'bytes': 0, 'atime': 0})
+                entry['bytes'] += stat.st_size
+                if name == f"{key}.json":
+                    entry['atime'] = stat.st_mtime
+        
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]['atime']):
+            self._index[key] = entry['bytes']
+            self._total_bytes += entry['bytes']
+        logger.info(f"{self.name}已有{len(self._index)}个条目，占用: {self._total_bytes}字节")
+    
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2])
+    
+    def meta_path(self, key):
+        """条目元数据文件路径"""
+        return os.path.join(self._entry_dir(key), f"{key}.json")
+    
+    def data_path(self, key, suffix):
+        """条目数据文件路径"""
+        return os.path.join(self._entry_dir(key), f"{key}{suffix}")
+    
+    def _entry_files(self, key):
+        """条目的所有文件"""
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return []
+        return [os.path.join(entry_dir, name) for name in os.listdir(entry_dir) if name.startswith(key)]
+    
+    def _remove(self, key):
+        """删除条目的所有文件"""
+        with self._lock:
+            self._total_bytes -= self._index.pop(key, 0)
+        for path in self._entry_files(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    def _entry_bytes(self, key):
+        """条目所有文件（不含临时文件）的总字节数"""
+        total = 0
+        for path in self._entry_files(key):
+            if '.tmp' in os.path.basename(path):
+                continue
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+    
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def get(self, key):
+        """
+        读取条目元数据
+        
+        Args:
+            key: 缓存键
+            
+        Returns:
+            元数据字典，未命中时返回None
+        """
+        if self.refresh:
+            self._record(False)
+            return None
+        
+        path = self.meta_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            self._record(False)
+            return None
+        except Exception as e:
+            logger.warning(f"{self.name}条目损坏，已删除: {key}，错误: {e}")
+            self._remove(key)
+            self._record(False)
+            return None
+        
+        if self.max_age is not None and time.time() - meta.get('created_at', 0) > self.max_age:
+            logger.info(f"{self.name}条目已过期，已删除: {key}")
+            self._remove(key)
+            self._record(False)
+            return None
+        
+        # 更新访问时间：索引用于本进程的LRU淘汰，文件修改时间用于下次启动时重建索引
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        
+        self._record(True)
+        return meta
+    
+    def put(self, key, meta):
+        """
+        写入条目元数据（数据文件需由调用方先写入data_path），写入后条目才可见并加入LRU索引
+        
+        Args:
+            key: 缓存键
+            meta: 元数据字典，会自动加入created_at
+        """
+        meta = dict(meta)
+        meta.setdefault('created_at', time.time())
+        
+        path = self.meta_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 每个写入方使用自己的临时文件，写完后原子替换
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        size = self._entry_bytes(key)
+        with self._lock:
+            self._total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            over = self._over_limit(len(self._index), self._total_bytes)
+        if over:
+            self.evict()
+    
+    def delete(self, key):
+        """删除条目"""
+        self._remove(key)
+    
+    def _over_limit(self, entries, total_bytes, ratio=1.0):
+        """条目数或字节数是否超过限制的ratio倍"""
+        return (
+            (self.max_entries is not None and entries > self.max_entries * ratio)
+            or (self.max_bytes is not None and total_bytes > self.max_bytes * ratio)
+        )
+    
+    def evict(self):
+        """超出条目数或字节数限制时，按LRU淘汰到限制的EVICT_TARGET_RATIO以下"""
+        with self._lock:
+            if not self._over_limit(len(self._index), self._total_bytes):
+                return
+            victims = []
+            entries, total_bytes = len(self._index), self._total_bytes
+            for key, size in self._index.items():
+                if not self._over_limit(entries, total_bytes, EVICT_TARGET_RATIO):
+                    break
+                victims.append(key)
+                entries -= 1
+                total_bytes -= size
+        
+        for key in victims:
+            self._remove(key)
+        if victims:
+            logger.info(f"{self.name}淘汰了{len(victims)}个条目，当前占用: {self._total_bytes}字节")
+    
+    def log_stats(self):
+        """输出命中统计"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        if total:
+            logger.info(f"{self.name}命中{hits}次，未命中{misses}次，命中率{hits / total:.1%}")
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from .tracing import get_tracer
+
+# 默认下载配置，可在config.yaml中按视频生成模型提供商通过download字段覆盖
+DEFAULT_DOWNLOAD_CONFIG = {
+    'chunk_size': 1024 * 1024,  # 读写缓冲区大小
+    'segment_size': 8 * 1024 * 1024,  # 分段下载时每段的大小
+    'max_workers': 4,  # 并行下载的分段数
+    'max_retries': 3  # 每段（或整个文件）的最大重试次数
+}
+
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+class DownloadError(RuntimeError):
+    """下载失败或下载的文件不完整"""
+    pass
+
+class Downloader:
+    """
+    文件下载器
+    
+    服务端支持Range请求时按分段并行下载，并在.part.json中记录已完成分段的字节数，
+    失败后再次下载会跳过已完成的分段；不支持Range时整体流式下载。
+    数据先写入.part临时文件，校验写入的字节数与Content-Length（分段下载时为各分段
+    记录的字节数之和与文件总大小）一致后再原子重命名为目标文件，
+    中断的下载不会留下看起来完整的文件。
+    """
+    
+    def __init__(self, session, config=None):
+        """
+        初始化下载器
+        
+        Args:
+            session: requests.Session实例
+            config: 下载配置字典，未指定的字段使用DEFAULT_DOWNLOAD_CONFIG
+        """
+        config_values = dict(DEFAULT_DOWNLOAD_CONFIG)
+        config_values.update(config or {})
+        
+        self.session = session
+        self.chunk_size = config_values['chunk_size']
+        self.segment_size = config_values['segment_size']
+        self.max_workers = config_values['max_workers']
+        self.max_retries = config_values['max_retries']
+    
+    def download(self, url, output_path):
+        """
+        下载文件
+        
+        Args:
+            url: 文件URL
+            output_path: 输出文件路径
+            
+        Returns:
+            下载的字节数
+        """
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        
+        part_path = f"{output_path}.part"
+        state_path = f"{output_path}.part.json"
+        start_time = time.time()
+        
+        total, etag = self._probe(url)
+        get_tracer().set_attributes(**{'download.mode': 'whole' if total is None else 'segmented'})
+        
+        if total is None:
+            logger.info("服务端不支持Range请求，使用单连接下载")
+            size = self._download_whole(url, part_path)
+        else:
+            size = self._download_segments(url, part_path, state_path, total, etag)
+        
+        os.replace(part_path, output_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        
+        elapsed = time.time() - start_time
+        speed = size / elapsed / 1024 / 1024 if elapsed > 0 else 0
+        logger.info(f"下载完成: {output_path}，大小: {size}字节，用时: {elapsed:.2f}秒，速度: {speed:.2f}MB/s")
+        return size
+    
+    def _probe(self, url):
+        """
+        探测服务端是否支持Range请求
+        
+        Returns:
+            (文件总大小, ETag)，不支持Range时总大小为None
+        """
+        response = self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True)
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                return None, None
+            
+            match = _CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+            if not match or match.group(3) == '*':
+                return None, None
+            return int(match.group(3)), response.headers.get('ETag')
+        finally:
+            response.close()
+    
+    def _stream_to(self, response, f, expected=None):
+        """将响应体以大缓冲区写入文件，返回写入的字节数"""
+        written = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            f.write(chunk)
+            written += len(chunk)
+        
+        if expected is not None and written != expected:
+            raise DownloadError(f"下载数据不完整: 期望{expected}字节，实际{written}字节")
+        return written
+    
+    def _download_whole(self, url, part_path):
+        """不支持Range时整体下载，失败后从头重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.session.get(url, stream=True) as response:
+                    response.raise_for_status()
+                    length = response.headers.get('Content-Length')
+                    expected = int(length) if length is not None else None
+                    with open(part_path, 'wb') as f:
+                        return self._stream_to(response, f, expected)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise DownloadError(f"下载失败: {e}") from e
+                logger.warning(f"下载失败，{2 ** attempt}秒后重试({attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(2 ** attempt)
+    
+    def _load_state(self, state_path, total, etag):
+        """
+        读取断点续传状态，文件大小或ETag不一致时丢弃
+        
+        Returns:
+            {分段序号: 已写入的字节数}
+        """
+        if not os.path.exists(state_path):
+            return {}
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('total') != total or state.get('etag') != etag:
+                return {}
+            return {int(index): int(written) for index, written in state.get('done', {}).items()}
+        except Exception:
+            return {}
+    
+    def _save_state(self, state_path, total, etag, done):
+        """原子地保存断点续传状态"""
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'total': total, 'etag': etag, 'done': {str(index): done[index] for index in sorted(done)}}, f)
+        os.replace(tmp_path, state_path)
+    
+    def _download_segments(self, url, part_path, state_path, total, etag):
+        """按分段并行下载，跳过之前已完成的分段"""
+        segments = [
+            (index, start, min(start + self.segment_size, total) - 1)
+            for index, start in enumerate(range(0, total, self.segment_size))
+        ]
+        
+        done = self._load_state(state_path, total, etag)
+        if not os.path.exists(part_path) or os.path.getsize(part_path) != total:
+            done = {}
+            with open(part_path, 'wb') as f:
+                f.truncate(total)
+        
+        # 记录的字节数与分段长度不一致的分段重新下载
+        pending = [segment for segment in segments if done.get(segment[0]) != segment[2] - segment[1] + 1]
+        if done:
+            logger.info(f"断点续传: 已完成{len(done)}/{len(segments)}段")
+        
+        lock = threading.Lock()
+        tracer = get_tracer()
+        # 分段在线程池中下载，显式指定父span
+        parent = tracer.current_span()
+        if parent is not None:
+            parent.set_attributes(**{'download.segments': len(segments), 'download.resumed_segments': len(done)})
+        
+        def fetch_segment(index, start, end):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    headers = {'Range': f'bytes={start}-{end}'}
+                    with self.session.get(url, headers=headers, stream=True) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            raise DownloadError(f"服务端未返回分段数据，状态码: {response.status_code}")
+                        with open(part_path, 'r+b') as f:
+                            f.seek(start)
+                            written = self._stream_to(response, f, end - start + 1)
+                    tracer.set_attributes(**{'http.status_code': response.status_code, 'download.attempts': attempt + 1})
+                    return written
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        raise
+                    logger.warning(f"分段{index}下载失败，{2 ** attempt}秒后重试: {e}")
+                    time.sleep(2 ** attempt)
+        
+        def fetch(segment):
+            index, start, end = segment
+            with tracer.span('download.segment', parent=parent, **{'download.segment': index, 'download.bytes': end - start + 1}):
+                written = fetch_segment(index, start, end)
+            
+            with lock:
+                done[index] = written
+                self._save_state(state_path, total, etag, done)
+        
+        workers = max(1, min(self.max_workers, len(pending)))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(fetch, segment) for segment in pending]:
+                    future.result()
+        except Exception as e:
+            raise DownloadError(f"下载失败，已完成{len(done)}/{len(segments)}段，可重新下载续传: {e}") from e
+        
+        # .part文件预先扩展到了总大小，按各分段实际写入的字节数校验
+        incomplete = [index for index, start, end in segments if done.get(index) != end - start + 1]
+        size = sum(done.get(index, 0) for index, _, _ in segments)
+        if incomplete or size != total:
+            raise DownloadError(f"下载的文件不完整: 期望{total}字节，各分段共写入{size}字节，未完成的分段: {incomplete}")
+        return size
@@ -0,0 +1,136 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from loguru import logger
+
+# 默认连接池配置，可在config.yaml中按提供商通过http字段覆盖
+DEFAULT_HTTP_CONFIG = {
+    'pool_size': 10,  # 每个主机的最大连接数
+    'retries': 3,  # 连接错误和5xx的最大重试次数
+    'backoff_factor': 0.5,  # 重试退避系数：0.5, 1, 2...秒
+    'status_forcelist': [500, 502, 503, 504],  # 需要重试的HTTP状态码
+    # 允许在读取失败和5xx时重试的方法：POST（如LLM请求、提交视频任务）不是幂等的，
+    # 传输层重试会重复付费，只有确认幂等的调用方才应在配置中加入POST
+    'retry_methods': ['GET', 'HEAD'],
+    'keep_alive': True,  # 是否复用连接
+    'connect_timeout': 10,  # 连接超时（秒）
+    'read_timeout': 300  # 读取超时（秒）
+}
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """带默认超时并统计连接复用情况的HTTPAdapter"""
+    
+    def __init__(self, timeout=None, **kwargs):
+        self.default_timeout = timeout
+        self._pools = []
+        self._pools_lock = threading.Lock()
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.default_timeout
+        
+        response = super().send(request, **kwargs)
+        
+        # 记录用到的连接池，用于统计新建连接数和请求数
+        pool = getattr(response.raw, '_pool', None)
+        if pool is not None:
+            with self._pools_lock:
+                if not any(existing is pool for existing in self._pools):
+                    self._pools.append(pool)
+        
+        return response
+    
+    def connection_stats(self):
+        """
+        获取连接统计
+        
+        Returns:
+            (新建连接数, 请求数)
+        """
+        with self._pools_lock:
+            pools = list(self._pools)
+        connections = sum(pool.num_connections for pool in pools)
+        requests_sent = sum(pool.num_requests for pool in pools)
+        return connections, requests_sent
+
+# 按提供商名称共享的Session
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def create_session(http_config=None):
+    """
+    创建带连接池和传输层重试的Session
+    
+    Args:
+        http_config: 连接池配置字典，未指定的字段使用DEFAULT_HTTP_CONFIG
+        
+    Returns:
+        requests.Session实例
+    """
+    config = dict(DEFAULT_HTTP_CONFIG)
+    config.update(http_config or {})
+    
+    retry = Retry(
+        total=config['retries'],
+        connect=config['retries'],
+        read=config['retries'],
+        status=config['retries'],
+        backoff_factor=config['backoff_factor'],
+        status_forcelist=config['status_forcelist'],
+        allowed_methods=frozenset(method.upper() for method in config['retry_methods']),
+        # 429由限流器根据Retry-After统一处理，传输层不重试
+        respect_retry_after_header=False,
+        # 重试耗尽后返回最后一次响应，由调用方的raise_for_status处理
+        raise_on_status=False
+    )
+    
+    adapter = PooledHTTPAdapter(
+        timeout=(config['connect_timeout'], config['read_timeout']),
+        pool_connections=config['pool_size'],
+        pool_maxsize=config['pool_size'],
+        max_retries=retry
+    )
+    
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    
+    if not config['keep_alive']:
+        session.headers['Connection'] = 'close'
+    
+    return session
+
+def get_session(name, http_config=None):
+    """
+    获取（必要时创建）按提供商共享的Session
+    
+    同一提供商的所有客户端共用一个连接池，首次创建时的配置生效。
+    
+    Args:
+        name: 提供商名称
+        http_config: 连接池配置字典
+        
+    Returns:
+        requests.Session实例
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = create_session(http_config)
+            _sessions[name] = session
+            logger.debug(f"已创建HTTP连接池: {name}")
+        return session
+
+def log_connection_stats():
+    """输出各提供商的连接复用统计"""
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    
+    for name, session in sessions:
+        adapter = session.get_adapter('https://')
+        connections, requests_sent = adapter.connection_stats()
+        if requests_sent:
+            reused = max(0, requests_sent - connections)
+            logger.info(f"{name} HTTP连接统计: 请求{requests_sent}次，新建连接{connections}个，复用连接{reused}次")
@@ -1,7 +1,101 @@
 import os
+import io
+import sys
+import time
+import multiprocessing
 import base64
-from PIL import Image
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from loguru import logger
+from .perceptual_hash import compute_perceptual_hash
+
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
+
+# 发送给LLM的图片编码格式及对应的媒体类型
+IMAGE_MEDIA_TYPES = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'PNG': 'image/png'
+}
+
+# EXIF方向标签及各方向值对应的旋转/翻转方式（PIL.Image中的常量名，PIL按需导入）
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSE_METHODS = {
+    2: 'FLIP_LEFT_RIGHT',
+    3: 'ROTATE_180',
+    4: 'FLIP_TOP_BOTTOM',
+    5: 'TRANSPOSE',
+    6: 'ROTATE_270',
+    7: 'TRANSVERSE',
+    8: 'ROTATE_90'
+}
+
+# 默认图片处理配置，对应config.yaml中的image部分
+DEFAULT_IMAGE_CONFIG = {
+    'max_size': 1024,
+    'format': 'JPEG',
+    'quality': 85,
+    'min_quality': 50,
+    'max_bytes': 1024 * 1024,
+    'reducing_gap': 2.0,
+    'process_workers': 0,
+    'perceptual_hash': None  # 在缩放后的图片上计算的感知哈希（dhash或phash），为None时不计算
+}
+
+class ImagePayload:
+    """
+    编码后的图片数据
+    
+    由缩放后的图片一次性编码得到，带有正确的媒体类型，
+    同一张图片的所有LLM调用共享同一个实例。
+    """
+    
+    def __init__(self, data, media_type, width, height):
+        """
+        初始化图片数据
+        
+        Args:
+            data: 编码后的图片字节
+            media_type: 媒体类型，如image/jpeg
+            width: 图片宽度
+            height: 图片高度
+        """
+        self.data = data
+        self.media_type = media_type
+        self.width = width
+        self.height = height
+        # 加载缩放和编码的耗时（秒），随对象从预处理子进程带回，由流水线记录为指标
+        self.load_seconds = None
+        self.encode_seconds = None
+        # 感知哈希（64位整数），用于识别近似重复的图片，未配置时为None
+        self.perceptual_hash = None
+        self._base64 = None
+        self._sha256 = None
+    
+    @property
+    def size(self):
+        """编码后的字节数"""
+        return len(self.data)
+    
+    @property
+    def base64(self):
+        """base64编码的字符串（首次访问时计算）"""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode('utf-8')
+        return self._base64
+    
+    @property
+    def data_url(self):
+        """data URL格式的图片，用于OpenAI格式的image_url"""
+        return f"data:{self.media_type};base64,{self.base64}"
+    
+    @property
+    def sha256(self):
+        """图片字节的SHA-256摘要"""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
 
 def load_image(image_path):
     """
@@ -13,6 +107,8 @@ def load_image(image_path):
     Returns:
         PIL.Image对象
     """
+    from PIL import Image
+    
     try:
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"图片文件不存在: {image_path}")
@@ -24,6 +120,23 @@ def load_image(image_path):
         logger.error(f"加载图片失败: {e}")
         raise
 
+def list_image_files(directory):
+    """
+    列出目录中的所有图片文件（不递归）
+    
+    Args:
+        directory: 图片目录路径
+        
+    Returns:
+        按文件名排序的图片路径列表
+    """
+    image_files = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            image_files.append(path)
+    return image_files
+
 def encode_image_base64(image_path):
     """
     将图片编码为base64字符串
@@ -54,6 +167,8 @@ def resize_image(image, max_size=1024):
     Returns:
         调整大小后的PIL.Image对象
     """
+    from PIL import Image
+    
     width, height = image.size
     
     # 如果图片尺寸已经小于最大尺寸，则不调整
@@ -74,6 +189,222 @@ def resize_image(image, max_size=1024):
     
     return resized_image
 
+def encode_image(image, image_format='JPEG', quality=85, max_bytes=None, min_quality=50):
+    """
+    将PIL图片编码为指定格式的字节数据，并尽量控制在字节预算内
+    
+    超出预算时先逐步降低质量，降到min_quality仍超出时再缩小尺寸。
+    
+    Args:
+        image: PIL.Image对象（通常是已缩放的图片）
+        image_format: 编码格式，JPEG、WEBP或PNG
+        quality: 初始编码质量
+        max_bytes: 字节预算，为None时不限制
+        min_quality: 允许降到的最低质量
+        
+    Returns:
+        ImagePayload对象
+    """
+    from PIL import Image
+    
+    image_format = image_format.upper()
+    if image_format == 'JPG':
+        image_format = 'JPEG'
+    if image_format not in IMAGE_MEDIA_TYPES:
+        raise ValueError(f"不支持的图片编码格式: {image_format}")
+    
+    # JPEG不支持透明通道和调色板模式
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    
+    while True:
+        current_quality = quality
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, quality=current_quality)
+            data = buffer.getvalue()
+            
+            if max_bytes is None or len(data) <= max_bytes or current_quality <= min_quality:
+                break
+            current_quality = max(min_quality, current_quality - 10)
+        
+        if max_bytes is None or len(data) <= max_bytes or min(image.size) <= 64:
+            break
+        
+        # 降低质量仍超出预算，缩小尺寸后重试
+        image = image.resize((int(image.width * 0.8), int(image.height * 0.8)), Image.LANCZOS)
+    
+    logger.info(f"图片已编码: {image_format}，质量: {current_quality}，尺寸: {image.size}，大小: {len(data)}字节")
+    return ImagePayload(data, IMAGE_MEDIA_TYPES[image_format], image.width, image.height)
+
+def scaled_size(width, height, max_size):
+    """
+    计算按最长边缩放到max_size后的尺寸（与resize_image一致，不放大）
+    
+    Args:
+        width: 原始宽度
+        height: 原始高度
+        max_size: 最大尺寸（宽或高）
+        
+    Returns:
+        (宽度, 高度)
+    """
+    if width <= max_size and height <= max_size:
+        return width, height
+    if width > height:
+        return max_size, int(height * max_size / width)
+    return int(width * max_size / height), max_size
+
+def load_image_scaled(image_path, max_size=1024, reducing_gap=2.0):
+    """
+    加载图片并缩放，解码时即缩小以减少耗时和内存
+    
+    JPEG通过draft模式让解码器直接输出1/2、1/4或1/8尺寸，其他格式先用reduce()
+    整数倍缩小，最后再用LANCZOS缩放到目标尺寸；为保证质量，预缩小后的尺寸
+    不小于目标尺寸的reducing_gap倍。按EXIF方向信息旋转图片，文件句柄在返回前关闭。
+    
+    Args:
+        image_path: 图片文件路径
+        max_size: 最大尺寸（宽或高）
+        reducing_gap: 预缩小后相对目标尺寸保留的倍数，为None时不预缩小
+        
+    Returns:
+        已加载到内存的PIL.Image对象
+    """
+    from PIL import Image
+    
+    try:
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"图片文件不存在: {image_path}")
+        
+        with Image.open(image_path) as image:
+            original_size = image.size
+            orientation = image.getexif().get(EXIF_ORIENTATION_TAG, 1)
+            target_size = scaled_size(image.width, image.height, max_size)
+            
+            if target_size != original_size and reducing_gap:
+                # 只对JPEG生效，其他格式忽略
+                image.draft('RGB', (int(target_size[0] * reducing_gap), int(target_size[1] * reducing_gap)))
+            
+            if target_size != image.size:
+                result = image.resize(target_size, Image.LANCZOS, reducing_gap=reducing_gap)
+            else:
+                result = image.copy()
+    except Exception as e:
+        logger.error(f"加载图片失败: {e}")
+        raise
+    
+    # EXIF方向信息作用在缩小后的图片上，旋转代价更小
+    method = EXIF_TRANSPOSE_METHODS.get(orientation)
+    if method is not None:
+        result = result.transpose(getattr(Image, method))
+    
+    logger.info(f"成功加载图片: {image_path}, 尺寸: {original_size} -> {result.size}")
+    return result
+
+def prepare_image_payload(image_path, image_config=None):
+    """
+    从图片文件生成发送给LLM的图片数据：加载（解码时缩小）、缩放并编码
+    
+    Args:
+        image_path: 图片文件路径
+        image_config: 图片处理配置字典（max_size、format、quality、min_quality、max_bytes、reducing_gap、perceptual_hash）
+        
+    Returns:
+        ImagePayload对象
+    """
+    config = dict(DEFAULT_IMAGE_CONFIG)
+    config.update(image_config or {})
+    
+    start_time = time.perf_counter()
+    image = load_image_scaled(image_path, config['max_size'], config['reducing_gap'])
+    loaded_at = time.perf_counter()
+    try:
+        payload = encode_image(
+            image,
+            image_format=config['format'],
+            quality=config['quality'],
+            max_bytes=config['max_bytes'],
+            min_quality=config['min_quality']
+        )
+        if config['perceptual_hash']:
+            payload.perceptual_hash = compute_perceptual_hash(image, config['perceptual_hash'])
+    finally:
+        image.close()
+    
+    payload.load_seconds = loaded_at - start_time
+    payload.encode_seconds = time.perf_counter() - loaded_at
+    return payload
+
+def _init_preprocess_worker():
+    """预处理子进程的初始化：只输出警告及以上的日志，详细日志由主进程记录"""
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+class ImagePreprocessor:
+    """
+    图片预处理器
+    
+    配置了process_workers时在进程池中并行执行prepare_image_payload，
+    解码和缩放不再受GIL限制；否则在调用线程中执行。
+    """
+    
+    def __init__(self, image_config=None):
+        """
+        初始化预处理器
+        
+        Args:
+            image_config: 图片处理配置字典，process_workers为进程数
+        """
+        self.image_config = dict(DEFAULT_IMAGE_CONFIG)
+        self.image_config.update(image_config or {})
+        self.workers = int(self.image_config.get('process_workers') or 0)
+        self._executor = None
+        if self.workers > 0:
+            # 用spawn启动子进程：流水线的线程已在运行，fork可能复制到被占用的锁
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_preprocess_worker
+            )
+            logger.info(f"图片预处理进程池已启动，进程数: {self.workers}")
+    
+    def submit(self, image_path):
+        """
+        提交一张图片的预处理
+        
+        Args:
+            image_path: 图片文件路径
+            
+        Returns:
+            Future对象，结果为ImagePayload
+        """
+        if self._executor is None:
+            raise RuntimeError("未启用预处理进程池")
+        return self._executor.submit(prepare_image_payload, image_path, self.image_config)
+    
+    def process(self, image_path):
+        """
+        预处理一张图片并等待结果
+        
+        Args:
+            image_path: 图片文件路径
+            
+        Returns:
+            ImagePayload对象
+        """
+        if self._executor is None:
+            return prepare_image_payload(image_path, self.image_config)
+        return self.submit(image_path).result()
+    
+    def close(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
 def save_image(image, output_path):
     """
     保存图片
@@ -0,0 +1,194 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from loguru import logger
+
+# 任务阶段
+STAGE_PENDING = 'pending'  # 尚未生成描述
+STAGE_DESCRIBED = 'described'  # 已生成描述
+STAGE_SUBMITTING = 'submitting'  # 已确定external_task_id，正在提交
+STAGE_SUBMITTED = 'submitted'  # 已获得task_id，正在渲染
+STAGE_RENDERED = 'rendered'  # 渲染完成，已获得视频URL
+STAGE_DONE = 'done'  # 视频已下载
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    image_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    description TEXT,
+    external_task_id TEXT,
+    task_id TEXT,
+    submitted_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    video_url TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+_FIELDS = (
+    'stage', 'description', 'external_task_id', 'task_id',
+    'submitted_at', 'attempts', 'video_url', 'error'
+)
+
+class JobJournal:
+    """
+    任务日志（SQLite）
+    
+    每个阶段完成后立即持久化任务的阶段、描述、可灵task_id/external_task_id等信息。
+    进程重启后可以跳过已完成的阶段，并通过任务ID重新关联仍在渲染中的任务，
+    避免重复提交和重复付费。
+    """
+    
+    def __init__(self, path):
+        """
+        初始化任务日志
+        
+        Args:
+            path: SQLite数据库文件路径
+        """
+        self.path = path
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        logger.info(f"任务日志已打开: {path}")
+    
+    @staticmethod
+    def make_job_id(image_path, output_path):
+        """
+        根据输入图片和输出路径生成确定性的任务ID
+        
+        图片的大小和修改时间也参与计算，替换了同名图片时会视为新任务。
+        
+        Args:
+            image_path: 输入图片路径
+            output_path: 输出视频路径
+            
+        Returns:
+            任务ID字符串
+        """
+        stat = os.stat(image_path)
+        raw = "\0".join([
+            os.path.abspath(image_path),
+            os.path.abspath(output_path),
+            str(stat.st_size),
+            str(stat.st_mtime_ns)
+        ])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+    
+    def start(self, job_id, image_path, output_path):
+        """
+        登记任务（已存在时保留原有记录）
+        
+        Args:
+            job_id: 任务ID
+            image_path: 输入图片路径
+            output_path: 输出视频路径
+            
+        Returns:
+            任务记录字典
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, image_path, output_path, stage, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, image_path, output_path, STAGE_PENDING, now, now)
+            )
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row)
+    
+    def reset(self, job_id, image_path, output_path):
+        """
+        重新登记任务，清空原有记录中的进度
+        
+        保留并递增原记录的提交次数，重新提交时生成新的external_task_id，
+        不会按旧的external_task_id关联到之前失败的任务。
+        
+        Args:
+            job_id: 任务ID
+            image_path: 输入图片路径
+            output_path: 输出视频路径
+            
+        Returns:
+            任务记录字典
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, image_path, output_path, stage, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET image_path = excluded.image_path, "
+                "output_path = excluded.output_path, stage = excluded.stage, description = NULL, "
+                "external_task_id = NULL, task_id = NULL, submitted_at = NULL, video_url = NULL, "
+                "error = NULL, attempts = attempts + 1, created_at = excluded.created_at, "
+                "updated_at = excluded.updated_at",
+                (job_id, image_path, output_path, STAGE_PENDING, now, now)
+            )
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row)
+    
+    def get(self, job_id):
+        """
+        读取任务记录
+        
+        Args:
+            job_id: 任务ID
+            
+        Returns:
+            任务记录字典，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def update(self, job_id, **fields):
+        """
+        更新任务记录
+        
+        Args:
+            job_id: 任务ID
+            **fields: 要更新的字段（stage、description、external_task_id、task_id、submitted_at、attempts、video_url、error）
+        """
+        unknown = set(fields) - set(_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的任务日志字段: {', '.join(sorted(unknown))}")
+        
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+def create_job_journal(journal_config):
+    """
+    根据配置创建任务日志
+    
+    Args:
+        journal_config: 任务日志配置字典（enabled、path）
+        
+    Returns:
+        JobJournal实例，未启用时返回None
+    """
+    if not journal_config.get('enabled', True):
+        return None
+    return JobJournal(journal_config.get('path', 'cache/jobs.sqlite3'))
@@ -0,0 +1,344 @@
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from loguru import logger
+
+# 默认指标配置，对应config.yaml中的metrics部分
+DEFAULT_METRICS_CONFIG = {
+    'enabled': True,  # 是否输出和写出指标（记录本身开销很小，始终进行）
+    'window': 2048,  # 计算分位数时保留的最近样本数（每组标签）
+    'prometheus_file': None,  # 批处理结束时写出的Prometheus文本格式文件
+    'summary_file': None  # 批处理结束时写出的JSON摘要文件
+}
+
+# 耗时直方图的默认桶边界（秒），覆盖从毫秒级的图片处理到数分钟的视频渲染
+DEFAULT_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# 字节数直方图的默认桶边界
+DEFAULT_BYTES_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+
+# 汇总时输出的分位数
+SUMMARY_QUANTILES = (0.5, 0.95, 0.99)
+
+def _label_key(labels):
+    """标签字典转换为可哈希的键（按标签名排序）"""
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key, extra=None):
+    """生成Prometheus格式的标签字符串"""
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def _format_number(value):
+    """Prometheus格式的数值"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _quantile(sorted_values, q):
+    """已排序样本的分位数（最近秩）"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class Counter:
+    """单调递增的计数器，按标签分别计数"""
+    
+    TYPE = 'counter'
+    
+    def __init__(self, name, description):
+        """
+        初始化计数器
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+        """
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1, **labels):
+        """
+        增加计数
+        
+        Args:
+            amount: 增加的数量
+            **labels: 标签
+        """
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def prometheus_lines(self):
+        """Prometheus文本格式的样本行"""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_number(value)}" for key, value in items]
+    
+    def summary(self):
+        """JSON摘要：每组标签的计数"""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [{'labels': dict(key), 'value': value} for key, value in items]
+
+class Histogram:
+    """
+    直方图，按标签分别统计
+    
+    桶计数、总和和样本数用于Prometheus导出；另外保留最近window个样本，
+    用于计算p50/p95/p99等分位数。
+    """
+    
+    TYPE = 'histogram'
+    
+    def __init__(self, name, description, buckets=DEFAULT_SECONDS_BUCKETS, window=2048):
+        """
+        初始化直方图
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+            buckets: 桶的上边界（递增）
+            window: 计算分位数时保留的最近样本数
+        """
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, **labels):
+        """
+        记录一个样本
+        
+        Args:
+            value: 样本值
+            **labels: 标签
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {
+                    'buckets': [0] * (len(self.buckets) + 1),
+                    'count': 0,
+                    'sum': 0.0,
+                    'samples': deque(maxlen=self.window)
+                }
+                self._series[key] = series
+            series['buckets'][bisect.bisect_left(self.buckets, value)] += 1
+            series['count'] += 1
+            series['sum'] += value
+            series['samples'].append(value)
+    
+    @contextmanager
+    def time(self, **labels):
+        """统计代码块的耗时（秒），代码块抛出异常时同样记录"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+    
+    def prometheus_lines(self):
+        """Prometheus文本格式的样本行（累积桶计数、_sum、_count）"""
+        lines = []
+        with self._lock:
+            items = sorted((key, list(series['buckets']), series['sum'], series['count'])
+                           for key, series in self._series.items())
+        for key, buckets, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), buckets):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(float(total))}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+    
+    def summary(self):
+        """JSON摘要：每组标签的样本数、总和、平均值和分位数"""
+        with self._lock:
+            items = sorted((key, series['count'], series['sum'], sorted(series['samples']))
+                           for key, series in self._series.items())
+        result = []
+        for key, count, total, samples in items:
+            entry = {'labels': dict(key), 'count': count, 'sum': total, 'mean': total / count if count else None}
+            for q in SUMMARY_QUANTILES:
+                entry[f"p{int(q * 100)}"] = _quantile(samples, q)
+            entry['max'] = samples[-1] if samples else None
+            result.append(entry)
+        return result
+
+class MetricsRegistry:
+    """
+    指标注册表
+    
+    同名指标只创建一次，各模块通过get_metrics()取得同一个注册表记录指标，
+    汇总后导出为Prometheus文本格式或JSON摘要。
+    """
+    
+    def __init__(self, config=None):
+        """
+        初始化注册表
+        
+        Args:
+            config: 指标配置字典，见DEFAULT_METRICS_CONFIG
+        """
+        self.configure(config)
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def configure(self, config=None):
+        """
+        更新指标配置（已创建的直方图保持原有的分位数窗口）
+        
+        Args:
+            config: 指标配置字典
+        """
+        config = dict(DEFAULT_METRICS_CONFIG, **(config or {}))
+        self.enabled = config['enabled']
+        self.window = config['window']
+        self.prometheus_file = config['prometheus_file']
+        self.summary_file = config['summary_file']
+    
+    def _get_or_create(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"指标{name}已注册为{metric.TYPE}")
+            return metric
+    
+    def counter(self, name, description):
+        """
+        获取（必要时创建）计数器
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+        
+        Returns:
+            Counter实例
+        """
+        return self._get_or_create(Counter, name, description)
+    
+    def histogram(self, name, description, buckets=DEFAULT_SECONDS_BUCKETS):
+        """
+        获取（必要时创建）直方图
+        
+        Args:
+            name: 指标名称
+            description: 指标说明
+            buckets: 桶的上边界
+        
+        Returns:
+            Histogram实例
+        """
+        return self._get_or_create(Histogram, name, description, buckets=buckets, window=self.window)
+    
+    def render_prometheus(self):
+        """
+        导出为Prometheus文本格式
+        
+        Returns:
+            文本内容
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.prometheus_lines())
+        return '\n'.join(lines) + '\n'
+    
+    def summary(self):
+        """
+        导出为JSON摘要
+        
+        Returns:
+            {指标名称: 各组标签的统计列表}
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return {metric.name: metric.summary() for metric in metrics}
+    
+    def write_files(self):
+        """按配置写出Prometheus文本文件和JSON摘要文件（原子替换）"""
+        if not self.enabled:
+            return
+        
+        for path, content in (
+            (self.prometheus_file, self.render_prometheus),
+            (self.summary_file, lambda: json.dumps(self.summary(), ensure_ascii=False, indent=2))
+        ):
+            if not path:
+                continue
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(content())
+            os.replace(temp_path, path)
+            logger.info(f"指标已写入: {path}")
+    
+    def log_summary(self):
+        """在日志中输出各耗时直方图的分位数，便于定位吞吐量损失在哪个阶段"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            histograms = sorted(
+                (metric for metric in self._metrics.values() if isinstance(metric, Histogram)),
+                key=lambda metric: metric.name
+            )
+        for histogram in histograms:
+            for entry in histogram.summary():
+                labels = ','.join(f"{name}={value}" for name, value in entry['labels'].items())
+                logger.info(
+                    f"指标 {histogram.name}{{{labels}}}: 次数{entry['count']}，平均{entry['mean']:.3f}，"
+                    f"p50 {entry['p50']:.3f}，p95 {entry['p95']:.3f}，p99 {entry['p99']:.3f}，最大{entry['max']:.3f}"
+                )
+
+# 进程内共享的指标注册表
+_registry = MetricsRegistry()
+
+def get_metrics():
+    """
+    获取进程内共享的指标注册表
+    
+    Returns:
+        MetricsRegistry实例
+    """
+    return _registry
+
+def configure_metrics(config=None):
+    """
+    按配置设置共享的指标注册表
+    
+    Args:
+        config: 指标配置字典
+    
+    Returns:
+        MetricsRegistry实例
+    """
+    _registry.configure(config)
+    return _registry
@@ -0,0 +1,167 @@
+import math
+import threading
+
+# 支持的感知哈希算法（均为64位）
+PERCEPTUAL_HASH_METHODS = ('dhash', 'phash')
+
+# pHash的缩放尺寸和保留的低频系数边长
+PHASH_IMAGE_SIZE = 32
+PHASH_HASH_SIZE = 8
+
+# pHash的一维DCT系数表：_DCT_TABLE[u][x] = cos((2x + 1) * u * pi / 2N)，只保留低频部分
+_DCT_TABLE = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * PHASH_IMAGE_SIZE)) for x in range(PHASH_IMAGE_SIZE)]
+    for u in range(PHASH_HASH_SIZE)
+]
+
+def _grayscale_pixels(image, width, height):
+    """缩放为指定尺寸的灰度图，返回逐行排列的像素值"""
+    from PIL import Image
+    
+    return image.convert('L').resize((width, height), Image.BILINEAR).tobytes()
+
+def dhash(image):
+    """
+    差值哈希：缩放为9x8的灰度图，逐行比较相邻像素的亮度
+    
+    Args:
+        image: PIL.Image对象（通常是已缩放的图片）
+    
+    Returns:
+        64位整数
+    """
+    pixels = _grayscale_pixels(image, 9, 8)
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def phash(image):
+    """
+    感知哈希：缩放为32x32的灰度图做二维DCT，取左上角8x8低频系数与其中位数比较
+    
+    对亮度、对比度调整和轻微的位移、重新压缩比dhash更稳定，计算量略大。
+    
+    Args:
+        image: PIL.Image对象（通常是已缩放的图片）
+    
+    Returns:
+        64位整数
+    """
+    size = PHASH_IMAGE_SIZE
+    pixels = _grayscale_pixels(image, size, size)
+    
+    # 二维DCT可分离：先对每行做一维DCT（只算低频），再对结果的每列做一维DCT
+    rows = [
+        [sum(coef * pixel for coef, pixel in zip(table, pixels[y * size:(y + 1) * size])) for table in _DCT_TABLE]
+        for y in range(size)
+    ]
+    coefficients = [
+        sum(table[y] * rows[y][u] for y in range(size))
+        for table in _DCT_TABLE
+        for u in range(PHASH_HASH_SIZE)
+    ]
+    
+    # 直流分量只反映整体亮度，不参与中位数计算
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+def compute_perceptual_hash(image, method='dhash'):
+    """
+    计算图片的感知哈希
+    
+    Args:
+        image: PIL.Image对象
+        method: dhash或phash
+    
+    Returns:
+        64位整数
+    """
+    if method == 'dhash':
+        return dhash(image)
+    if method == 'phash':
+        return phash(image)
+    raise ValueError(f"不支持的感知哈希算法: {method}，可选: {', '.join(PERCEPTUAL_HASH_METHODS)}")
+
+def hamming_distance(a, b):
+    """两个哈希值之间不同的位数"""
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """
+    按汉明距离组织的BK树，用于查找与给定哈希距离不超过阈值的所有条目
+    
+    每个节点的子节点按与该节点的距离分组，查询时由三角不等式只需访问
+    距离落在[d - r, d + r]内的子树，不必与所有已有哈希逐一比较。
+    """
+    
+    def __init__(self):
+        # 节点为[哈希, 该哈希下的条目列表, {距离: 子节点}]
+        self._root = None
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return self._size
+    
+    def add(self, value, item):
+        """
+        加入一个条目（相同哈希的条目放在同一个节点中）
+        
+        Args:
+            value: 哈希值
+            item: 关联的条目
+        """
+        with self._lock:
+            self._size += 1
+            if self._root is None:
+                self._root = [value, [item], {}]
+                return
+            
+            node = self._root
+            while True:
+                distance = hamming_distance(value, node[0])
+                if distance == 0:
+                    node[1].append(item)
+                    return
+                child = node[2].get(distance)
+                if child is None:
+                    node[2][distance] = [value, [item], {}]
+                    return
+                node = child
+    
+    def search(self, value, max_distance):
+        """
+        查找与value的汉明距离不超过max_distance的所有条目
+        
+        Args:
+            value: 哈希值
+            max_distance: 最大汉明距离
+        
+        Returns:
+            [(距离, 条目)]列表，按距离从小到大排列
+        """
+        results = []
+        with self._lock:
+            stack = [self._root] if self._root is not None else []
+            while stack:
+                node = stack.pop()
+                distance = hamming_distance(value, node[0])
+                if distance <= max_distance:
+                    results.extend((distance, item) for item in node[1])
+                for child_distance, child in node[2].items():
+                    if distance - max_distance <= child_distance <= distance + max_distance:
+                        stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+    
+    def clear(self):
+        """清空所有条目"""
+        with self._lock:
+            self._root = None
+            self._size = 0
@@ -0,0 +1,105 @@
+import importlib
+from loguru import logger
+
+# 内置提供商：提供商类型 -> "模块:类名"，只有被选中时才导入对应模块
+BUILTIN_PROVIDERS = {
+    'llm': {
+        'openai': 'llm.llm_client:OpenAIClient',
+        'claude': 'llm.llm_client:ClaudeClient',
+        'openai-compatible': 'llm.openai_compatible_client:OpenAICompatibleClient'
+    },
+    'video_generator': {
+        'kling': 'video.kling_generator:KlingGenerator'
+    }
+}
+
+# 第三方提供商通过以下entry point组注册，名称为提供商类型，值为"模块:类名"
+ENTRY_POINT_GROUPS = {
+    'llm': 'image_to_video.llm_providers',
+    'video_generator': 'image_to_video.video_generators'
+}
+
+# 配置中没有type字段时，按name中的关键字推断类型（兼容旧配置，按顺序匹配）
+LEGACY_NAME_RULES = {
+    'llm': [
+        ('compatible', 'openai-compatible'),
+        ('openai', 'openai'),
+        ('claude', 'claude'),
+        ('anthropic', 'claude')
+    ],
+    'video_generator': [
+        ('可灵', 'kling'),
+        ('kling', 'kling')
+    ]
+}
+
+# 提供商种类的中文名称，用于日志和错误信息
+KIND_LABELS = {
+    'llm': 'LLM',
+    'video_generator': '视频生成模型'
+}
+
+def get_provider_type(kind, config):
+    """
+    获取提供商配置对应的提供商类型
+    
+    Args:
+        kind: 提供商种类，llm或video_generator
+        config: 提供商配置字典
+    
+    Returns:
+        提供商类型字符串，无法确定时返回None
+    """
+    provider_type = config.get('type')
+    if provider_type:
+        return provider_type.lower()
+    
+    name = config.get('name', '').lower()
+    for keyword, legacy_type in LEGACY_NAME_RULES.get(kind, []):
+        if keyword in name:
+            return legacy_type
+    return None
+
+def _find_entry_point(kind, provider_type):
+    """在已安装的插件中查找提供商，返回"模块:类名"或None"""
+    # importlib.metadata导入较慢，只在内置提供商中找不到时使用
+    from importlib.metadata import entry_points
+    
+    for entry_point in entry_points(group=ENTRY_POINT_GROUPS[kind]):
+        if entry_point.name.lower() == provider_type:
+            return entry_point.value
+    return None
+
+def _import_class(target):
+    """导入"模块:类名"指定的类"""
+    module_name, _, class_name = target.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+def load_provider_class(kind, config):
+    """
+    根据提供商配置加载提供商类
+    
+    查找顺序：配置中的class字段（"模块:类名"）、内置提供商、entry point插件。
+    
+    Args:
+        kind: 提供商种类，llm或video_generator
+        config: 提供商配置字典
+    
+    Returns:
+        提供商类
+    """
+    label = KIND_LABELS[kind]
+    target = config.get('class')
+    provider_type = get_provider_type(kind, config)
+    
+    if not target and provider_type:
+        target = BUILTIN_PROVIDERS[kind].get(provider_type) or _find_entry_point(kind, provider_type)
+    
+    if not target:
+        name = config.get('name', '')
+        logger.error(f"不支持的{label}类型: {provider_type or name}")
+        raise ValueError(f"不支持的{label}类型: {provider_type or name}")
+    
+    logger.debug(f"加载{label}提供商: {target}")
+    return _import_class(target)
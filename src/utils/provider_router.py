@@ -0,0 +1,251 @@
+import time
+import threading
+from collections import deque
+from loguru import logger
+
+# 熔断器的默认配置
+DEFAULT_CIRCUIT_BREAKER_CONFIG = {
+    'failure_threshold': 5,  # 连续失败次数达到该值时熔断
+    'error_rate_threshold': 0.5,  # 滚动窗口内错误率达到该值时熔断
+    'window': 50,  # 滚动窗口的请求数
+    'min_requests': 10,  # 窗口内请求数达到该值后才按错误率判断
+    'open_seconds': 30,  # 熔断后多久放行一个探测请求
+    'max_open_seconds': 600  # 探测失败后冷却时间翻倍的上限
+}
+
+# 熔断器状态
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+class NoHealthyProviderError(RuntimeError):
+    """所有提供商都处于熔断状态，或全部请求失败"""
+    pass
+
+class CircuitBreaker:
+    """
+    单个提供商的熔断器
+    
+    记录最近请求的成功/失败和延迟。连续失败过多或滚动错误率过高时熔断（open），
+    熔断期间直接跳过该提供商；冷却时间到后放行一个探测请求（half_open），
+    探测成功则恢复，失败则加倍冷却时间后继续熔断。
+    """
+    
+    def __init__(self, name, config=None):
+        """
+        初始化熔断器
+        
+        Args:
+            name: 提供商名称
+            config: 熔断器配置字典（failure_threshold、error_rate_threshold、window、
+                min_requests、open_seconds、max_open_seconds）
+        """
+        cfg = dict(DEFAULT_CIRCUIT_BREAKER_CONFIG)
+        cfg.update(config or {})
+        
+        self.name = name
+        self.failure_threshold = cfg['failure_threshold']
+        self.error_rate_threshold = cfg['error_rate_threshold']
+        self.min_requests = cfg['min_requests']
+        self.open_seconds = cfg['open_seconds']
+        self.max_open_seconds = cfg['max_open_seconds']
+        
+        self.state = STATE_CLOSED
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=cfg['window'])  # (是否成功, 延迟)
+        self._consecutive_failures = 0
+        self._cooldown = self.open_seconds
+        self._open_until = 0
+        self._probing = False
+    
+    def allow(self):
+        """
+        判断是否可以向该提供商发送请求
+        
+        熔断冷却结束后只放行一个探测请求，探测结束前其他请求仍被跳过。
+        
+        Returns:
+            是否可以发送
+        """
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.time() >= self._open_until:
+                self.state = STATE_HALF_OPEN
+                self._probing = False
+            if self.state == STATE_HALF_OPEN and not self._probing:
+                self._probing = True
+                logger.info(f"提供商{self.name}熔断冷却结束，放行探测请求")
+                return True
+            return False
+    
+    def record_success(self, latency):
+        """
+        记录一次成功的请求
+        
+        Args:
+            latency: 请求延迟（秒），为None时不计入延迟统计
+        """
+        with self._lock:
+            self._outcomes.append((True, latency))
+            self._consecutive_failures = 0
+            if self.state != STATE_CLOSED:
+                logger.info(f"提供商{self.name}探测成功，恢复使用")
+                self.state = STATE_CLOSED
+                self._cooldown = self.open_seconds
+                self._outcomes.clear()
+            self._probing = False
+    
+    def record_failure(self, latency, error=None):
+        """
+        记录一次失败的请求，必要时熔断
+        
+        Args:
+            latency: 请求延迟（秒），为None时不计入延迟统计
+            error: 失败原因
+        """
+        with self._lock:
+            self._outcomes.append((False, latency))
+            self._consecutive_failures += 1
+            
+            if self.state == STATE_HALF_OPEN:
+                # 探测失败，加倍冷却时间
+                self._cooldown = min(self._cooldown * 2, self.max_open_seconds)
+                self._open(f"探测请求失败: {error}")
+            elif self.state == STATE_CLOSED:
+                error_rate = self._error_rate()
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._open(f"连续失败{self._consecutive_failures}次: {error}")
+                elif len(self._outcomes) >= self.min_requests and error_rate >= self.error_rate_threshold:
+                    self._open(f"最近{len(self._outcomes)}次请求错误率{error_rate:.0%}: {error}")
+            self._probing = False
+    
+    def release(self):
+        """结束一次不计入健康状况的请求，只释放半开状态下的探测名额，不改变失败计数和请求记录"""
+        with self._lock:
+            self._probing = False
+    
+    def _open(self, reason):
+        """熔断（调用方需持有锁）"""
+        self.state = STATE_OPEN
+        self._open_until = time.time() + self._cooldown
+        logger.warning(f"提供商{self.name}已熔断，{self._cooldown:.0f}秒后探测恢复，原因: {reason}")
+    
+    def _error_rate(self):
+        """滚动窗口内的错误率（调用方需持有锁）"""
+        if not self._outcomes:
+            return 0.0
+        failures = sum(1 for ok, _ in self._outcomes if not ok)
+        return failures / len(self._outcomes)
+    
+    def snapshot(self):
+        """
+        获取健康状况
+        
+        Returns:
+            包含state、requests、error_rate、p50_latency的字典
+        """
+        with self._lock:
+            latencies = sorted(latency for ok, latency in self._outcomes if ok and latency is not None)
+            return {
+                'state': self.state,
+                'requests': len(self._outcomes),
+                'error_rate': self._error_rate(),
+                'p50_latency': latencies[len(latencies) // 2] if latencies else None
+            }
+
+class ProviderRouter:
+    """
+    按优先级在多个提供商之间路由请求
+    
+    依次尝试优先级列表中未熔断的提供商，失败时记录并换下一个，
+    因此处于故障中的提供商在熔断后只会带来毫秒级的开销，而不是每个任务一次完整的超时。
+    """
+    
+    def __init__(self, kind, names, breaker_config=None):
+        """
+        初始化路由器
+        
+        Args:
+            kind: 提供商类型，用于日志，如"LLM"
+            names: 按优先级排列的提供商名称列表
+            breaker_config: 熔断器配置字典
+        """
+        if not names:
+            raise ValueError(f"{kind}路由至少需要一个提供商")
+        
+        self.kind = kind
+        self.names = list(names)
+        self.breakers = {name: CircuitBreaker(name, breaker_config) for name in self.names}
+    
+    def candidates(self):
+        """
+        按优先级依次给出可以尝试的提供商
+        
+        惰性判断，只有轮到某个提供商时才会占用它的探测名额。
+        
+        Yields:
+            提供商名称
+        """
+        for name in self.names:
+            if self.breakers[name].allow():
+                yield name
+            else:
+                logger.debug(f"跳过已熔断的{self.kind}提供商: {name}")
+    
+    def call(self, func, neutral_errors=()):
+        """
+        依次在可用的提供商上调用func，直到成功
+        
+        Args:
+            func: 以提供商名称为参数的函数
+            neutral_errors: 不计入提供商健康状况的异常类型（如请求内容导致的失败），
+                遇到时直接抛出，不再尝试其他提供商
+        
+        Returns:
+            (提供商名称, func的返回值)
+        """
+        last_error = None
+        for name in self.candidates():
+            start_time = time.time()
+            try:
+                result = func(name)
+            except neutral_errors:
+                self.breakers[name].release()
+                raise
+            except Exception as e:
+                self.breakers[name].record_failure(time.time() - start_time, e)
+                logger.warning(f"{self.kind}提供商{name}请求失败，尝试下一个提供商: {e}")
+                last_error = e
+                continue
+            
+            self.breakers[name].record_success(time.time() - start_time)
+            return name, result
+        
+        if last_error is None:
+            raise NoHealthyProviderError(f"所有{self.kind}提供商均已熔断: {', '.join(self.names)}")
+        raise NoHealthyProviderError(f"所有{self.kind}提供商均请求失败，最后的错误: {last_error}") from last_error
+    
+    def record(self, name, latency, error=None):
+        """
+        记录在指定提供商上完成的请求（不经过call发出的请求，如等待渲染结果）
+        
+        Args:
+            name: 提供商名称
+            latency: 请求延迟（秒），为None时只记录成功或失败，不计入延迟统计
+            error: 失败时的异常，成功时为None
+        """
+        if error is None:
+            self.breakers[name].record_success(latency)
+        else:
+            self.breakers[name].record_failure(latency, error)
+    
+    def log_stats(self):
+        """输出各提供商的健康状况"""
+        for name in self.names:
+            health = self.breakers[name].snapshot()
+            p50 = f"{health['p50_latency']:.2f}秒" if health['p50_latency'] is not None else "-"
+            logger.info(
+                f"{self.kind}提供商{name}: 状态{health['state']}，最近{health['requests']}次请求"
+                f"错误率{health['error_rate']:.0%}，P50延迟{p50}"
+            )
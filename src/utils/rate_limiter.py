@@ -0,0 +1,253 @@
+import time
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from loguru import logger
+
+# 默认限流配置，可在config.yaml中按提供商通过rate_limit字段覆盖
+DEFAULT_RATE_LIMIT_CONFIG = {
+    'rpm': None,  # 每分钟请求数上限，为None时不限速
+    'burst': None,  # 令牌桶容量，默认为每秒速率，至少为1
+    'max_in_flight': None,  # 最大并发数，为None时不限制
+    'max_retries': 5,  # 被限流（429）时的最大重试次数
+    'backoff': 2,  # 没有Retry-After时的初始退避时间（秒）
+    'min_rate_factor': 0.2,  # 自适应降速时速率的下限（相对配置值）
+    'recover_after': 20  # 连续成功多少次后恢复一级速率或并发数
+}
+
+def parse_retry_after(response):
+    """
+    解析响应的Retry-After头
+    
+    Args:
+        response: requests.Response对象
+        
+    Returns:
+        需要等待的秒数，没有或无法解析时返回None
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class ProviderGovernor:
+    """
+    提供商级别的限流和并发控制
+    
+    令牌桶限制每分钟请求数，可调整上限的计数信号量限制并发数。
+    被限流时按Retry-After暂停发放令牌并乘性降低速率（或并发上限），
+    之后每连续成功recover_after次逐步恢复，使持续吞吐量稳定在限制之下。
+    """
+    
+    def __init__(self, name, config=None):
+        """
+        初始化限流器
+        
+        Args:
+            name: 提供商名称，用于日志
+            config: 限流配置字典，未指定的字段使用DEFAULT_RATE_LIMIT_CONFIG
+        """
+        config_values = dict(DEFAULT_RATE_LIMIT_CONFIG)
+        config_values.update(config or {})
+        
+        self.name = name
+        self.max_retries = config_values['max_retries']
+        self.backoff = config_values['backoff']
+        self.min_rate_factor = config_values['min_rate_factor']
+        self.recover_after = config_values['recover_after']
+        
+        # 令牌桶
+        rpm = config_values['rpm']
+        self.configured_rate = rpm / 60 if rpm else None
+        self.rate = self.configured_rate
+        self.capacity = config_values['burst'] or max(1.0, self.rate or 1.0)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        
+        # 并发控制
+        self.configured_limit = config_values['max_in_flight']
+        self.limit = self.configured_limit
+        self.in_flight = 0
+        
+        self._successes = 0
+        self._lock = threading.Lock()
+        self._slot_available = threading.Condition(self._lock)
+    
+    def wait_for_token(self):
+        """阻塞直到可以发送下一个请求"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                    self._last_refill = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            
+            time.sleep(wait)
+    
+    def acquire_slot(self):
+        """占用一个并发名额，达到上限时阻塞"""
+        with self._slot_available:
+            while self.limit is not None and self.in_flight >= self.limit:
+                self._slot_available.wait()
+            self.in_flight += 1
+    
+    def release_slot(self):
+        """释放并发名额"""
+        with self._slot_available:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._slot_available.notify()
+    
+    @contextmanager
+    def request(self):
+        """在一个请求期间占用并发名额和一个令牌"""
+        self.acquire_slot()
+        try:
+            self.wait_for_token()
+            yield
+        finally:
+            self.release_slot()
+    
+    def on_success(self):
+        """记录一次成功请求，连续成功足够多次后逐步恢复速率和并发上限"""
+        with self._slot_available:
+            self._successes += 1
+            if self._successes < self.recover_after:
+                return
+            self._successes = 0
+            
+            if self.rate is not None and self.rate < self.configured_rate:
+                self.rate = min(self.configured_rate, self.rate + self.configured_rate * 0.1)
+                logger.info(f"{self.name}限流速率恢复到每分钟{self.rate * 60:.1f}次")
+            # 未配置并发上限时，由配额错误得出的上限没有恢复的终点，每次放宽一级直到再次触发配额错误
+            if self.limit is not None and (self.configured_limit is None or self.limit < self.configured_limit):
+                self.limit += 1
+                self._slot_available.notify()
+                logger.info(f"{self.name}并发上限恢复到{self.limit}")
+    
+    def on_throttled(self, retry_after=None, attempt=0, quota=False):
+        """
+        记录一次被限流，暂停发放令牌并降低速率或并发上限
+        
+        Args:
+            retry_after: 服务端要求的等待时间（秒），为None时按退避时间等待
+            attempt: 当前重试次数，用于计算退避时间
+            quota: 是否为并发配额限制（降低并发上限而不是速率）
+        """
+        delay = retry_after if retry_after is not None else self.backoff * (2 ** attempt)
+        
+        with self._lock:
+            self._successes = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            
+            if quota:
+                # 当前占用数（不含被拒绝的这个）即为账户实际可用的并发数；未配置并发上限时以此作为上限
+                available = self.in_flight - 1
+                self.limit = max(1, available if self.limit is None else min(self.limit, available))
+                logger.warning(f"{self.name}并发配额已满，并发上限调整为{self.limit}，{delay:.1f}秒后重试")
+            elif self.rate is not None:
+                self.rate = max(self.configured_rate * self.min_rate_factor, self.rate * 0.7)
+                logger.warning(f"{self.name}触发限流，速率降为每分钟{self.rate * 60:.1f}次，{delay:.1f}秒后重试")
+            else:
+                logger.warning(f"{self.name}触发限流，{delay:.1f}秒后重试")
+        
+        return delay
+    
+    def send(self, send_request):
+        """
+        在限流控制下发送请求，收到429时按Retry-After等待后重试
+        
+        Args:
+            send_request: 发送请求并返回requests.Response的函数
+            
+        Returns:
+            最后一次的requests.Response
+        """
+        for attempt in range(self.max_retries + 1):
+            with self.request():
+                response = send_request()
+            
+            if response.status_code != 429 or attempt == self.max_retries:
+                break
+            self.on_throttled(parse_retry_after(response), attempt)
+        
+        if response.status_code < 400:
+            self.on_success()
+        return response
+    
+    @contextmanager
+    def stream(self, send_request):
+        """
+        在限流控制下发送流式请求，读取响应体期间一直占用并发名额
+        
+        收到429时按Retry-After等待后重试；退出with块（读完、提前结束或出错）时关闭响应并释放名额。
+        
+        Args:
+            send_request: 以stream=True发送请求并返回requests.Response的函数
+            
+        Yields:
+            最后一次的requests.Response
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire_slot()
+            try:
+                self.wait_for_token()
+                response = send_request()
+            except BaseException:
+                self.release_slot()
+                raise
+            
+            if response.status_code != 429 or attempt == self.max_retries:
+                break
+            response.close()
+            self.release_slot()
+            self.on_throttled(parse_retry_after(response), attempt)
+        
+        try:
+            if response.status_code < 400:
+                self.on_success()
+            yield response
+        finally:
+            response.close()
+            self.release_slot()
+
+# 按提供商名称共享的限流器
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def get_governor(name, rate_limit_config=None):
+    """
+    获取（必要时创建）按提供商共享的限流器
+    
+    Args:
+        name: 提供商名称
+        rate_limit_config: 限流配置字典
+        
+    Returns:
+        ProviderGovernor实例
+    """
+    with _governors_lock:
+        governor = _governors.get(name)
+        if governor is None:
+            governor = ProviderGovernor(name, rate_limit_config)
+            _governors[name] = governor
+        return governor
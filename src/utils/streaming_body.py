@@ -0,0 +1,147 @@
+import os
+import mmap
+import json
+import base64
+
+# 每次编码的原始字节数（3的倍数，编码后为64KB，块之间不需要填充）
+DEFAULT_CHUNK_SIZE = 48 * 1024
+
+class Base64Data:
+    """
+    请求体中待base64编码的二进制数据
+    
+    作为字符串值放在请求体字典中，由StreamingJSONBody在发送时分块编码，
+    不会生成完整的base64字符串。数据来源可以是bytes等缓冲区，也可以是文件路径
+    （发送时以内存映射方式读取）。
+    """
+    
+    def __init__(self, source, prefix=''):
+        """
+        初始化待编码数据
+        
+        Args:
+            source: bytes、bytearray、memoryview，或文件路径
+            prefix: 编码数据前的文本，如"data:image/jpeg;base64,"
+        """
+        self.source = source
+        self.prefix = prefix
+    
+    @property
+    def size(self):
+        """原始数据的字节数"""
+        if isinstance(self.source, (str, os.PathLike)):
+            return os.path.getsize(self.source)
+        return memoryview(self.source).nbytes
+    
+    @property
+    def encoded_size(self):
+        """JSON字符串值（含引号和前缀）的字节数"""
+        return len(self._quoted_prefix()) + 1 + (self.size + 2) // 3 * 4
+    
+    def _quoted_prefix(self):
+        """JSON转义后的左引号和前缀"""
+        return json.dumps(self.prefix)[:-1].encode('ascii')
+    
+    def iter_encoded(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        逐块生成JSON字符串值（含引号和前缀）
+        
+        Args:
+            chunk_size: 每次编码的原始字节数，需为3的倍数
+        
+        Yields:
+            bytes
+        """
+        yield self._quoted_prefix()
+        if isinstance(self.source, (str, os.PathLike)):
+            with open(self.source, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    yield b'"'
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        yield from _encode_chunks(view, chunk_size)
+                    finally:
+                        view.release()
+        else:
+            yield from _encode_chunks(memoryview(self.source).cast('B'), chunk_size)
+        yield b'"'
+    
+    def __str__(self):
+        """完整的字符串值（只用于调试或回退到普通JSON序列化）"""
+        if isinstance(self.source, (str, os.PathLike)):
+            with open(self.source, 'rb') as f:
+                return self.prefix + base64.b64encode(f.read()).decode('ascii')
+        return self.prefix + base64.b64encode(self.source).decode('ascii')
+
+def _encode_chunks(view, chunk_size):
+    """对内存视图分块base64编码（切片不复制数据）"""
+    for start in range(0, len(view), chunk_size):
+        yield base64.b64encode(view[start:start + chunk_size])
+
+class StreamingJSONBody:
+    """
+    流式JSON请求体
+    
+    先把请求体中除Base64Data以外的部分序列化为若干段固定的JSON文本，
+    发送时依次输出这些文本，并在Base64Data的位置分块编码二进制数据，
+    直接写入连接。整个请求体只存在原始图片字节一份完整副本，
+    而不是base64字符串、data URL、JSON字符串和编码后的bytes多份副本。
+    
+    可作为requests的data参数：提供__len__（Content-Length），
+    每次迭代都从头生成，限流重试时可以重复发送。
+    """
+    
+    def __init__(self, payload, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        初始化请求体
+        
+        Args:
+            payload: 请求体字典，需要流式编码的值为Base64Data
+            chunk_size: 每次编码的原始字节数，需为3的倍数
+        """
+        if chunk_size <= 0 or chunk_size % 3:
+            raise ValueError(f"chunk_size必须是3的正整数倍: {chunk_size}")
+        self.chunk_size = chunk_size
+        self.parts = []
+        self._length = 0
+        
+        parts = []
+        # 用不会出现在普通文本中的占位字符串标记Base64Data的位置，序列化后再拆分
+        marker = f"\x00base64:{os.urandom(8).hex()}:"
+        
+        def default(value):
+            if isinstance(value, Base64Data):
+                parts.append(value)
+                return f"{marker}{len(parts) - 1}"
+            raise TypeError(f"无法序列化为JSON: {type(value).__name__}")
+        
+        text = json.dumps(payload, default=default, allow_nan=False)
+        quoted_marker = json.dumps(marker)[:-1]
+        for index, data in enumerate(parts):
+            placeholder = f"{quoted_marker}{index}\""
+            before, text = text.split(placeholder, 1)
+            self._add(before.encode('utf-8'))
+            self.parts.append(data)
+            self._length += data.encoded_size
+        self._add(text.encode('utf-8'))
+    
+    def _add(self, chunk):
+        if chunk:
+            self.parts.append(chunk)
+            self._length += len(chunk)
+    
+    def __len__(self):
+        return self._length
+    
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, Base64Data):
+                yield from part.iter_encoded(self.chunk_size)
+            else:
+                yield part
+    
+    def to_bytes(self):
+        """完整的请求体（只用于调试和测试）"""
+        return b''.join(self)
@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from loguru import logger
+
+# 默认追踪配置，对应config.yaml中的tracing部分
+DEFAULT_TRACING_CONFIG = {
+    'enabled': False,  # 是否写出span（关闭时span仍会创建，只是不导出）
+    'file': None,  # span写出的JSONL文件，每行为一个OTLP/JSON格式的ExportTraceServiceRequest
+    'service_name': 'image_to_video',  # 资源属性service.name
+    'batch_size': 256  # 缓存的span达到该数量时写出（任务的根span结束时也会写出）
+}
+
+# OTLP的SpanKind和StatusCode取值
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+# 当前线程（或上下文）中正在执行的span，新建span时默认作为父span
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+def _new_id(size):
+    """随机生成十六进制的trace ID（16字节）或span ID（8字节）"""
+    return os.urandom(size).hex()
+
+def _any_value(value):
+    """转换为OTLP/JSON的AnyValue"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        # 按OTLP/JSON约定，64位整数编码为字符串
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _key_values(attributes):
+    """属性字典转换为OTLP/JSON的KeyValue列表（忽略值为None的属性）"""
+    return [{'key': key, 'value': _any_value(value)} for key, value in attributes.items() if value is not None]
+
+class Span:
+    """
+    一个计时的操作，字段与OpenTelemetry的span对应
+    
+    通过Tracer.start_span或Tracer.span创建，end()之后交给Tracer导出。
+    """
+    
+    def __init__(self, tracer, name, trace_id, parent_id=None, kind=SPAN_KIND_INTERNAL, attributes=None, start_time=None):
+        """
+        初始化span
+        
+        Args:
+            tracer: 所属的Tracer
+            name: 操作名称
+            trace_id: trace ID
+            parent_id: 父span ID，根span为None
+            kind: SPAN_KIND_INTERNAL或SPAN_KIND_CLIENT
+            attributes: 属性字典
+            start_time: 开始时间戳（秒），默认为当前时间
+        """
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.links = []
+        self.start_time = start_time or time.time()
+        self.end_time = None
+        self.status_code = STATUS_CODE_OK
+        self.status_message = None
+    
+    def set_attributes(self, **attributes):
+        """设置属性"""
+        self.attributes.update(attributes)
+        return self
+    
+    def add_event(self, name, **attributes):
+        """记录一个带时间戳的事件"""
+        self.events.append((time.time(), name, attributes))
+    
+    def add_link(self, span):
+        """关联另一个trace中的span（如多个任务共用的批量请求）"""
+        if span is not None:
+            self.links.append((span.trace_id, span.span_id))
+    
+    def record_error(self, error):
+        """将span标记为失败"""
+        self.status_code = STATUS_CODE_ERROR
+        self.status_message = str(error)
+        self.add_event('exception', **{'exception.type': type(error).__name__, 'exception.message': str(error)})
+    
+    def end(self, end_time=None):
+        """结束span并交给Tracer导出，重复调用无效果"""
+        if self.end_time is not None:
+            return
+        self.end_time = end_time or time.time()
+        self.tracer._export(self)
+    
+    @property
+    def duration(self):
+        """持续时间（秒），未结束时为到当前的时间"""
+        return (self.end_time or time.time()) - self.start_time
+    
+    def to_otlp(self):
+        """
+        转换为OTLP/JSON格式的span
+        
+        Returns:
+            字典
+        """
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(int(self.start_time * 1e9)),
+            'endTimeUnixNano': str(int(self.end_time * 1e9)),
+            'attributes': _key_values(self.attributes),
+            'status': {'code': self.status_code}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.status_message:
+            span['status']['message'] = self.status_message
+        if self.events:
+            span['events'] = [
+                {'timeUnixNano': str(int(timestamp * 1e9)), 'name': name, 'attributes': _key_values(attributes)}
+                for timestamp, name, attributes in self.events
+            ]
+        if self.links:
+            span['links'] = [{'traceId': trace_id, 'spanId': span_id} for trace_id, span_id in self.links]
+        return span
+
+class Tracer:
+    """
+    span的创建和导出
+    
+    每个任务的根span生成一个trace ID，其下各阶段、LLM请求、视频任务提交、
+    每次状态查询和下载都作为子span。同一线程中嵌套的span通过contextvars自动关联父span，
+    跨线程（如共享的轮询线程、下载分段线程）时显式传入parent。
+    结束的span缓存后批量写入JSONL文件，每行可直接被OpenTelemetry Collector的
+    otlpjsonfile接收器读取，再转发到Jaeger等追踪查看工具。
+    """
+    
+    def __init__(self, config=None):
+        """
+        初始化Tracer
+        
+        Args:
+            config: 追踪配置字典，见DEFAULT_TRACING_CONFIG
+        """
+        self._lock = threading.Lock()
+        self._buffer = []
+        self.configure(config)
+    
+    def configure(self, config=None):
+        """
+        更新追踪配置，写出已缓存的span
+        
+        Args:
+            config: 追踪配置字典
+        """
+        self.flush()
+        config = dict(DEFAULT_TRACING_CONFIG, **(config or {}))
+        self.enabled = bool(config['enabled'] and config['file'])
+        self.file = config['file']
+        self.service_name = config['service_name']
+        self.batch_size = max(1, config['batch_size'])
+    
+    @staticmethod
+    def current_span():
+        """当前上下文中正在执行的span，没有时返回None"""
+        return _current_span.get()
+    
+    def start_span(self, name, parent=None, kind=SPAN_KIND_INTERNAL, start_time=None, **attributes):
+        """
+        创建span（不设为当前span）
+        
+        Args:
+            name: 操作名称
+            parent: 父span，为None时使用当前span；没有父span时开始新的trace
+            kind: SPAN_KIND_INTERNAL或SPAN_KIND_CLIENT
+            start_time: 开始时间戳（秒）
+            **attributes: 属性
+        
+        Returns:
+            Span实例，需调用end()结束
+        """
+        parent = parent or _current_span.get()
+        if parent is None:
+            return Span(self, name, _new_id(16), kind=kind, attributes=attributes, start_time=start_time)
+        return Span(self, name, parent.trace_id, parent.span_id, kind=kind, attributes=attributes, start_time=start_time)
+    
+    @contextmanager
+    def span(self, name, parent=None, kind=SPAN_KIND_INTERNAL, **attributes):
+        """
+        在代码块执行期间创建并设为当前span，代码块抛出异常时标记为失败
+        
+        Args:
+            name: 操作名称
+            parent: 父span，为None时使用当前span
+            kind: SPAN_KIND_INTERNAL或SPAN_KIND_CLIENT
+            **attributes: 属性
+        
+        Yields:
+            Span实例
+        """
+        span = self.start_span(name, parent, kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+    
+    def record(self, name, start_time, end_time=None, parent=None, error=None, **attributes):
+        """
+        记录一个已经结束的时间段（如排队等待、由其他线程完成的查询）
+        
+        Args:
+            name: 操作名称
+            start_time: 开始时间戳（秒）
+            end_time: 结束时间戳（秒），默认为当前时间
+            parent: 父span，为None时使用当前span
+            error: 失败时的异常
+            **attributes: 属性
+        
+        Returns:
+            Span实例
+        """
+        span = self.start_span(name, parent, start_time=start_time, **attributes)
+        if error is not None:
+            span.record_error(error)
+        span.end(end_time)
+        return span
+    
+    def set_attributes(self, **attributes):
+        """设置当前span的属性，没有当前span时忽略"""
+        span = _current_span.get()
+        if span is not None:
+            span.set_attributes(**attributes)
+    
+    def _export(self, span):
+        """缓存结束的span，达到批量大小或根span结束时写出"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._buffer.append(span)
+            full = len(self._buffer) >= self.batch_size
+        if full or span.parent_id is None:
+            self.flush()
+    
+    def flush(self):
+        """将缓存的span写入文件（一行一批）"""
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+            if not spans:
+                return
+            
+            line = json.dumps({'resourceSpans': [{
+                'resource': {'attributes': _key_values({'service.name': self.service_name, 'process.pid': os.getpid()})},
+                'scopeSpans': [{
+                    'scope': {'name': 'image_to_video'},
+                    'spans': [span.to_otlp() for span in spans]
+                }]
+            }]}, ensure_ascii=False)
+            try:
+                directory = os.path.dirname(self.file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.file, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                logger.warning(f"写出追踪数据失败: {e}")
+
+# 进程内共享的Tracer
+_tracer = Tracer()
+atexit.register(_tracer.flush)
+
+def get_tracer():
+    """
+    获取进程内共享的Tracer
+    
+    Returns:
+        Tracer实例
+    """
+    return _tracer
+
+def configure_tracing(config=None):
+    """
+    按配置设置共享的Tracer
+    
+    Args:
+        config: 追踪配置字典
+    
+    Returns:
+        Tracer实例
+    """
+    _tracer.configure(config)
+    return _tracer
@@ -0,0 +1,178 @@
+import json
+import secrets
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from loguru import logger
+
+# 监听所有网卡的地址，不能作为回调地址交给可灵
+WILDCARD_HOSTS = ('0.0.0.0', '::', '')
+
+def check_callback_address(host, public_url=None):
+    """
+    检查回调地址能否被可灵访问：未设置public_url时，监听所有网卡的地址无法作为回调地址，
+    直接报错；其他监听地址只有本机服务（如模拟服务）能访问，输出警告
+    
+    Args:
+        host: 监听地址
+        public_url: 对外暴露的回调地址
+    """
+    if public_url:
+        return
+    if host in WILDCARD_HOSTS:
+        raise ValueError(
+            f"已启用可灵回调，但未设置public_url，监听地址{host or '0.0.0.0'}无法作为回调地址，"
+            f"所有任务都将退化为兜底轮询。请设置callback.public_url或关闭回调"
+        )
+    logger.warning(f"已启用可灵回调但未设置public_url，回调地址使用监听地址{host}，只有本机的服务能推送回调")
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    """处理可灵任务状态回调的HTTP请求"""
+    
+    def log_message(self, format, *args):
+        logger.debug(f"回调服务器: {format % args}")
+    
+    def _reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def do_POST(self):
+        receiver = self.server.receiver
+        url = urlparse(self.path)
+        
+        if url.path != receiver.path:
+            return self._reply(404, {"code": 404, "message": "not found"})
+        
+        token = parse_qs(url.query).get('token', [None])[0]
+        if token != receiver.token:
+            logger.warning(f"收到令牌不匹配的回调请求，来源: {self.client_address[0]}")
+            return self._reply(403, {"code": 403, "message": "forbidden"})
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+        except Exception as e:
+            logger.warning(f"无法解析回调请求: {e}")
+            return self._reply(400, {"code": 400, "message": "bad request"})
+        
+        # 回调内容与任务查询接口的data字段一致，兼容包在data中的情况
+        task_info = body.get('data', body) if 'task_id' not in body else body
+        receiver.dispatch(task_info)
+        self._reply(200, {"code": 0, "message": "ok"})
+
+class KlingCallbackReceiver:
+    """
+    可灵任务回调接收器
+    
+    在本地启动一个小型HTTP服务器接收可灵推送的任务状态变更，
+    并分发给注册的监听函数。回调地址中带有随机令牌，用于拒绝伪造的请求。
+    """
+    
+    def __init__(self, host='127.0.0.1', port=0, path='/kling/callback', public_url=None):
+        """
+        初始化回调接收器
+        
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            path: 回调路径
+            public_url: 对外暴露的回调地址（如经过反向代理或内网穿透），为None时使用监听地址
+        """
+        self.host = host
+        self.port = port
+        self.path = path
+        self.public_url = public_url
+        self.token = secrets.token_urlsafe(16)
+        self._listeners = []
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    @property
+    def callback_url(self):
+        """传给可灵API的回调地址"""
+        base_url = self.public_url.rstrip('/') if self.public_url else f"http://{self.host}:{self.port}{self.path}"
+        return f"{base_url}?token={self.token}"
+    
+    def add_listener(self, listener):
+        """
+        注册回调监听函数
+        
+        Args:
+            listener: 接收任务信息字典的函数
+        """
+        with self._lock:
+            self._listeners.append(listener)
+    
+    def dispatch(self, task_info):
+        """将任务状态分发给所有监听函数"""
+        logger.info(f"收到任务状态回调，任务ID: {task_info.get('task_id')}，状态: {task_info.get('task_status')}")
+        
+        with self._lock:
+            listeners = list(self._listeners)
+        
+        for listener in listeners:
+            try:
+                listener(task_info)
+            except Exception as e:
+                logger.warning(f"处理任务回调出错: {e}")
+    
+    def start(self):
+        """启动回调服务器（已启动时直接返回）"""
+        with self._lock:
+            if self._server is not None:
+                return self
+            
+            self._server = ThreadingHTTPServer((self.host, self.port), _CallbackHandler)
+            self._server.daemon_threads = True
+            self._server.receiver = self
+            self.port = self._server.server_address[1]
+            
+            self._thread = threading.Thread(target=self._server.serve_forever, name="kling-callback-server", daemon=True)
+            self._thread.start()
+        
+        logger.info(f"可灵回调服务器已启动: http://{self.host}:{self.port}{self.path}")
+        return self
+    
+    def stop(self):
+        """停止回调服务器"""
+        with self._lock:
+            server, self._server = self._server, None
+        
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+# 同一进程内按监听地址共享的回调接收器
+_receivers = {}
+_receivers_lock = threading.Lock()
+
+def get_callback_receiver(host='127.0.0.1', port=0, path='/kling/callback', public_url=None):
+    """
+    获取（必要时启动）共享的回调接收器
+    
+    同一进程中相同监听地址的生成器共用一个接收器；端口为0时每次创建新的接收器。
+    
+    Args:
+        host: 监听地址
+        port: 监听端口
+        path: 回调路径
+        public_url: 对外暴露的回调地址
+        
+    Returns:
+        已启动的KlingCallbackReceiver实例
+    """
+    if not port:
+        return KlingCallbackReceiver(host, port, path, public_url).start()
+    
+    with _receivers_lock:
+        receiver = _receivers.get((host, port))
+        if receiver is None:
+            receiver = KlingCallbackReceiver(host, port, path, public_url)
+            _receivers[(host, port)] = receiver
+    
+    return receiver.start()
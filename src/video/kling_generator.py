@@ -1,10 +1,26 @@
-import requests
 import json
 import time
 import os
-import jwt
+import hashlib
+import threading
 from datetime import datetime
 from loguru import logger
+from .task_poller import KlingTaskPoller, TaskRejectedError
+from .render_eta import RenderETAEstimator
+from .video_cache import VideoCache
+from utils.http_client import get_session
+from utils.rate_limiter import get_governor, parse_retry_after
+from utils.downloader import Downloader
+from utils.metrics import get_metrics, DEFAULT_BYTES_BUCKETS
+from utils.tracing import get_tracer, SPAN_KIND_CLIENT
+
+# 可灵限流相关的业务错误码
+KLING_RATE_LIMIT_CODE = 1302  # 请求过于频繁
+KLING_QUOTA_CODE = 1303  # 并发任务数或资源配额超限
+
+# 请求内容导致的错误：12xx为参数错误，1300/1301为触发平台策略或内容安全审核
+KLING_REJECT_CODES = frozenset(range(1200, 1300)) | {1300, 1301}
+KLING_REJECT_STATUS = (400, 422)
 
 class KlingGenerator:
     """可灵(Kling)视频生成API客户端"""
@@ -23,6 +39,42 @@ class KlingGenerator:
         self.secret_key = config.get('secret_key')
         self.model = config.get('model', 'kling-v1')
         self.max_duration = config.get('max_duration', 5)  # 默认5秒
+        self.mode = config.get('mode', 'std')
+        self.aspect_ratio = config.get('aspect_ratio', '16:9')
+        self.cfg_scale = config.get('cfg_scale', 0.5)
+        self.max_prompt_length = config.get('max_prompt_length', 2500)  # prompt最大长度（字符）
+        
+        # 按提供商共享的连接池（提交、轮询和下载共用）
+        self.session = get_session(self.name, config.get('http'))
+        self.downloader = Downloader(self.session, config.get('download'))
+        # 按提供商共享的限流器：rpm限制所有API请求，max_in_flight限制同时渲染的任务数
+        self.governor = get_governor(self.name, config.get('rate_limit'))
+        
+        # 轮询配置
+        self.eta_estimator = RenderETAEstimator(
+            history_path=config.get('eta_history_file'),
+            default_eta=config.get('default_render_eta', 180),
+            min_interval=config.get('poll_min_interval', 1),
+            max_interval=config.get('poll_max_interval', 30)
+        )
+        self.poll_use_list_query = config.get('poll_use_list_query', True)
+        self.poll_page_size = config.get('poll_page_size', 500)
+        
+        # 回调配置：启用后由可灵推送任务状态，轮询只作为兜底
+        self.callback_config = config.get('callback') or {}
+        self.callback_enabled = self.callback_config.get('enabled', False)
+        self._callback_receiver = None
+        if self.callback_enabled:
+            from .callback_server import check_callback_address
+            check_callback_address(self.callback_config.get('host', '127.0.0.1'), self.callback_config.get('public_url'))
+        
+        # 生成视频缓存，由get_video_generator设置
+        self.video_cache = None
+        
+        self._token = None
+        self._token_expire_at = 0
+        self._lock = threading.Lock()
+        self._poller = None
         
         if not self.access_key or not self.secret_key:
             raise ValueError(f"可灵API配置不完整: access_key={'已设置' if self.access_key else '未设置'}, secret_key={'已设置' if self.secret_key else '未设置'}")
@@ -45,9 +97,112 @@ class KlingGenerator:
             "nbf": int(time.time()) - 5  # 开始生效时间为当前时间-5秒
         }
         
+        # 按需导入，只列出提供商等不发请求的命令不需要jwt
+        import jwt
         token = jwt.encode(payload, self.secret_key, headers=headers)
         return token
     
+    def _auth_headers(self):
+        """
+        获取带鉴权信息的请求头
+        
+        JWT Token在有效期内复用，距过期不足1分钟时重新生成。
+        
+        Returns:
+            请求头字典
+        """
+        with self._lock:
+            if self._token is None or time.time() > self._token_expire_at - 60:
+                self._token = self._generate_jwt_token()
+                self._token_expire_at = time.time() + 1800
+            token = self._token
+        
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}"
+        }
+    
+    @staticmethod
+    def _business_code(response):
+        """读取响应中的业务错误码，无法解析时返回None"""
+        try:
+            return response.json().get('code')
+        except ValueError:
+            return None
+    
+    def _api_request(self, method, path, holds_slot=False, **kwargs):
+        """
+        在限流控制下调用可灵API
+        
+        收到429或限流相关的业务错误码时，按Retry-After（或指数退避）等待后重试；
+        并发配额超限时降低并发上限，并释放名额等待其他任务完成后再重试。
+        
+        Args:
+            method: HTTP方法
+            path: API路径
+            holds_slot: 调用方是否持有并发名额（提交任务时为True）
+            **kwargs: 传给requests的其他参数
+            
+        Returns:
+            最后一次的requests.Response
+        """
+        url = f"{self.endpoint}{path}"
+        
+        for attempt in range(self.governor.max_retries + 1):
+            self.governor.wait_for_token()
+            response = self.session.request(method, url, headers=self._auth_headers(), **kwargs)
+            
+            code = self._business_code(response)
+            if response.status_code != 429 and code not in (KLING_RATE_LIMIT_CODE, KLING_QUOTA_CODE):
+                self.governor.on_success()
+                break
+            if attempt == self.governor.max_retries:
+                break
+            
+            quota = code == KLING_QUOTA_CODE and holds_slot
+            self.governor.on_throttled(parse_retry_after(response), attempt, quota=quota)
+            if quota:
+                # 让出名额，等待其他任务完成后再提交
+                self.governor.release_slot()
+                self.governor.acquire_slot()
+        
+        get_tracer().set_attributes(**{'http.status_code': response.status_code, 'kling.throttled': attempt})
+        return response
+    
+    @property
+    def poller(self):
+        """共享的任务状态轮询器，首次使用时创建"""
+        with self._lock:
+            if self._poller is None:
+                self._poller = KlingTaskPoller(
+                    self,
+                    self.eta_estimator,
+                    use_list_query=self.poll_use_list_query,
+                    page_size=self.poll_page_size,
+                    safety_interval=self.callback_config.get('safety_poll_interval', 120) if self.callback_enabled else None
+                )
+            return self._poller
+    
+    @property
+    def callback_receiver(self):
+        """回调接收器，仅在启用回调时创建并启动"""
+        if not self.callback_enabled:
+            return None
+        
+        poller = self.poller
+        with self._lock:
+            if self._callback_receiver is None:
+                # 只有启用回调时才需要HTTP服务器
+                from .callback_server import get_callback_receiver
+                self._callback_receiver = get_callback_receiver(
+                    host=self.callback_config.get('host', '127.0.0.1'),
+                    port=self.callback_config.get('port', 0),
+                    path=self.callback_config.get('path', '/kling/callback'),
+                    public_url=self.callback_config.get('public_url') or None
+                )
+                self._callback_receiver.add_listener(poller.notify)
+            return self._callback_receiver
+    
     def generate_video(self, description, output_path):
         """
         使用可灵API根据描述生成视频
@@ -62,134 +217,324 @@ class KlingGenerator:
         logger.info(f"使用{self.name}生成视频")
         
         try:
-            # 生成JWT Token
-            jwt_token = self._generate_jwt_token()
-            
-            # 设置请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {jwt_token}"
-            }
-            
-            # 构建请求体
-            payload = {
-                "model_name": self.model,
-                "prompt": description,
-                "negative_prompt": "",
-                "cfg_scale": 0.5,
-                "mode": "std",
-                "aspect_ratio": "16:9",
-                "duration": str(self.max_duration)
-            }
-            
-            # 发送生成请求
-            url = f"{self.endpoint}/v1/videos/text2video"
-            logger.info(f"发送视频生成请求: {url}")
-            
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
+            if self.fetch_cached_video(description, output_path):
+                return output_path
             
-            result = response.json()
-            
-            # 检查API响应
-            if result.get('code') != 0:
-                error_message = result.get('message', '未知错误')
-                raise RuntimeError(f"视频生成请求失败: {error_message}")
-            
-            task_id = result.get('data', {}).get('task_id')
+            task = self.submit_task(description)
+            render_result = self.wait_for_task(task)
+            self.download_video(render_result['video_url'], output_path)
+            self.cache_video(description, output_path, task['task_id'])
+            return output_path
             
-            if not task_id:
-                raise ValueError("未能获取视频生成任务ID")
+        except Exception as e:
+            logger.error(f"生成视频失败: {e}")
+            raise
+    
+    def _build_payload(self, description):
+        """
+        构建文生视频请求体（不含回调地址等与结果无关的字段）
+        
+        Args:
+            description: 视频描述文本
             
-            logger.info(f"视频生成任务已提交，任务ID: {task_id}")
+        Returns:
+            请求体字典
+        """
+        return {
+            "model_name": self.model,
+            "prompt": description,
+            "negative_prompt": "",
+            "cfg_scale": self.cfg_scale,
+            "mode": self.mode,
+            "aspect_ratio": self.aspect_ratio,
+            "duration": str(self.max_duration)
+        }
+    
+    def fetch_cached_video(self, description, output_path):
+        """
+        从视频缓存中取出相同请求之前生成的视频
+        
+        Args:
+            description: 视频描述文本
+            output_path: 输出视频文件路径
             
-            # 轮询检查任务状态
-            video_url = self._poll_task_status(task_id)
+        Returns:
+            命中时返回缓存条目元数据（包含原任务ID），否则返回None
+        """
+        if self.video_cache is None:
+            return None
+        
+        key = VideoCache.make_key(self._build_payload(description))
+        return self.video_cache.fetch(key, output_path)
+    
+    def cache_video(self, description, video_path, task_id):
+        """
+        将下载好的视频加入视频缓存
+        
+        Args:
+            description: 视频描述文本
+            video_path: 已下载的视频文件路径
+            task_id: 生成该视频的任务ID
+        """
+        if self.video_cache is None:
+            return
+        
+        payload = self._build_payload(description)
+        self.video_cache.store(VideoCache.make_key(payload), video_path, task_id, payload)
+    
+    def make_external_task_id(self, job_id, description, attempt=0):
+        """
+        生成确定性的自定义任务ID
+        
+        同一任务、同一请求体、同一尝试次数总是得到相同的ID，
+        重复提交时可以据此找回已创建的任务。
+        
+        Args:
+            job_id: 任务日志中的任务ID
+            description: 视频描述文本
+            attempt: 第几次尝试（服务端任务失败后重新提交时递增）
             
-            if not video_url:
-                raise ValueError("未能获取生成的视频URL")
+        Returns:
+            external_task_id字符串
+        """
+        payload_hash = VideoCache.make_key(self._build_payload(description))
+        return f"i2v-{job_id[:16]}-{payload_hash[:12]}-{attempt}"
+    
+    def find_task(self, external_task_id):
+        """
+        通过自定义任务ID查询已创建的任务
+        
+        Args:
+            external_task_id: 自定义任务ID
             
-            # 下载视频
-            logger.info(f"开始下载生成的视频: {video_url}")
+        Returns:
+            任务信息字典，任务不存在时返回None
+        """
+        response = self._api_request('GET', f"/v1/videos/text2video/{external_task_id}")
+        if response.status_code >= 400 or self._business_code(response) != 0:
+            return None
+        
+        task = response.json().get('data') or {}
+        return task if task.get('task_id') else None
+    
+    def attach_task(self, task_id, submitted_at=None):
+        """
+        重新关联一个已提交的任务（如进程重启后），之后可用wait_for_task等待其完成
+        
+        与submit_task一样会占用一个并发名额。
+        
+        Args:
+            task_id: 任务ID
+            submitted_at: 原提交时间戳
             
-            # 确保输出目录存在
-            output_dir = os.path.dirname(output_path)
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+        Returns:
+            任务信息字典
+        """
+        self.governor.acquire_slot()
+        task = {
+            'task_id': task_id,
+            'submitted_at': submitted_at or time.time(),
+            'expected_render_seconds': self.eta_estimator.estimate(self._eta_key())
+        }
+        logger.info(f"重新关联视频生成任务，任务ID: {task_id}")
+        return task
+    
+    def submit_task(self, description, external_task_id=None, resume=False):
+        """
+        提交文生视频任务
+        
+        Args:
+            description: 视频描述文本
+            external_task_id: 自定义任务ID，指定时提交是幂等的：
+                若该ID的任务已存在，则直接关联已有任务而不会重复创建
+            resume: 是否为中断后重新提交（之前的提交可能已成功），为True时先按自定义任务ID
+                查询，找到已有任务时直接关联，不再发送创建请求
             
-            video_response = requests.get(video_url, stream=True)
-            video_response.raise_for_status()
+        Returns:
+            任务信息字典，包含task_id和预计渲染耗时expected_render_seconds
+        
+        提交前会占用一个并发名额，由wait_for_task在任务结束时释放。
+        """
+        if resume and external_task_id:
+            existing = self.find_task(external_task_id)
+            if existing is not None:
+                logger.info(f"自定义任务ID已存在，关联已有任务: {external_task_id}")
+                created_at = existing.get('created_at')
+                return self.attach_task(existing['task_id'], created_at / 1000 if created_at else None)
+        
+        # 构建请求体
+        payload = self._build_payload(description)
+        if external_task_id:
+            payload["external_task_id"] = external_task_id
+        
+        if self.callback_enabled:
+            payload["callback_url"] = self.callback_receiver.callback_url
+        
+        # 发送生成请求
+        logger.info(f"发送视频生成请求: {self.endpoint}/v1/videos/text2video")
+        
+        self.governor.acquire_slot()
+        start_time = time.time()
+        try:
+            with get_tracer().span('kling.submit', kind=SPAN_KIND_CLIENT, **{
+                'video.provider': self.name,
+                'video.model': self.model,
+                'kling.external_task_id': external_task_id
+            }) as span:
+                task = self._create_task(payload, external_task_id)
+                task_id = task['task_id']
+                span.set_attributes(**{'kling.task_id': task_id})
+        except Exception:
+            self.governor.release_slot()
+            self._record_submit('error', time.time() - start_time)
+            raise
+        
+        self._record_submit('ok', time.time() - start_time)
+        created_at = task.get('created_at')
+        task['submitted_at'] = created_at / 1000 if created_at else time.time()
+        task['expected_render_seconds'] = self.eta_estimator.estimate(self._eta_key())
+        logger.info(f"视频生成任务已提交，任务ID: {task_id}，预计渲染耗时: {task['expected_render_seconds']:.0f}秒")
+        return task
+    
+    def _create_task(self, payload, external_task_id=None):
+        """
+        调用创建任务接口，提交失败但自定义任务ID已存在时关联已有任务
+        
+        Args:
+            payload: 请求体字典
+            external_task_id: 自定义任务ID
             
-            with open(output_path, 'wb') as f:
-                for chunk in video_response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        Returns:
+            接口返回的任务信息字典（包含task_id）
+        """
+        response = self._api_request('POST', "/v1/videos/text2video", holds_slot=True, json=payload)
+        code = self._business_code(response)
+        
+        if (response.status_code >= 400 or code != 0) and external_task_id:
+            # 可能是之前的提交已成功（如进程重启或传输层重试），按自定义任务ID找回
+            existing = self.find_task(external_task_id)
+            if existing is not None:
+                logger.info(f"自定义任务ID已存在，关联已有任务: {external_task_id}")
+                response = None
+                result = {'code': 0, 'data': existing}
+        
+        if response is not None:
+            if response.status_code in KLING_REJECT_STATUS or code in KLING_REJECT_CODES:
+                try:
+                    message = response.json().get('message')
+                except ValueError:
+                    message = response.text[:200]
+                raise TaskRejectedError(f"视频生成请求被拒绝（HTTP {response.status_code}，业务码{code}）: {message}")
+            response.raise_for_status()
+            result = response.json()
+        
+        # 检查API响应
+        if result.get('code') != 0:
+            error_message = result.get('message', '未知错误')
+            raise RuntimeError(f"视频生成请求失败: {error_message}")
+        
+        task = result.get('data') or {}
+        if not task.get('task_id'):
+            raise ValueError("未能获取视频生成任务ID")
+        return task
+    
+    def _record_submit(self, status, seconds):
+        """记录一次提交请求的耗时和结果"""
+        metrics = get_metrics()
+        metrics.histogram('image_to_video_video_submit_seconds', "提交视频任务的耗时（秒）").observe(
+            seconds, provider=self.name, status=status
+        )
+        metrics.counter('image_to_video_video_submits_total', "提交视频任务的次数").inc(provider=self.name, status=status)
+    
+    def _eta_key(self):
+        """当前渲染参数对应的耗时估计键"""
+        return RenderETAEstimator.make_key(self.model, self.mode, self.max_duration)
+    
+    def wait_for_task(self, task):
+        """
+        等待任务完成
+        
+        Args:
+            task: submit_task返回的任务信息字典
             
-            logger.info(f"视频已保存: {output_path}")
-            return output_path
+        Returns:
+            渲染结果字典，包含video_url、render_seconds、expected_render_seconds等
+        """
+        start_time = time.time()
+        try:
+            # 轮询线程中的每次查询都记为该span的子span
+            with get_tracer().span('kling.wait', **{'video.provider': self.name, 'kling.task_id': task['task_id']}) as span:
+                render_result = self._poll_task_status(task['task_id'], task.get('submitted_at'))
+                span.set_attributes(**{
+                    'kling.polls': render_result.get('polls'),
+                    'kling.render_seconds': render_result.get('render_seconds'),
+                    'kling.expected_render_seconds': render_result.get('expected_render_seconds')
+                })
+        finally:
+            # 任务结束（成功或失败），释放提交时占用的并发名额
+            self.governor.release_slot()
+        
+        metrics = get_metrics()
+        metrics.histogram('image_to_video_video_wait_seconds', "等待视频任务完成的耗时（秒）").observe(
+            time.time() - start_time, provider=self.name
+        )
+        metrics.histogram('image_to_video_video_render_seconds', "视频任务从提交到完成的排队加渲染耗时（秒）").observe(
+            render_result.get('render_seconds', 0), provider=self.name
+        )
+        metrics.counter('image_to_video_video_polls_total', "查询视频任务状态的次数").inc(
+            render_result.get('polls', 0), provider=self.name
+        )
+        
+        if not render_result.get('video_url'):
+            raise ValueError("未能获取生成的视频URL")
+        
+        return render_result
+    
+    def download_video(self, video_url, output_path):
+        """
+        下载生成的视频
+        
+        Args:
+            video_url: 视频URL
+            output_path: 输出视频文件路径
             
-        except Exception as e:
-            logger.error(f"生成视频失败: {e}")
-            raise
+        Returns:
+            输出视频文件路径
+        """
+        logger.info(f"开始下载生成的视频: {video_url}")
+        
+        start_time = time.time()
+        with get_tracer().span('kling.download', kind=SPAN_KIND_CLIENT, **{'video.provider': self.name, 'http.url': video_url}) as span:
+            size = self.downloader.download(video_url, output_path)
+            span.set_attributes(**{'download.bytes': size})
+        
+        metrics = get_metrics()
+        metrics.histogram('image_to_video_video_download_seconds', "下载视频的耗时（秒）").observe(
+            time.time() - start_time, provider=self.name
+        )
+        metrics.histogram('image_to_video_video_download_bytes', "下载的视频大小（字节）", DEFAULT_BYTES_BUCKETS).observe(
+            size or 0, provider=self.name
+        )
+        
+        logger.info(f"视频已保存: {output_path}")
+        return output_path
+    
+    def log_stats(self):
+        """输出生成器的运行统计（可灵生成器没有额外的统计）"""
+        pass
     
-    def _poll_task_status(self, task_id):
+    def _poll_task_status(self, task_id, submitted_at=None):
         """
-        轮询检查任务状态
+        等待任务完成
+        
+        所有任务共享同一个轮询器，调用方阻塞在任务对应的Future上。
+        轮询间隔根据该参数组合的历史渲染耗时自适应调整。
         
         Args:
             task_id: 任务ID
+            submitted_at: 任务提交时间戳
             
         Returns:
-            视频URL或None
-        """
-        # 查询任务状态的API路径
-        status_path = f"/v1/videos/text2video/{task_id}"
-        
-        while True:
-            # 生成新的JWT Token
-            jwt_token = self._generate_jwt_token()
-            
-            # 更新请求头
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {jwt_token}"
-            }
-            
-            status_url = f"{self.endpoint}{status_path}"
-            status_response = requests.get(status_url, headers=headers)
-            status_response.raise_for_status()
-            
-            status_data = status_response.json()
-            
-            # 检查API响应
-            if status_data.get('code') != 0:
-                error_message = status_data.get('message', '未知错误')
-                raise RuntimeError(f"查询任务状态失败: {error_message}")
-            
-            task_info = status_data.get('data', {})
-            status = task_info.get('task_status')
-            
-            logger.info(f"视频生成中，当前状态: {status}")
-            
-            if status == 'succeed':
-                # 任务成功，获取视频URL
-                task_result = task_info.get('task_result', {})
-                videos = task_result.get('videos', [])
-                
-                if videos and len(videos) > 0:
-                    video_url = videos[0].get('url')
-                    video_duration = videos[0].get('duration')
-                    logger.info(f"视频生成成功，时长: {video_duration}秒，URL: {video_url}")
-                    return video_url
-                else:
-                    raise ValueError("任务成功但未找到视频URL")
-            elif status == 'failed':
-                # 任务失败
-                error_message = task_info.get('task_status_msg', '未知错误')
-                raise RuntimeError(f"视频生成失败: {error_message}")
-            elif status in ['submitted', 'processing']:
-                # 任务仍在处理中，等待后再次查询
-                logger.info(f"任务正在处理中，状态: {status}")
-                time.sleep(5)  # 等待5秒后再次检查
-            else:
-                # 未知状态
-                raise RuntimeError(f"未知的任务状态: {status}")
+            渲染结果字典
+        """
+        return self.poller.watch(task_id, self._eta_key(), submitted_at).result()
@@ -0,0 +1,330 @@
+import os
+import json
+import math
+import time
+import uuid
+import shutil
+import functools
+import subprocess
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from loguru import logger
+from utils.metrics import get_metrics
+from utils.tracing import get_tracer
+from .task_poller import TaskFailedError
+
+# 长视频模式的默认配置，对应config.yaml中的long_form部分
+DEFAULT_LONG_FORM_CONFIG = {
+    'enabled': False,
+    'duration': 60,  # 目标时长（秒），镜头数为目标时长除以视频模型单次渲染的时长
+    'max_shots': 24,  # 镜头数上限
+    'ffmpeg': 'ffmpeg',  # 用于拼接视频片段的ffmpeg可执行文件
+    'keep_segments': False,  # 拼接后是否保留各镜头的视频片段
+    'max_workers': 32  # 同时提交、等待和下载镜头的线程数（所有任务共用）
+}
+
+# 长视频任务ID的前缀，其后为逗号分隔的各镜头自定义任务ID，重新关联任务时据此找回各镜头
+SHOT_TASK_PREFIX = 'shots:'
+
+def format_shot_list(shots):
+    """
+    将分镜列表转换为描述文本（JSON数组），可以保存到任务日志和描述文件中
+    
+    Args:
+        shots: 镜头描述列表
+    
+    Returns:
+        描述文本
+    """
+    return json.dumps(shots, ensure_ascii=False, indent=2)
+
+def parse_shot_list(description):
+    """
+    从描述文本中取出分镜列表，不是JSON数组时整段描述作为一个镜头
+    
+    Args:
+        description: format_shot_list生成的描述文本
+    
+    Returns:
+        镜头描述列表
+    """
+    try:
+        shots = json.loads(description)
+    except ValueError:
+        return [description]
+    if not isinstance(shots, list) or not shots:
+        return [description]
+    return [str(shot) for shot in shots]
+
+def concat_videos(segment_paths, output_path, ffmpeg='ffmpeg'):
+    """
+    用ffmpeg的concat分离器按顺序拼接视频片段，只复制音视频流，不重新编码
+    
+    各片段需使用相同的编码参数（同一模型、模式和画面比例渲染的片段满足该条件）。
+    先写入临时文件，成功后再重命名为目标文件。
+    
+    Args:
+        segment_paths: 按播放顺序排列的视频片段路径列表
+        output_path: 输出视频文件路径
+        ffmpeg: ffmpeg可执行文件
+    
+    Returns:
+        输出视频文件路径
+    """
+    list_path = f"{output_path}.concat.txt"
+    tmp_path = f"{output_path}.part.mp4"
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in segment_paths:
+            # concat列表中的路径用单引号包围，路径中的单引号需转义
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    
+    command = [
+        ffmpeg, '-y', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+        '-c', 'copy', '-movflags', '+faststart',
+        tmp_path
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"拼接视频失败: {result.stderr.strip()[-500:]}")
+        os.replace(tmp_path, output_path)
+    finally:
+        for path in (list_path, tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return output_path
+
+def _raise_missing_shot(shot_id):
+    """重新关联时找不到的镜头任务"""
+    raise TaskFailedError(f"长视频的镜头任务未提交，需要重新提交: {shot_id}")
+
+class LongFormVideoGenerator:
+    """
+    长视频生成器
+    
+    视频模型单次只能渲染几秒的视频。长视频模式下LLM生成分镜列表（描述为JSON数组），
+    每个镜头作为独立的任务同时提交给底层的视频生成器并等待渲染，
+    全部完成后并行下载各镜头的片段，再按顺序无损拼接为一个视频，
+    因此总耗时接近最慢的一个镜头，而不是所有镜头之和。
+    对外提供与KlingGenerator相同的submit_task/wait_for_task/download_video等接口，可直接用于流水线。
+    """
+    
+    def __init__(self, generator, config=None):
+        """
+        初始化长视频生成器
+        
+        Args:
+            generator: 渲染单个镜头的视频生成器实例
+            config: 长视频配置字典，见DEFAULT_LONG_FORM_CONFIG
+        """
+        cfg = dict(DEFAULT_LONG_FORM_CONFIG)
+        cfg.update(config or {})
+        
+        self.generator = generator
+        self.name = generator.name
+        # 每个镜头的描述单独提交，长度上限与单个任务相同
+        self.max_prompt_length = generator.max_prompt_length
+        self.shot_seconds = int(generator.max_duration)
+        self.shot_count = max(1, min(int(cfg['max_shots']), math.ceil(cfg['duration'] / self.shot_seconds)))
+        self.keep_segments = cfg['keep_segments']
+        
+        self.ffmpeg = shutil.which(cfg['ffmpeg'])
+        if self.ffmpeg is None:
+            raise ValueError(f"长视频模式需要ffmpeg拼接视频片段，未找到: {cfg['ffmpeg']}")
+        
+        self._executor = ThreadPoolExecutor(max_workers=cfg['max_workers'], thread_name_prefix="long-form")
+        
+        logger.info(
+            f"启用长视频模式: 每个视频{self.shot_count}个镜头，每个镜头{self.shot_seconds}秒，"
+            f"共{self.shot_count * self.shot_seconds}秒"
+        )
+    
+    @property
+    def video_cache(self):
+        """视频缓存（缓存拼接后的完整视频）"""
+        return self.generator.video_cache
+    
+    @video_cache.setter
+    def video_cache(self, cache):
+        self.generator.video_cache = cache
+    
+    def _run(self, func, *args):
+        """在工作线程中执行，沿用当前的追踪上下文"""
+        return self._executor.submit(contextvars.copy_context().run, func, *args)
+    
+    def generate_video(self, description, output_path):
+        """
+        根据分镜列表生成长视频
+        
+        Args:
+            description: format_shot_list生成的描述文本
+            output_path: 输出视频文件路径
+        
+        Returns:
+            输出视频文件路径
+        """
+        if self.fetch_cached_video(description, output_path):
+            return output_path
+        
+        task = self.submit_task(description)
+        render_result = self.wait_for_task(task)
+        self.download_video(render_result['video_url'], output_path)
+        self.cache_video(description, output_path, task['task_id'])
+        return output_path
+    
+    def fetch_cached_video(self, description, output_path):
+        """从视频缓存中取出相同分镜列表之前生成的完整视频"""
+        return self.generator.fetch_cached_video(description, output_path)
+    
+    def cache_video(self, description, video_path, task_id):
+        """将拼接好的完整视频加入视频缓存"""
+        self.generator.cache_video(description, video_path, task_id)
+    
+    def make_external_task_id(self, job_id, description, attempt=0):
+        """生成确定性的自定义任务ID，第i个镜头的任务ID为其后加上-i"""
+        return self.generator.make_external_task_id(job_id, description, attempt)
+    
+    def _render_shot(self, index, start):
+        """
+        在工作线程中提交（或重新关联）一个镜头的任务并等待渲染完成
+        
+        Args:
+            index: 镜头序号
+            start: 提交或重新关联任务的函数，返回任务信息字典
+        
+        Returns:
+            渲染结果字典
+        """
+        with get_tracer().span('video.shot', **{'video.shot_index': index}) as span:
+            task = start()
+            span.set_attributes(**{'kling.task_id': task['task_id']})
+            return self.generator.wait_for_task(task)
+    
+    def submit_task(self, description, external_task_id=None, resume=False):
+        """
+        同时提交分镜列表中的所有镜头（不等待渲染）
+        
+        各镜头在工作线程中提交并等待，镜头数超过视频模型的并发名额时，
+        后面的镜头在名额释放后再提交。
+        
+        Args:
+            description: format_shot_list生成的描述文本
+            external_task_id: 自定义任务ID，指定时每个镜头使用其后加上-i的ID，提交是幂等的
+            resume: 是否为中断后重新提交，为True时各镜头先按自定义任务ID查询已创建的任务
+        
+        Returns:
+            任务信息字典，futures为各镜头渲染结果的Future
+        """
+        shots = parse_shot_list(description)
+        shot_ids = [f"{external_task_id}-{i}" if external_task_id else None for i in range(len(shots))]
+        futures = [
+            self._run(self._render_shot, i, functools.partial(self.generator.submit_task, shot, external_task_id=shot_id, resume=resume))
+            for i, (shot, shot_id) in enumerate(zip(shots, shot_ids))
+        ]
+        
+        if external_task_id:
+            task_id = SHOT_TASK_PREFIX + ','.join(shot_ids)
+        else:
+            task_id = f"{SHOT_TASK_PREFIX}{uuid.uuid4().hex}"
+        logger.info(f"长视频的{len(shots)}个镜头已开始提交，任务ID: {task_id}")
+        return {'task_id': task_id, 'shots': len(shots), 'futures': futures, 'submitted_at': time.time()}
+    
+    def attach_task(self, task_id, submitted_at=None):
+        """
+        重新关联一个已提交的长视频任务（如进程重启后），按各镜头的自定义任务ID找回已创建的任务
+        
+        找不到的镜头（提交前进程已中断）在wait_for_task中报TaskFailedError，
+        流水线据此在下次运行时用新的自定义任务ID重新提交。
+        
+        Args:
+            task_id: submit_task返回的任务ID
+            submitted_at: 原提交时间戳
+        
+        Returns:
+            任务信息字典
+        """
+        shot_ids = task_id[len(SHOT_TASK_PREFIX):].split(',') if task_id.startswith(SHOT_TASK_PREFIX) else [task_id]
+        futures = []
+        for i, shot_id in enumerate(shot_ids):
+            existing = self.generator.find_task(shot_id)
+            if existing is None:
+                start = functools.partial(_raise_missing_shot, shot_id)
+            else:
+                start = functools.partial(self.generator.attach_task, existing['task_id'], submitted_at)
+            futures.append(self._run(self._render_shot, i, start))
+        logger.info(f"重新关联长视频任务，共{len(futures)}个镜头")
+        return {'task_id': task_id, 'shots': len(futures), 'futures': futures, 'submitted_at': submitted_at or time.time()}
+    
+    def wait_for_task(self, task):
+        """
+        等待所有镜头渲染完成
+        
+        有镜头失败时，等其他镜头结束（释放并发名额）后抛出第一个镜头的异常。
+        
+        Args:
+            task: submit_task返回的任务信息字典
+        
+        Returns:
+            渲染结果字典，video_url为各镜头视频URL按顺序组成的JSON数组
+        """
+        start_time = time.time()
+        futures = task['futures']
+        wait(futures)
+        
+        for i, future in enumerate(futures):
+            error = future.exception()
+            if error is not None:
+                logger.error(f"长视频第{i + 1}/{len(futures)}个镜头渲染失败: {error}")
+                raise error
+        
+        results = [future.result() for future in futures]
+        render_seconds = max(result.get('render_seconds', 0) for result in results)
+        logger.info(
+            f"长视频的{len(results)}个镜头全部渲染完成，等待{time.time() - start_time:.2f}秒，"
+            f"最慢镜头耗时{render_seconds:.0f}秒，各镜头耗时之和{sum(result.get('render_seconds', 0) for result in results):.0f}秒"
+        )
+        return {
+            'task_id': task['task_id'],
+            'video_url': json.dumps([result['video_url'] for result in results]),
+            'render_seconds': render_seconds,
+            'expected_render_seconds': max(result.get('expected_render_seconds', 0) for result in results),
+            'polls': sum(result.get('polls', 0) for result in results),
+            'shots': len(results)
+        }
+    
+    def download_video(self, video_url, output_path):
+        """
+        并行下载各镜头的视频片段，再按顺序拼接为一个视频
+        
+        Args:
+            video_url: wait_for_task返回的video_url（各镜头视频URL组成的JSON数组）
+            output_path: 输出视频文件路径
+        
+        Returns:
+            输出视频文件路径
+        """
+        urls = json.loads(video_url) if video_url.startswith('[') else [video_url]
+        segment_dir = f"{output_path}.shots"
+        os.makedirs(segment_dir, exist_ok=True)
+        segment_paths = [os.path.join(segment_dir, f"shot-{i:03d}.mp4") for i in range(len(urls))]
+        
+        futures = [self._run(self.generator.download_video, url, path) for url, path in zip(urls, segment_paths)]
+        for future in futures:
+            future.result()
+        
+        start_time = time.time()
+        with get_tracer().span('video.concat', **{'video.shots': len(urls)}):
+            concat_videos(segment_paths, output_path, self.ffmpeg)
+        elapsed = time.time() - start_time
+        get_metrics().histogram('image_to_video_video_concat_seconds', "拼接长视频片段的耗时（秒）").observe(elapsed, provider=self.name)
+        
+        if not self.keep_segments:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+        logger.info(f"已拼接{len(urls)}个镜头的视频片段，用时{elapsed:.2f}秒: {output_path}")
+        return output_path
+    
+    def log_stats(self):
+        """输出底层视频生成器的运行统计"""
+        self.generator.log_stats()
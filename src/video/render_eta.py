@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+from loguru import logger
+
+class RenderETAEstimator:
+    """
+    视频渲染耗时估计器
+    
+    按(model, mode, duration)记录实际观测到的渲染耗时，用历史中位数作为预计耗时，
+    并据此安排轮询时间：离预计完成时间较远时拉长间隔，接近预计完成时间时密集轮询。
+    """
+    
+    def __init__(self, history_path=None, default_eta=180, window=50, min_interval=1, max_interval=30):
+        """
+        初始化渲染耗时估计器
+        
+        Args:
+            history_path: 历史记录文件路径，为None时只保存在内存中
+            default_eta: 没有历史记录时的预计耗时（秒）
+            window: 每种参数组合保留的最近记录数
+            min_interval: 最短轮询间隔（秒）
+            max_interval: 最长轮询间隔（秒）
+        """
+        self.history_path = history_path
+        self.default_eta = default_eta
+        self.window = window
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        self._history = self._load_history()
+    
+    @staticmethod
+    def make_key(model, mode, duration):
+        """生成参数组合的键"""
+        return f"{model}|{mode}|{duration}"
+    
+    def _load_history(self):
+        """加载历史记录"""
+        if not self.history_path or not os.path.exists(self.history_path):
+            return {}
+        
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"加载渲染耗时历史失败，将重新记录: {e}")
+            return {}
+    
+    def _save_history(self):
+        """保存历史记录（调用方需持有锁）"""
+        if not self.history_path:
+            return
+        
+        history_dir = os.path.dirname(self.history_path)
+        if history_dir and not os.path.exists(history_dir):
+            os.makedirs(history_dir, exist_ok=True)
+        
+        tmp_path = f"{self.history_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._history, f)
+        os.replace(tmp_path, self.history_path)
+    
+    def record(self, key, seconds):
+        """
+        记录一次实际渲染耗时
+        
+        Args:
+            key: make_key生成的键
+            seconds: 渲染耗时（秒）
+        """
+        if seconds is None or seconds <= 0:
+            return
+        
+        with self._lock:
+            samples = self._history.setdefault(key, [])
+            samples.append(round(seconds, 2))
+            del samples[:-self.window]
+            try:
+                self._save_history()
+            except Exception as e:
+                logger.warning(f"保存渲染耗时历史失败: {e}")
+    
+    def estimate(self, key):
+        """
+        获取预计渲染耗时
+        
+        Args:
+            key: make_key生成的键
+            
+        Returns:
+            预计耗时（秒）
+        """
+        with self._lock:
+            samples = sorted(self._history.get(key, []))
+        
+        if not samples:
+            return self.default_eta
+        
+        middle = len(samples) // 2
+        if len(samples) % 2:
+            return samples[middle]
+        return (samples[middle - 1] + samples[middle]) / 2
+    
+    def next_delay(self, elapsed, eta):
+        """
+        计算距离下一次轮询的等待时间
+        
+        Args:
+            elapsed: 任务已经过的时间（秒）
+            eta: 预计渲染耗时（秒）
+            
+        Returns:
+            等待时间（秒）
+        """
+        remaining = eta - elapsed
+        # 预计完成时间前后的密集轮询窗口
+        tight_window = max(5, eta * 0.1)
+        
+        if remaining > tight_window:
+            # 离预计完成还远：等待剩余时间的一半，但不越过密集窗口
+            delay = min(remaining / 2, remaining - tight_window)
+        elif remaining > -tight_window:
+            # 接近预计完成时间：密集轮询
+            delay = self.min_interval
+        else:
+            # 已超过预计时间：随超时时长逐渐放宽间隔
+            delay = -remaining * 0.25
+        
+        return min(self.max_interval, max(self.min_interval, delay))
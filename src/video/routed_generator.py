@@ -0,0 +1,197 @@
+import threading
+from loguru import logger
+from utils.provider_router import ProviderRouter
+from .task_poller import TaskFailedError, TaskRejectedError
+
+class RoutedVideoGenerator:
+    """
+    按优先级和健康状况在多个视频生成提供商之间切换的生成器
+    
+    提交任务时依次尝试优先级列表中未熔断的提供商，失败时自动换下一个；
+    任务提交后由原提供商等待渲染结果。对外提供与KlingGenerator相同的
+    submit_task/wait_for_task/download_video等接口，可直接用于流水线。
+    """
+    
+    def __init__(self, generators, breaker_config=None):
+        """
+        初始化路由生成器
+        
+        Args:
+            generators: 按优先级排列的视频生成器实例列表
+            breaker_config: 熔断器配置字典
+        """
+        self.generators = {generator.name: generator for generator in generators}
+        self.router = ProviderRouter("视频生成", list(self.generators), breaker_config)
+        self.primary = generators[0]
+        self.name = self.primary.name
+        self.max_prompt_length = min(generator.max_prompt_length for generator in generators)
+        self.max_duration = min(generator.max_duration for generator in generators)
+        
+        self._lock = threading.Lock()
+        self._url_providers = {}  # 视频URL -> 渲染该视频的提供商
+        
+        logger.info(f"启用视频生成提供商路由，优先级: {' > '.join(self.generators)}")
+    
+    @property
+    def video_cache(self):
+        """视频缓存（所有提供商共用）"""
+        return self.primary.video_cache
+    
+    @video_cache.setter
+    def video_cache(self, cache):
+        for generator in self.generators.values():
+            generator.video_cache = cache
+    
+    def _generator_for(self, task):
+        """任务所属提供商的生成器"""
+        return self.generators.get(task.get('provider'), self.primary)
+    
+    def generate_video(self, description, output_path):
+        """
+        根据描述生成视频
+        
+        Args:
+            description: 视频描述文本
+            output_path: 输出视频文件路径
+        
+        Returns:
+            输出视频文件路径
+        """
+        if self.fetch_cached_video(description, output_path):
+            return output_path
+        
+        task = self.submit_task(description)
+        render_result = self.wait_for_task(task)
+        self.download_video(render_result['video_url'], output_path)
+        self.cache_video(description, output_path, task['task_id'])
+        return output_path
+    
+    def fetch_cached_video(self, description, output_path):
+        """从视频缓存中取出相同请求之前生成的视频（按主提供商的请求体查找）"""
+        return self.primary.fetch_cached_video(description, output_path)
+    
+    def cache_video(self, description, video_path, task_id):
+        """将下载好的视频加入视频缓存（按主提供商的请求体保存）"""
+        self.primary.cache_video(description, video_path, task_id)
+    
+    def make_external_task_id(self, job_id, description, attempt=0):
+        """生成确定性的自定义任务ID（各提供商使用同一个ID）"""
+        return self.primary.make_external_task_id(job_id, description, attempt)
+    
+    def find_task(self, external_task_id):
+        """
+        在各提供商上查询已创建的任务
+        
+        Args:
+            external_task_id: 自定义任务ID或任务ID
+        
+        Returns:
+            任务信息字典（provider为所属提供商），任务不存在时返回None
+        """
+        for name, generator in self.generators.items():
+            try:
+                task = generator.find_task(external_task_id)
+            except Exception as e:
+                logger.warning(f"在{name}上查询任务失败: {e}")
+                continue
+            if task is not None:
+                task['provider'] = name
+                return task
+        return None
+    
+    def attach_task(self, task_id, submitted_at=None):
+        """
+        重新关联一个已提交的任务，先查询任务属于哪个提供商
+        
+        Args:
+            task_id: 任务ID
+            submitted_at: 原提交时间戳
+        
+        Returns:
+            任务信息字典
+        """
+        name = self.primary.name
+        if len(self.generators) > 1:
+            existing = self.find_task(task_id)
+            if existing is not None:
+                name = existing['provider']
+        
+        task = self.generators[name].attach_task(task_id, submitted_at)
+        task['provider'] = name
+        return task
+    
+    def submit_task(self, description, external_task_id=None, resume=False):
+        """
+        按优先级向健康的提供商提交文生视频任务
+        
+        Args:
+            description: 视频描述文本
+            external_task_id: 自定义任务ID
+            resume: 是否为中断后重新提交，为True时先在各提供商上查询已创建的任务
+        
+        Returns:
+            任务信息字典，provider为接受任务的提供商
+        """
+        if resume and external_task_id:
+            existing = self.find_task(external_task_id)
+            if existing is not None:
+                name = existing['provider']
+                logger.info(f"自定义任务ID已在{name}上创建，关联已有任务: {external_task_id}")
+                created_at = existing.get('created_at')
+                task = self.generators[name].attach_task(existing['task_id'], created_at / 1000 if created_at else None)
+                task['provider'] = name
+                return task
+        
+        # 请求内容被拒绝不影响提供商的健康状况，也不再换其他提供商
+        name, task = self.router.call(
+            lambda name: self.generators[name].submit_task(description, external_task_id=external_task_id),
+            neutral_errors=(TaskRejectedError,)
+        )
+        task['provider'] = name
+        return task
+    
+    def wait_for_task(self, task):
+        """
+        在任务所属的提供商上等待任务完成
+        
+        Args:
+            task: submit_task返回的任务信息字典
+        
+        Returns:
+            渲染结果字典
+        """
+        generator = self._generator_for(task)
+        # 等待时间主要是渲染时长，只记录成功或失败，不计入提供商的延迟统计
+        try:
+            render_result = generator.wait_for_task(task)
+        except TaskFailedError:
+            # 请求内容导致的失败不影响提供商的健康状况
+            raise
+        except Exception as e:
+            self.router.record(generator.name, None, e)
+            raise
+        
+        self.router.record(generator.name, None)
+        with self._lock:
+            self._url_providers[render_result['video_url']] = generator.name
+        return render_result
+    
+    def download_video(self, video_url, output_path):
+        """
+        使用渲染该视频的提供商的连接池下载视频
+        
+        Args:
+            video_url: 视频URL
+            output_path: 输出视频文件路径
+        
+        Returns:
+            输出视频文件路径
+        """
+        with self._lock:
+            name = self._url_providers.pop(video_url, None)
+        generator = self.generators.get(name, self.primary)
+        return generator.download_video(video_url, output_path)
+    
+    def log_stats(self):
+        """输出各提供商的健康状况"""
+        self.router.log_stats()
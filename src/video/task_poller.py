@@ -0,0 +1,320 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from loguru import logger
+from utils.tracing import get_tracer
+
+class TaskFailedError(RuntimeError):
+    """视频生成任务在服务端失败（任务状态为failed）"""
+    pass
+
+class TaskRejectedError(RuntimeError):
+    """提交的任务因请求内容被拒绝（参数错误、内容审核不通过等），与提供商的健康状况无关"""
+    pass
+
+class KlingTaskPoller:
+    """
+    可灵任务状态轮询器
+    
+    在一个后台线程中集中跟踪所有未完成的任务，按轮次查询状态：
+    优先使用任务列表查询接口一次获取多个任务的状态，列表中找不到的任务
+    再逐个查询。任务成功或失败时完成对应的Future，
+    因此任意数量的并发生成任务只需要一个轮询循环。
+    
+    每个任务根据预计渲染耗时单独安排下一次查询时间，每轮只查询已到期的任务。
+    启用回调时，任务状态由notify推送驱动，轮询只作为低频的兜底。
+    每次查询和回调都记录为watch()调用时所在span的子span。
+    """
+    
+    # 尚未开始跟踪的任务最多缓存的回调数
+    MAX_EARLY_NOTIFICATIONS = 1000
+    
+    def __init__(self, generator, eta_estimator, use_list_query=True, page_size=500, max_errors=5, safety_interval=None):
+        """
+        初始化轮询器
+        
+        Args:
+            generator: KlingGenerator实例，提供endpoint和鉴权请求头
+            eta_estimator: RenderETAEstimator实例，用于安排查询时间并记录渲染耗时
+            use_list_query: 是否使用任务列表查询接口
+            page_size: 列表查询每页的任务数
+            max_errors: 单个任务连续查询失败的最大次数，超过后任务失败
+            safety_interval: 回调模式下的兜底轮询间隔（秒），为None时按预计耗时轮询
+        """
+        self.generator = generator
+        self.eta_estimator = eta_estimator
+        self.use_list_query = use_list_query
+        self.page_size = page_size
+        self.max_errors = max_errors
+        self.safety_interval = safety_interval
+        
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._tasks = {}  # task_id -> 任务跟踪信息字典
+        self._early = OrderedDict()  # 开始跟踪前收到的回调
+        self._thread = None
+        self._stopped = False
+    
+    def watch(self, task_id, eta_key=None, submitted_at=None):
+        """
+        开始跟踪一个任务
+        
+        Args:
+            task_id: 任务ID
+            eta_key: 渲染参数组合的键，用于估计和记录渲染耗时
+            submitted_at: 任务提交时间戳，默认为当前时间
+            
+        Returns:
+            Future对象，任务成功时结果为渲染结果字典
+            （video_url、video_duration、render_seconds、expected_render_seconds、polls），
+            失败时抛出异常
+        """
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                submitted_at = submitted_at or time.time()
+                eta = self.eta_estimator.estimate(eta_key)
+                entry = {
+                    'future': Future(),
+                    'errors': 0,
+                    'polls': 0,
+                    'eta_key': eta_key,
+                    'eta': eta,
+                    'submitted_at': submitted_at,
+                    'span': get_tracer().current_span()  # 查询span的父span（在轮询线程中记录）
+                }
+                self._tasks[task_id] = entry
+                self._schedule(entry)
+            early_info = self._early.pop(task_id, None)
+            self._ensure_thread()
+        
+        if early_info is not None:
+            self._handle_status(task_id, early_info, from_callback=True)
+        
+        self._wakeup.set()
+        return entry['future']
+    
+    def notify(self, task_info):
+        """
+        处理推送的任务状态（回调）
+        
+        Args:
+            task_info: 与任务查询接口data字段格式一致的任务信息字典
+        """
+        task_id = task_info.get('task_id')
+        if not task_id:
+            return
+        
+        with self._lock:
+            if task_id not in self._tasks:
+                # 回调可能早于watch到达，先缓存起来
+                self._early[task_id] = task_info
+                while len(self._early) > self.MAX_EARLY_NOTIFICATIONS:
+                    self._early.popitem(last=False)
+                return
+            parent = self._tasks[task_id]['span']
+        
+        self._trace_poll(parent, 'kling.callback', time.time(), task_id, task_info=task_info)
+        self._handle_status(task_id, task_info, from_callback=True)
+    
+    def stop(self):
+        """停止轮询线程，未完成的任务会以异常结束"""
+        with self._lock:
+            self._stopped = True
+            pending = list(self._tasks.items())
+            self._tasks.clear()
+        
+        self._wakeup.set()
+        for task_id, entry in pending:
+            entry['future'].set_exception(RuntimeError(f"轮询器已停止，任务未完成: {task_id}"))
+    
+    @property
+    def pending_count(self):
+        """当前未完成的任务数"""
+        with self._lock:
+            return len(self._tasks)
+    
+    def _ensure_thread(self):
+        """按需启动后台轮询线程（调用方需持有锁）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="kling-task-poller", daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """轮询主循环"""
+        while True:
+            now = time.time()
+            with self._lock:
+                if self._stopped:
+                    return
+                due = [task_id for task_id, entry in self._tasks.items() if entry['next_poll_at'] <= now]
+                next_poll_at = min((entry['next_poll_at'] for entry in self._tasks.values()), default=None)
+            
+            if due:
+                try:
+                    self._poll_round(due)
+                except Exception as e:
+                    # 轮询循环本身不能退出，否则所有任务都会卡住
+                    logger.warning(f"任务状态轮询出错: {e}")
+                continue
+            
+            # 等待到最早的查询时间，或有新任务加入
+            if next_poll_at is None:
+                self._wakeup.wait()
+            else:
+                self._wakeup.wait(max(0, next_poll_at - now))
+            self._wakeup.clear()
+    
+    def _poll_round(self, task_ids):
+        """执行一轮状态查询"""
+        remaining = set(task_ids)
+        with self._lock:
+            parents = {task_id: self._tasks[task_id]['span'] for task_id in task_ids if task_id in self._tasks}
+        
+        if self.use_list_query and len(task_ids) > 1:
+            start_time = time.time()
+            try:
+                task_infos = self._query_task_list()
+                for task_info in task_infos:
+                    task_id = task_info.get('task_id')
+                    if task_id in remaining:
+                        remaining.discard(task_id)
+                        self._trace_poll(parents.get(task_id), 'kling.poll', start_time, task_id, 'list', task_info)
+                        self._handle_status(task_id, task_info)
+            except Exception as e:
+                logger.warning(f"任务列表查询失败，改为逐个查询: {e}")
+        
+        for task_id in remaining:
+            start_time = time.time()
+            try:
+                task_info = self._query_task(task_id)
+            except Exception as e:
+                self._trace_poll(parents.get(task_id), 'kling.poll', start_time, task_id, 'single', error=e)
+                self._handle_error(task_id, e)
+                continue
+            self._trace_poll(parents.get(task_id), 'kling.poll', start_time, task_id, 'single', task_info)
+            self._handle_status(task_id, task_info)
+        
+        logger.debug(f"完成一轮任务状态查询，跟踪任务数: {len(task_ids)}")
+    
+    @staticmethod
+    def _trace_poll(parent, name, start_time, task_id, query=None, task_info=None, error=None):
+        """记录一次状态查询（或回调）的span，任务不在追踪上下文中时忽略"""
+        if parent is None:
+            return
+        get_tracer().record(name, start_time, parent=parent, error=error, **{
+            'kling.task_id': task_id,
+            'kling.query': query,
+            'kling.task_status': (task_info or {}).get('task_status')
+        })
+    
+    def _get(self, path, params=None):
+        """发送GET请求并检查业务错误码"""
+        response = self.generator._api_request('GET', path, params=params)
+        response.raise_for_status()
+        
+        result = response.json()
+        if result.get('code') != 0:
+            error_message = result.get('message', '未知错误')
+            raise RuntimeError(f"查询任务状态失败: {error_message}")
+        
+        return result.get('data')
+    
+    def _query_task_list(self):
+        """通过任务列表接口查询最近的任务"""
+        params = {"pageNum": 1, "pageSize": self.page_size}
+        return self._get("/v1/videos/text2video", params=params) or []
+    
+    def _query_task(self, task_id):
+        """查询单个任务"""
+        return self._get(f"/v1/videos/text2video/{task_id}") or {}
+    
+    def _schedule(self, entry):
+        """安排任务的下一次查询时间（调用方需持有锁）"""
+        now = time.time()
+        if self.safety_interval:
+            delay = self.safety_interval
+        else:
+            delay = self.eta_estimator.next_delay(now - entry['submitted_at'], entry['eta'])
+        entry['next_poll_at'] = now + delay
+        return delay
+    
+    def _handle_error(self, task_id, error):
+        """记录单个任务的查询错误，连续失败过多时结束任务"""
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                return
+            entry['errors'] += 1
+            if entry['errors'] < self.max_errors:
+                self._schedule(entry)
+                logger.warning(f"查询任务状态失败({entry['errors']}/{self.max_errors})，任务ID: {task_id}，错误: {error}")
+                return
+            del self._tasks[task_id]
+        
+        entry['future'].set_exception(error)
+    
+    def _handle_status(self, task_id, task_info, from_callback=False):
+        """根据任务状态决定是否完成对应的Future"""
+        status = task_info.get('task_status')
+        
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None:
+                return
+            if not from_callback:
+                entry['errors'] = 0
+                entry['polls'] += 1
+            if status in ['submitted', 'processing']:
+                if from_callback:
+                    return
+                elapsed = time.time() - entry['submitted_at']
+                delay = self._schedule(entry)
+                logger.info(
+                    f"视频生成中，任务ID: {task_id}，当前状态: {status}，"
+                    f"已用时{elapsed:.0f}秒/预计{entry['eta']:.0f}秒，{delay:.1f}秒后再次查询"
+                )
+                return
+            del self._tasks[task_id]
+        
+        future = entry['future']
+        
+        if status == 'succeed':
+            # 任务成功，获取视频URL
+            videos = (task_info.get('task_result') or {}).get('videos') or []
+            if videos:
+                render_seconds = self._render_seconds(task_info, entry)
+                self.eta_estimator.record(entry['eta_key'], render_seconds)
+                
+                result = {
+                    'task_id': task_id,
+                    'video_url': videos[0].get('url'),
+                    'video_duration': videos[0].get('duration'),
+                    'render_seconds': render_seconds,
+                    'expected_render_seconds': entry['eta'],
+                    'polls': entry['polls']
+                }
+                logger.info(
+                    f"视频生成成功，任务ID: {task_id}，时长: {result['video_duration']}秒，"
+                    f"渲染用时{render_seconds:.0f}秒（预计{entry['eta']:.0f}秒），"
+                    f"查询{entry['polls']}次，URL: {result['video_url']}"
+                )
+                future.set_result(result)
+            else:
+                future.set_exception(ValueError("任务成功但未找到视频URL"))
+        elif status == 'failed':
+            error_message = task_info.get('task_status_msg', '未知错误')
+            future.set_exception(TaskFailedError(f"视频生成失败: {error_message}"))
+        else:
+            future.set_exception(RuntimeError(f"未知的任务状态: {status}"))
+    
+    @staticmethod
+    def _render_seconds(task_info, entry):
+        """计算实际渲染耗时，优先使用服务端记录的创建/更新时间"""
+        created_at = task_info.get('created_at')
+        updated_at = task_info.get('updated_at')
+        if created_at and updated_at and updated_at > created_at:
+            return (updated_at - created_at) / 1000
+        return time.time() - entry['submitted_at']
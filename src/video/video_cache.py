@@ -0,0 +1,142 @@
+import os
+import json
+import shutil
+import tempfile
+import hashlib
+from loguru import logger
+from utils.disk_cache import DiskCache
+
+# 不影响生成结果的请求字段，不参与缓存键计算
+_VOLATILE_FIELDS = ('callback_url', 'external_task_id')
+
+class VideoCache(DiskCache):
+    """
+    生成视频缓存
+    
+    以规范化的文生视频请求体哈希作为键保存下载好的MP4文件，
+    相同的prompt和渲染参数再次请求时直接从缓存取出，不再提交任务。
+    视频文件较大，条目按字节预算做LRU淘汰。
+    """
+    
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None, max_age=None, refresh=False):
+        """
+        初始化视频缓存
+        
+        Args:
+            cache_dir: 缓存目录
+            max_entries: 最多保存的条目数
+            max_bytes: 最多占用的字节数
+            max_age: 条目最长保存时间（秒）
+            refresh: 为True时不读取缓存，总是重新生成
+        """
+        super().__init__(cache_dir, max_entries, max_bytes, max_age, name='视频缓存', refresh=refresh)
+    
+    @staticmethod
+    def make_key(request_payload):
+        """
+        生成缓存键
+        
+        Args:
+            request_payload: 文生视频请求体字典
+            
+        Returns:
+            十六进制的SHA-256字符串
+        """
+        canonical = {k: v for k, v in request_payload.items() if k not in _VOLATILE_FIELDS}
+        raw = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+    
+    @staticmethod
+    def _link_or_copy(src, dst):
+        """将文件硬链接到目标位置，跨文件系统等无法硬链接时复制"""
+        dst_dir = os.path.dirname(dst)
+        if dst_dir:
+            os.makedirs(dst_dir, exist_ok=True)
+        
+        # 每个写入方在目标目录中使用自己的临时文件名，写完后原子替换
+        fd, tmp_path = tempfile.mkstemp(dir=dst_dir or '.', prefix=f"{os.path.basename(dst)}.", suffix='.tmp')
+        os.close(fd)
+        try:
+            # 硬链接要求目标不存在，先删除占位的空文件（文件名随机，不会与其他写入方冲突）
+            os.remove(tmp_path)
+            try:
+                os.link(src, tmp_path)
+            except OSError:
+                shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, dst)
+        finally:
+            # 出错时，或目标已是同一文件的硬链接（此时rename不做任何操作）时临时文件仍在
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+    
+    def fetch(self, key, output_path):
+        """
+        从缓存取出视频到输出路径
+        
+        Args:
+            key: 缓存键
+            output_path: 输出视频文件路径
+            
+        Returns:
+            条目元数据字典，未命中时返回None
+        """
+        meta = self.get(key)
+        if meta is None:
+            return None
+        
+        video_path = self.data_path(key, '.mp4')
+        if not os.path.exists(video_path):
+            logger.warning(f"视频缓存条目缺少视频文件，已删除: {key[:12]}")
+            self.delete(key)
+            return None
+        
+        self._link_or_copy(video_path, output_path)
+        logger.info(f"视频缓存命中: {key[:12]}，原任务ID: {meta.get('task_id')}，已输出到: {output_path}")
+        return meta
+    
+    def store(self, key, video_path, task_id, request_payload):
+        """
+        将下载好的视频加入缓存
+        
+        Args:
+            key: 缓存键
+            video_path: 已下载的视频文件路径
+            task_id: 生成该视频的任务ID
+            request_payload: 文生视频请求体字典
+        """
+        try:
+            self._link_or_copy(video_path, self.data_path(key, '.mp4'))
+            self.put(key, {
+                'task_id': task_id,
+                'size': os.path.getsize(video_path),
+                'request': {k: v for k, v in request_payload.items() if k not in _VOLATILE_FIELDS}
+            })
+            logger.info(f"视频已加入缓存: {key[:12]}，任务ID: {task_id}")
+        except Exception as e:
+            # 缓存写入失败不影响主流程
+            logger.warning(f"写入视频缓存失败: {e}")
+
+def create_video_cache(cache_config, refresh=False):
+    """
+    根据配置创建视频缓存
+    
+    Args:
+        cache_config: 视频缓存配置字典（enabled、dir、max_entries、max_bytes、max_age_days）
+        refresh: 是否忽略已有缓存
+        
+    Returns:
+        VideoCache实例，未启用时返回None
+    """
+    if not cache_config.get('enabled', True):
+        return None
+    
+    max_age_days = cache_config.get('max_age_days')
+    return VideoCache(
+        cache_config.get('dir', 'cache/videos'),
+        max_entries=cache_config.get('max_entries'),
+        max_bytes=cache_config.get('max_bytes'),
+        max_age=max_age_days * 86400 if max_age_days else None,
+        refresh=refresh
+    )
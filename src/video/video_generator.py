@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from loguru import logger
+from utils.provider_registry import load_provider_class
 
 class VideoGenerator(ABC):
     """视频生成器抽象基类"""
@@ -33,22 +34,20 @@ class VideoGenerator(ABC):
         """
         pass
 
-from .kling_generator import KlingGenerator
-
-def get_video_generator(config):
+def get_video_generator(config, video_cache=None):
     """
     根据配置创建视频生成器
     
     Args:
         config: 视频生成模型配置字典
+        video_cache: VideoCache实例，为None时不使用缓存
         
     Returns:
         VideoGenerator实例
     """
-    name = config.get('name', '').lower()
+    # 按配置中的type（或name）从注册表加载，只导入被选中的提供商模块
+    generator_class = load_provider_class('video_generator', config)
+    generator = generator_class(config)
     
-    if '可灵' in name or 'kling' in name:
-        return KlingGenerator(config)
-    else:
-        logger.error(f"不支持的视频生成模型类型: {name}")
-        raise ValueError(f"不支持的视频生成模型类型: {name}")
+    generator.video_cache = video_cache
+    return generator
@@ -0,0 +1,12 @@
+# 批处理流水线测试
+import os
+
+from pipeline.batch_pipeline import _description_filename, _default_output_path
+
+def test_description_files_do_not_collide_for_same_image_name():
+    first = _default_output_path(os.path.join('a', 'photo.jpg'), None)
+    second = _default_output_path(os.path.join('b', 'photo.jpg'), None)
+    
+    assert _description_filename(first) != _description_filename(second)
+    assert _description_filename(first).startswith('photo_video_')
+    assert _description_filename(first) == _description_filename(first)
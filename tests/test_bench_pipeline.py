@@ -0,0 +1,28 @@
+# 基准冒烟测试：以极小规模运行bench_pipeline.py，防止基准脚本与main.py或配置脱节后无人发现
+import os
+import sys
+import json
+import subprocess
+
+BENCH_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'bench_pipeline.py')
+
+def test_bench_pipeline_smoke(tmp_path):
+    json_path = str(tmp_path / 'results.json')
+    command = [
+        sys.executable, BENCH_SCRIPT, '--images', '2', '--concurrency', '1', '--image-size', '64',
+        '--llm-latency', 'fixed:0.05', '--kling-latency', 'fixed:0.01', '--render-time', 'fixed:0.5',
+        '--video-bytes', '1024', '--seed', '1', '--json', json_path
+    ]
+    process = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', timeout=120)
+    assert process.returncode == 0, process.stdout + process.stderr
+    
+    with open(json_path, 'r', encoding='utf-8') as f:
+        results = json.load(f)['results']
+    assert len(results) == 1
+    result = results[0]
+    assert result['returncode'] == 0, result['output_tail']
+    assert (result['succeeded'], result['failed']) == (2, 0)
+    assert result['latency']['job']['succeeded']['count'] == 2
+    requests = result['mock']['requests']
+    assert requests['llm'] == {'200': 2}
+    assert requests['kling_create'] == {'200': 2}
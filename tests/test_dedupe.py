@@ -0,0 +1,96 @@
+# 近似图片去重测试：感知哈希距离、BK树查询和代表图片的认领与等待
+import io
+import random
+import threading
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance
+
+from utils.perceptual_hash import dhash, phash, hamming_distance, compute_perceptual_hash, BKTree
+from pipeline.dedupe import DescriptionDeduper
+
+def scene(seed):
+    """生成由随机色块组成的测试图片"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', (320, 240), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(300), rng.randrange(220)
+        draw.rectangle([x, y, x + rng.randrange(20, 120), y + rng.randrange(20, 120)], fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+def near_duplicate(image):
+    """缩小、调亮并以较低质量重新压缩"""
+    image = ImageEnhance.Brightness(image.resize((256, 192))).enhance(1.1)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=40)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+@pytest.mark.parametrize('method', [dhash, phash])
+def test_near_duplicates_are_close_and_distinct_images_are_far(method):
+    original = scene(1)
+    
+    assert hamming_distance(method(original), method(near_duplicate(original))) <= 6
+    for seed in range(2, 6):
+        assert hamming_distance(method(original), method(scene(seed))) > 12
+
+def test_unknown_hash_method_is_rejected():
+    with pytest.raises(ValueError):
+        compute_perceptual_hash(scene(1), 'ahash')
+    with pytest.raises(ValueError):
+        DescriptionDeduper({'hash': 'ahash'})
+
+def test_bk_tree_search_matches_brute_force():
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    # 加入一些彼此接近的哈希
+    values += [values[0] ^ (1 << bit) for bit in range(10)]
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, index)
+    assert len(tree) == len(values)
+    
+    for query in values[:20] + [rng.getrandbits(64) for _ in range(20)]:
+        expected = sorted(
+            (hamming_distance(query, value), index) for index, value in enumerate(values)
+            if hamming_distance(query, value) <= 8
+        )
+        found = tree.search(query, 8)
+        assert sorted(found) == expected
+        assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+def test_near_duplicate_waits_for_representative_description():
+    deduper = DescriptionDeduper({'max_distance': 6})
+    original = scene(1)
+    
+    cluster, is_new = deduper.claim(dhash(original), 'a.jpg')
+    assert is_new
+    member, member_is_new = deduper.claim(dhash(near_duplicate(original)), 'b.jpg')
+    other, other_is_new = deduper.claim(dhash(scene(2)), 'c.jpg')
+    assert member is cluster and not member_is_new
+    assert other is not cluster and other_is_new
+    
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(deduper.wait(member)))
+    waiter.start()
+    waiter.join(timeout=0.1)
+    assert waiter.is_alive()
+    
+    deduper.resolve(cluster, '描述')
+    waiter.join(timeout=1)
+    assert results == ['描述']
+    assert deduper.stats() == {'representatives': 2, 'reused': 1, 'fallbacks': 0}
+
+def test_failed_representative_falls_back_and_stops_collecting():
+    deduper = DescriptionDeduper()
+    value = dhash(scene(1))
+    cluster, _ = deduper.claim(value, 'a.jpg')
+    member, _ = deduper.claim(value, 'b.jpg')
+    
+    deduper.fail(cluster, RuntimeError('llm down'))
+    assert deduper.wait(member) is None
+    
+    # 失败的组不再接收新成员，下一张相同的图片成为新的代表
+    retry, is_new = deduper.claim(value, 'c.jpg')
+    assert is_new and retry is not cluster
+    assert deduper.stats() == {'representatives': 2, 'reused': 0, 'fallbacks': 1}
@@ -0,0 +1,92 @@
+# 磁盘缓存测试：描述缓存的命中与未命中、缓存键和LRU淘汰
+import os
+
+from utils.disk_cache import DiskCache
+from utils.image_utils import ImagePayload
+from llm.description_cache import DescriptionCache
+
+class FakeClient:
+    """只提供缓存键所需属性的LLM客户端"""
+    
+    def __init__(self, name='openai', model='gpt-4o', temperature=0.7):
+        self.name = name
+        self.model = model
+        self.system_prompt = 'describe'
+        self.max_tokens = 300
+        self.temperature = temperature
+        self.stream = False
+        self.max_description_chars = None
+
+def payload(data=b'image'):
+    return ImagePayload(data, 'image/jpeg', 64, 48)
+
+def test_description_hit_and_miss(tmp_path):
+    cache = DescriptionCache(str(tmp_path))
+    client = FakeClient()
+    key = DescriptionCache.make_key(client, payload())
+    
+    assert cache.get_description(key) is None
+    cache.put_description(key, '海边的日落', client)
+    assert cache.get_description(key) == '海边的日落'
+    assert (cache.hits, cache.misses) == (1, 1)
+    
+    # 新实例从磁盘读取，refresh时总是未命中
+    assert DescriptionCache(str(tmp_path)).get_description(key) == '海边的日落'
+    assert DescriptionCache(str(tmp_path), refresh=True).get_description(key) is None
+
+def test_key_depends_on_image_and_llm_params():
+    client = FakeClient()
+    key = DescriptionCache.make_key(client, payload())
+    
+    assert DescriptionCache.make_key(FakeClient(), payload()) == key
+    assert DescriptionCache.make_key(client, payload(b'other')) != key
+    assert DescriptionCache.make_key(FakeClient(model='gpt-4o-mini'), payload()) != key
+    assert DescriptionCache.make_key(FakeClient(temperature=0.2), payload()) != key
+    assert DescriptionCache.make_key(client, payload(), variant={'shots': 3}) != key
+
+def test_corrupt_entry_is_removed(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.put('ab01', {'value': 1})
+    with open(cache.meta_path('ab01'), 'w', encoding='utf-8') as f:
+        f.write('{')
+    
+    assert cache.get('ab01') is None
+    assert not os.path.exists(cache.meta_path('ab01'))
+
+def test_lru_eviction_by_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=3)
+    for key in ('aa', 'bb', 'cc'):
+        cache.put(key, {'key': key})
+    cache.get('aa')
+    cache.put('dd', {'key': 'dd'})
+    
+    # 超出限制后成批淘汰到限制的90%以下，最近访问过的aa保留
+    assert cache.get('aa') is not None
+    assert cache.get('dd') is not None
+    assert cache.get('bb') is None
+    assert cache.get('cc') is None
+
+def test_lru_eviction_by_bytes_counts_data_files(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=3000)
+    for key in ('aa', 'bb', 'cc'):
+        os.makedirs(os.path.dirname(cache.data_path(key, '.bin')), exist_ok=True)
+        with open(cache.data_path(key, '.bin'), 'wb') as f:
+            f.write(b'x' * 1000)
+        cache.put(key, {'key': key})
+    
+    assert cache.get('aa') is None
+    assert not os.path.exists(cache.data_path('aa', '.bin'))
+    assert cache.get('cc') is not None
+
+def test_index_is_rebuilt_from_disk_in_access_order(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=10)
+    for index, key in enumerate(('aa', 'bb', 'cc')):
+        cache.put(key, {'key': key})
+        os.utime(cache.meta_path(key), (1000 + index, 1000 + index))
+    # 最早写入的条目最近被访问过，重启后排在最后
+    os.utime(cache.meta_path('aa'), (2000, 2000))
+    
+    reopened = DiskCache(str(tmp_path), max_entries=3)
+    reopened.put('dd', {'key': 'dd'})
+    
+    assert [key for key in ('aa', 'bb', 'cc', 'dd') if reopened.get(key) is not None] == ['aa', 'dd']
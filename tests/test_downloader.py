@@ -0,0 +1,147 @@
+# 下载器测试：在本地HTTP服务上验证分段下载、不支持Range时的整体下载和断点续传
+import os
+import re
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from utils.downloader import Downloader, DownloadError
+
+DATA = bytes(range(256)) * 40  # 10240字节
+SEGMENT_SIZE = 1000
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """按服务器上的配置返回DATA，支持Range、整体下载和指定分段失败"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, code, body, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        server = self.server
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if not server.support_range or match is None:
+            server.record('whole')
+            return self._send(200, DATA)
+        
+        start, end = int(match.group(1)), int(match.group(2))
+        server.record(start)
+        if start in server.fail_starts:
+            return self._send(500, b'error')
+        
+        body = DATA[start:end + 1]
+        if start in server.short_starts:
+            body = body[:-1]
+        self._send(206, body, {'Content-Range': f"bytes {start}-{start + len(body) - 1}/{len(DATA)}", 'ETag': '"v1"'})
+
+class FileServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _FileHandler)
+        self.support_range = True
+        self.fail_starts = set()   # 返回500的分段起始位置
+        self.short_starts = set()  # 少返回1字节的分段起始位置
+        self.requests = []
+        self._lock = threading.Lock()
+    
+    def record(self, start):
+        with self._lock:
+            self.requests.append(start)
+    
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/video.mp4"
+
+@pytest.fixture
+def server():
+    server = FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def downloader():
+    session = requests.Session()
+    yield Downloader(session, {'chunk_size': 256, 'segment_size': SEGMENT_SIZE, 'max_workers': 4, 'max_retries': 0})
+    session.close()
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_range_download_in_segments(server, downloader, tmp_path):
+    output_path = str(tmp_path / 'out.mp4')
+    
+    assert downloader.download(server.url, output_path) == len(DATA)
+    assert read(output_path) == DATA
+    # 探测请求加上每个分段一次
+    assert sorted(start for start in server.requests if start != 0) == list(range(SEGMENT_SIZE, len(DATA), SEGMENT_SIZE))
+    assert not os.path.exists(output_path + '.part')
+    assert not os.path.exists(output_path + '.part.json')
+
+def test_falls_back_to_whole_download_without_range(server, downloader, tmp_path):
+    server.support_range = False
+    output_path = str(tmp_path / 'out.mp4')
+    
+    assert downloader.download(server.url, output_path) == len(DATA)
+    assert read(output_path) == DATA
+    assert server.requests == ['whole', 'whole']
+
+def test_resume_after_interruption(server, downloader, tmp_path):
+    output_path = str(tmp_path / 'out.mp4')
+    failed_start = 3 * SEGMENT_SIZE
+    server.fail_starts.add(failed_start)
+    
+    with pytest.raises(DownloadError):
+        downloader.download(server.url, output_path)
+    assert not os.path.exists(output_path)
+    with open(output_path + '.part.json', 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    assert '3' not in state['done']
+    assert all(written == SEGMENT_SIZE for index, written in state['done'].items() if index != '10')
+    
+    # 恢复后只重新下载未完成的分段
+    server.fail_starts.clear()
+    server.requests.clear()
+    assert downloader.download(server.url, output_path) == len(DATA)
+    assert read(output_path) == DATA
+    assert server.requests == [0, failed_start]
+
+def test_short_segment_is_rejected(server, downloader, tmp_path):
+    output_path = str(tmp_path / 'out.mp4')
+    server.short_starts.add(2 * SEGMENT_SIZE)
+    
+    with pytest.raises(DownloadError):
+        downloader.download(server.url, output_path)
+    assert not os.path.exists(output_path)
+
+def test_state_with_wrong_byte_counts_is_redownloaded(server, downloader, tmp_path):
+    output_path = str(tmp_path / 'out.mp4')
+    segments = len(range(0, len(DATA), SEGMENT_SIZE))
+    # 预先扩展到总大小的.part文件和记录字节数不对的状态：按文件大小校验无法发现
+    with open(output_path + '.part', 'wb') as f:
+        f.truncate(len(DATA))
+    with open(output_path + '.part.json', 'w', encoding='utf-8') as f:
+        done = {str(index): SEGMENT_SIZE for index in range(segments)}
+        done['5'] = 10
+        json.dump({'total': len(DATA), 'etag': '"v1"', 'done': done}, f)
+    
+    assert downloader.download(server.url, output_path) == len(DATA)
+    # 最后一段和字节数不对的第5段需要重新下载
+    assert sorted(server.requests) == [0, 5 * SEGMENT_SIZE, (segments - 1) * SEGMENT_SIZE]
+    assert read(output_path)[5 * SEGMENT_SIZE:6 * SEGMENT_SIZE] == DATA[5 * SEGMENT_SIZE:6 * SEGMENT_SIZE]
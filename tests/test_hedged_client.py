@@ -0,0 +1,56 @@
+# 对冲请求测试：备用提供商胜出后，主提供商落败的请求被中止并释放并发名额
+import time
+import pytest
+
+from mock_servers import MockServer
+from llm.llm_client import OpenAIClient, ClaudeClient
+from llm.hedged_client import HedgedLLMClient
+from utils.image_utils import ImagePayload
+
+@pytest.fixture
+def slow_server():
+    # 首个事件很快返回，之后逐个事件缓慢生成，完整响应约需6秒
+    server = MockServer({
+        'endpoints': {'llm': {'latency': 0.05}},
+        'stream_chunks': 30,
+        'stream_interval': 0.2,
+        'seed': 1
+    }).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def fast_server():
+    server = MockServer({'endpoints': {'llm': {'latency': 0.05}}, 'stream_chunks': 2, 'seed': 1}).start()
+    yield server
+    server.stop()
+
+def test_losing_non_streaming_request_releases_slot(slow_server, fast_server):
+    # 两个提供商都未配置stream，对冲时仍以流式发送，落败的请求可以中止
+    primary = OpenAIClient({
+        'name': 'hedge-test-primary',
+        'endpoint': f"{slow_server.url}/v1/chat/completions",
+        'api_key': 'test',
+        'model': 'slow-model'
+    })
+    backup = ClaudeClient({
+        'name': 'hedge-test-backup',
+        'endpoint': f"{fast_server.url}/v1/messages",
+        'api_key': 'test',
+        'model': 'fast-model'
+    })
+    client = HedgedLLMClient(primary, backup, {'initial_delay': 0.3, 'min_delay': 0.1})
+    image = ImagePayload(b'\xff\xd8fake-jpeg', 'image/jpeg', 64, 48)
+    
+    start_time = time.time()
+    description = client.generate_description(image)
+    
+    assert description
+    assert client.stats['backup_wins'] == 1
+    # 主提供商的完整响应需要约6秒，被放弃后应在下一个事件处释放名额
+    deadline = start_time + 3
+    while primary.governor.in_flight and time.time() < deadline:
+        time.sleep(0.05)
+    assert primary.governor.in_flight == 0
+    assert backup.governor.in_flight == 0
+    assert time.time() - start_time < 3
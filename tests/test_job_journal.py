@@ -0,0 +1,92 @@
+# 任务日志测试：重新登记任务时保留提交次数，单张图片模式从日志中的阶段继续
+import pytest
+from PIL import Image
+
+from utils import job_journal
+from utils.job_journal import JobJournal
+from pipeline.batch_pipeline import BatchPipeline, BatchJob
+
+class FakeLLMClient:
+    max_description_chars = None
+
+class FakeVideoGenerator:
+    """记录提交和关联调用的视频生成器，下载时写入固定内容"""
+    
+    max_prompt_length = None
+    
+    def __init__(self):
+        self.calls = []
+    
+    def make_external_task_id(self, job_id, description, attempt):
+        return f"{job_id}-{attempt}"
+    
+    def submit_task(self, description, external_task_id=None, resume=False):
+        self.calls.append(('submit', external_task_id, resume))
+        return {'task_id': f"task-{len(self.calls)}"}
+    
+    def attach_task(self, task_id, submitted_at=None):
+        self.calls.append(('attach', task_id))
+        return {'task_id': task_id}
+    
+    def wait_for_task(self, task):
+        return {'task_id': task['task_id'], 'video_url': f"http://example.invalid/{task['task_id']}.mp4"}
+    
+    def fetch_cached_video(self, description, output_path):
+        return False
+    
+    def download_video(self, video_url, output_path):
+        with open(output_path, 'wb') as f:
+            f.write(b'video')
+    
+    def cache_video(self, description, output_path, task_id):
+        pass
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / 'jobs.sqlite3'))
+    yield journal
+    journal.close()
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = str(tmp_path / 'photo.jpg')
+    Image.new('RGB', (64, 48), (120, 80, 40)).save(path, format='JPEG')
+    return path
+
+def test_reset_keeps_and_increments_attempts(journal):
+    journal.start('job', 'a.jpg', 'a.mp4')
+    journal.update('job', stage=job_journal.STAGE_DESCRIBED, description='desc', attempts=2, task_id='old')
+    
+    record = journal.reset('job', 'a.jpg', 'a.mp4')
+    
+    assert record['stage'] == job_journal.STAGE_PENDING
+    assert record['attempts'] == 3
+    assert record['description'] is None
+    assert record['task_id'] is None
+
+def test_single_image_run_reattaches_submitted_task(journal, image_path, tmp_path):
+    output_path = str(tmp_path / 'photo.mp4')
+    job_id = JobJournal.make_job_id(image_path, output_path)
+    journal.start(job_id, image_path, output_path)
+    journal.update(job_id, stage=job_journal.STAGE_SUBMITTED, description='desc', task_id='running', submitted_at=1.0)
+    generator = FakeVideoGenerator()
+    
+    job = BatchPipeline(FakeLLMClient(), generator, journal=journal).process(BatchJob(0, image_path, output_path))
+    
+    assert job.error is None
+    assert generator.calls == [('attach', 'running')]
+    assert journal.get(job_id)['stage'] == job_journal.STAGE_DONE
+
+def test_single_image_run_regenerates_done_job_with_new_external_id(journal, image_path, tmp_path):
+    output_path = str(tmp_path / 'photo.mp4')
+    job_id = JobJournal.make_job_id(image_path, output_path)
+    journal.start(job_id, image_path, output_path)
+    journal.update(job_id, stage=job_journal.STAGE_DONE, description='desc', task_id='old')
+    generator = FakeVideoGenerator()
+    pipeline = BatchPipeline(FakeLLMClient(), generator, journal=journal)
+    pipeline._generate_description = lambda job: 'new desc'
+    
+    job = pipeline.process(BatchJob(0, image_path, output_path))
+    
+    assert job.error is None
+    assert generator.calls == [('submit', f"{job_id}-1", False)]
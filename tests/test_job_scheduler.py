@@ -0,0 +1,115 @@
+# 调度器测试：优先级顺序、租户加权轮转、保留名额和抢占
+import queue
+import threading
+import pytest
+
+from pipeline.job_scheduler import JobScheduler, STOP
+
+CONFIG = {
+    'classes': [
+        {'name': 'interactive', 'reserved_slots': 1},
+        {'name': 'batch', 'preemptible': True}
+    ]
+}
+
+class Job:
+    def __init__(self, name, priority=None, tenant=None):
+        self.name = name
+        self.priority = priority
+        self.tenant = tenant
+    
+    def __repr__(self):
+        return self.name
+
+def drain(scheduler):
+    names = []
+    while scheduler.qsize():
+        names.append(scheduler.get(timeout=1).name)
+    return names
+
+def test_higher_priority_first_then_fifo():
+    scheduler = JobScheduler(CONFIG)
+    scheduler.put(Job('b1'))
+    scheduler.put(Job('b2', 'batch'))
+    scheduler.put(Job('i1', 'interactive'))
+    scheduler.put(Job('u1', 'unknown'))
+    
+    # 未指定或未知的优先级按默认（最低）级别处理
+    assert drain(scheduler) == ['i1', 'b1', 'b2', 'u1']
+
+def test_tenants_share_a_class_by_weight():
+    scheduler = JobScheduler(dict(CONFIG, tenant_weights={'a': 2}))
+    for index in range(6):
+        scheduler.put(Job(f"a{index}", tenant='a'))
+    for index in range(3):
+        scheduler.put(Job(f"b{index}", tenant='b'))
+    
+    # 租户a权重为2，每轮取两个；b虽然后入队也不会等到a全部完成
+    assert drain(scheduler) == ['a0', 'a1', 'b0', 'a2', 'a3', 'b1', 'a4', 'a5', 'b2']
+
+def test_reserved_slot_is_kept_for_higher_priority():
+    scheduler = JobScheduler(CONFIG, slots=2)
+    scheduler.put(Job('b1'))
+    scheduler.put(Job('b2'))
+    assert scheduler.get(timeout=1).name == 'b1'
+    
+    # 批量任务最多占用1个名额，剩下的名额留给交互任务
+    with pytest.raises(queue.Empty):
+        scheduler.get(timeout=0.1)
+    scheduler.put(Job('i1', 'interactive'))
+    assert scheduler.get(timeout=1).name == 'i1'
+    assert scheduler.stats()['in_use'] == 2
+    
+    scheduler.release()
+    scheduler.release()
+    assert scheduler.get(timeout=1).name == 'b2'
+
+def test_full_queue_preempts_newest_batch_job():
+    preempted = []
+    scheduler = JobScheduler(CONFIG, maxsize=2, on_preempt=preempted.append)
+    scheduler.put(Job('b1'))
+    scheduler.put(Job('b2'))
+    
+    scheduler.put(Job('i1', 'interactive'))
+    
+    assert [job.name for job in preempted] == ['b2']
+    assert scheduler.stats()['preempted'] == 1
+    assert drain(scheduler) == ['i1', 'b1']
+
+def test_rejected_victim_is_put_back():
+    scheduler = JobScheduler(CONFIG, maxsize=2, on_preempt=lambda job: False)
+    scheduler.put(Job('b1'))
+    scheduler.put(Job('b2'))
+    
+    # 接收方拒绝时被挤出的任务放回本队列，等到有空位再入队
+    thread = threading.Thread(target=scheduler.put, args=(Job('i1', 'interactive'),))
+    thread.start()
+    assert scheduler.get(timeout=1).name == 'i1'
+    assert scheduler.get(timeout=1).name == 'b1'
+    thread.join(timeout=1)
+    assert not thread.is_alive()
+    assert drain(scheduler) == ['b2']
+
+def test_disabled_preemption_blocks_instead():
+    preempted = []
+    scheduler = JobScheduler(CONFIG, maxsize=1, on_preempt=preempted.append)
+    scheduler.put(Job('b1'))
+    scheduler.disable_preemption()
+    
+    thread = threading.Thread(target=scheduler.put, args=(Job('i1', 'interactive'),))
+    thread.start()
+    thread.join(timeout=0.2)
+    assert thread.is_alive()
+    
+    assert scheduler.get(timeout=1).name == 'b1'
+    thread.join(timeout=1)
+    assert preempted == []
+    assert scheduler.get(timeout=1).name == 'i1'
+
+def test_stop_is_returned_after_queued_jobs():
+    scheduler = JobScheduler(CONFIG)
+    scheduler.put(Job('b1'))
+    scheduler.put(STOP)
+    
+    assert scheduler.get(timeout=1).name == 'b1'
+    assert scheduler.get(timeout=1) is STOP
@@ -0,0 +1,101 @@
+# 任务服务器测试：输出路径限制在output_dir内、未完成任务数上限和无效的请求体长度
+import json
+import socket
+import threading
+import http.client
+import pytest
+from PIL import Image
+
+from pipeline.job_server import JobServer, JobRejectedError
+
+class FakePipeline:
+    """只记录提交的任务，任务一直处于排队状态"""
+    
+    priority_classes = ['default']
+    
+    def __init__(self):
+        self.jobs = []
+        self._lock = threading.Lock()
+    
+    def start(self):
+        pass
+    
+    def stop(self):
+        pass
+    
+    def stats(self):
+        return {}
+    
+    def submit(self, job):
+        with self._lock:
+            self.jobs.append(job)
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = str(tmp_path / 'photo.jpg')
+    Image.new('RGB', (32, 24)).save(path, format='JPEG')
+    return path
+
+@pytest.fixture
+def server(tmp_path):
+    server = JobServer(FakePipeline(), {
+        'port': 0,
+        'upload_dir': str(tmp_path / 'uploads'),
+        'output_dir': str(tmp_path / 'videos'),
+        'max_pending_jobs': 3
+    }).start()
+    yield server
+    server.stop()
+
+def post(server, body, headers=None):
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=5)
+    try:
+        connection.request('POST', '/jobs', body=body, headers=dict({'Content-Type': 'application/json'}, **(headers or {})))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def test_output_path_is_kept_inside_output_dir(server, image_path, tmp_path):
+    status, info = post(server, json.dumps({'image_path': image_path, 'output_path': 'team/clip.mp4'}))
+    assert status == 202
+    assert info['output_path'] == str((tmp_path / 'videos' / 'team' / 'clip.mp4').resolve())
+    
+    for output_path in ('../escape.mp4', str(tmp_path / 'elsewhere.mp4'), '.'):
+        status, info = post(server, json.dumps({'image_path': image_path, 'output_path': output_path}))
+        assert status == 400, output_path
+    assert len(server.pipeline.jobs) == 1
+
+def test_pending_limit_holds_under_concurrent_submits(server, image_path):
+    results = []
+    
+    def submit():
+        try:
+            results.append(server.submit(image_path))
+        except JobRejectedError as e:
+            results.append(e.code)
+    
+    threads = [threading.Thread(target=submit) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(server.pipeline.jobs) == 3
+    assert results.count(429) == 17
+    assert sorted(job.index for job in server.pipeline.jobs) == [0, 1, 2]
+    assert server.status()['rejected'] == 17
+
+def test_rejected_upload_is_removed(server, image_path, tmp_path):
+    for _ in range(3):
+        server.submit(image_path)
+    
+    with pytest.raises(JobRejectedError):
+        server.submit(image_data=b'jpeg', filename='upload.jpg')
+    assert list((tmp_path / 'uploads').iterdir()) == []
+
+def test_negative_content_length_is_rejected(server):
+    with socket.create_connection((server.host, server.port), timeout=5) as sock:
+        sock.sendall(b"POST /jobs HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: -1\r\n\r\n")
+        reply = sock.recv(4096)
+    assert reply.startswith(b"HTTP/1.0 400") or reply.startswith(b"HTTP/1.1 400")
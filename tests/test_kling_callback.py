@@ -0,0 +1,46 @@
+# 可灵回调测试：模拟服务在渲染结束后推送回调，生成器不依赖轮询即可拿到结果
+import time
+import pytest
+
+from mock_servers import MockServer
+from video.kling_generator import KlingGenerator
+from video.callback_server import check_callback_address
+
+@pytest.fixture
+def mock_server():
+    server = MockServer({'render_time': 0.5, 'video_bytes': 1024, 'seed': 1}).start()
+    yield server
+    server.stop()
+
+def make_generator(server, name, **callback):
+    return KlingGenerator({
+        'name': name,
+        'endpoint': server.url,
+        'access_key': 'test-access-key',
+        'secret_key': 'test-secret-key-for-mock-server-jwt',
+        'default_render_eta': 60,
+        'callback': dict({'enabled': True, 'host': '127.0.0.1', 'port': 0, 'safety_poll_interval': 60}, **callback)
+    })
+
+def test_callback_completes_task_without_polling(mock_server):
+    generator = make_generator(mock_server, 'kling-callback-test')
+    
+    task = generator.submit_task("一只猫在窗台上晒太阳")
+    start_time = time.time()
+    result = generator.wait_for_task(task)
+    
+    # 预计耗时60秒、兜底轮询60秒，只有回调能让任务在几秒内结束
+    assert time.time() - start_time < 10
+    assert result['video_url'].endswith(f"{task['task_id']}.mp4")
+    # 回调请求在生成器处理完后才返回，稍等模拟服务记录结果
+    deadline = time.time() + 5
+    while 'callback' not in mock_server.stats()['requests'] and time.time() < deadline:
+        time.sleep(0.05)
+    assert mock_server.stats()['requests']['callback'] == {'200': 1}
+
+def test_wildcard_host_without_public_url_fails_fast(mock_server):
+    with pytest.raises(ValueError):
+        make_generator(mock_server, 'kling-callback-wildcard', host='0.0.0.0')
+
+def test_public_url_allows_wildcard_host():
+    check_callback_address('0.0.0.0', 'https://example.com/kling/callback')
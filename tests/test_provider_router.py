@@ -0,0 +1,54 @@
+# 提供商路由测试：请求内容导致的失败不影响熔断器，等待渲染的时间不计入延迟统计
+import pytest
+
+from utils.provider_router import ProviderRouter, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+
+class RejectedError(RuntimeError):
+    pass
+
+def fail(name):
+    raise RuntimeError(f"{name} unavailable")
+
+def reject(name):
+    raise RejectedError("content rejected")
+
+def test_neutral_error_does_not_reset_failures():
+    router = ProviderRouter("测试", ['a'], {'failure_threshold': 3})
+    breaker = router.breakers['a']
+    for _ in range(2):
+        with pytest.raises(Exception):
+            router.call(fail)
+    
+    with pytest.raises(RejectedError):
+        router.call(reject, neutral_errors=(RejectedError,))
+    assert breaker.snapshot()['requests'] == 2
+    
+    # 中间的拒绝没有清零连续失败次数，第3次失败即熔断
+    with pytest.raises(Exception):
+        router.call(fail)
+    assert breaker.state == STATE_OPEN
+
+def test_neutral_error_releases_half_open_probe_without_closing():
+    router = ProviderRouter("测试", ['a'], {'failure_threshold': 1, 'open_seconds': 0})
+    breaker = router.breakers['a']
+    with pytest.raises(Exception):
+        router.call(fail)
+    assert breaker.state == STATE_OPEN
+    
+    with pytest.raises(RejectedError):
+        router.call(reject, neutral_errors=(RejectedError,))
+    assert breaker.state == STATE_HALF_OPEN
+    
+    # 探测名额已释放，下一个请求作为真正的探测
+    assert router.call(lambda name: 'ok') == ('a', 'ok')
+    assert breaker.state == STATE_CLOSED
+
+def test_record_without_latency_is_excluded_from_latency_stats():
+    router = ProviderRouter("测试", ['a'])
+    router.record('a', 0.5)
+    router.record('a', None)
+    router.record('a', None)
+    
+    health = router.breakers['a'].snapshot()
+    assert health['requests'] == 3
+    assert health['p50_latency'] == 0.5
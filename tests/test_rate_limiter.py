@@ -0,0 +1,125 @@
+# 限流器测试：令牌桶、被限流后的自适应降速和逐步恢复（使用假时钟）
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import ProviderGovernor
+
+class FakeClock:
+    """替换rate_limiter中的time模块，sleep只推进时间"""
+    
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+    
+    def monotonic(self):
+        return self.now
+    
+    def time(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+    
+    def close(self):
+        pass
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+def test_token_bucket_allows_burst_then_paces(clock):
+    governor = ProviderGovernor('bucket', {'rpm': 60, 'burst': 2})
+    
+    for _ in range(4):
+        governor.wait_for_token()
+    
+    # 前两个请求使用桶内的令牌，之后每秒一个
+    assert clock.sleeps == [pytest.approx(1.0), pytest.approx(1.0)]
+
+def test_unlimited_governor_never_waits(clock):
+    governor = ProviderGovernor('unlimited')
+    
+    for _ in range(100):
+        governor.wait_for_token()
+    
+    assert clock.sleeps == []
+
+def test_throttle_pauses_and_lowers_rate_then_recovers(clock):
+    governor = ProviderGovernor('adapt', {'rpm': 600, 'recover_after': 3, 'min_rate_factor': 0.5})
+    
+    assert governor.on_throttled(retry_after=5) == 5
+    assert governor.rate == pytest.approx(7.0)
+    start = clock.now
+    governor.wait_for_token()
+    assert clock.now - start == pytest.approx(5)
+    
+    # 速率不低于配置值的min_rate_factor
+    governor.on_throttled(retry_after=0)
+    governor.on_throttled(retry_after=0)
+    assert governor.rate == pytest.approx(5.0)
+    
+    # 每连续成功recover_after次恢复配置速率的10%
+    for _ in range(3):
+        governor.on_success()
+    assert governor.rate == pytest.approx(6.0)
+    for _ in range(30):
+        governor.on_success()
+    assert governor.rate == pytest.approx(10.0)
+
+def test_throttle_without_retry_after_backs_off_exponentially(clock):
+    governor = ProviderGovernor('backoff', {'backoff': 2})
+    
+    assert governor.on_throttled(attempt=0) == 2
+    assert governor.on_throttled(attempt=2) == 8
+
+def test_quota_seeds_limit_from_in_flight_when_unconfigured(clock):
+    governor = ProviderGovernor('quota', {'recover_after': 2})
+    for _ in range(4):
+        governor.acquire_slot()
+    
+    # 被拒绝的请求自己占着一个名额，其余3个即为账户可用的并发数
+    governor.on_throttled(retry_after=0, quota=True)
+    assert governor.limit == 3
+    assert governor.rate is None
+    
+    governor.on_success()
+    governor.on_success()
+    assert governor.limit == 4
+
+def test_quota_never_raises_configured_limit(clock):
+    governor = ProviderGovernor('quota-configured', {'max_in_flight': 2, 'recover_after': 1})
+    governor.acquire_slot()
+    governor.acquire_slot()
+    
+    governor.on_throttled(retry_after=0, quota=True)
+    assert governor.limit == 1
+    
+    for _ in range(5):
+        governor.on_success()
+    assert governor.limit == 2
+
+def test_send_retries_after_429(clock):
+    governor = ProviderGovernor('send', {'max_retries': 3})
+    responses = [FakeResponse(429, {'Retry-After': '3'}), FakeResponse(429, {'Retry-After': '3'}), FakeResponse(200)]
+    
+    response = governor.send(lambda: responses.pop(0))
+    
+    assert response.status_code == 200
+    assert clock.sleeps == [pytest.approx(3), pytest.approx(3)]
+    assert governor.in_flight == 0
+
+def test_stream_holds_slot_until_exit(clock):
+    governor = ProviderGovernor('stream')
+    
+    with governor.stream(lambda: FakeResponse(200)) as response:
+        assert response.status_code == 200
+        assert governor.in_flight == 1
+    assert governor.in_flight == 0
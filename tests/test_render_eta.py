@@ -0,0 +1,36 @@
+# 渲染耗时估计测试：历史中位数、记录窗口和按预计完成时间安排的轮询间隔
+import pytest
+
+from video.render_eta import RenderETAEstimator
+
+def test_estimate_uses_median_of_recent_samples(tmp_path):
+    history_path = str(tmp_path / 'eta.json')
+    estimator = RenderETAEstimator(history_path, default_eta=180, window=4)
+    key = RenderETAEstimator.make_key('kling-v1', 'std', 5)
+    assert estimator.estimate(key) == 180
+    
+    for seconds in (100, 0, None, 40, 60):
+        estimator.record(key, seconds)
+    assert estimator.estimate(key) == 60
+    estimator.record(key, 80)
+    assert estimator.estimate(key) == 70
+    
+    # 只保留最近window条记录，并在重新加载后沿用
+    for seconds in (10, 10, 10):
+        estimator.record(key, seconds)
+    reloaded = RenderETAEstimator(history_path, window=4)
+    assert reloaded.estimate(key) == 10
+    assert reloaded.estimate(RenderETAEstimator.make_key('kling-v1', 'pro', 5)) == 180
+
+@pytest.mark.parametrize('elapsed, delay', [
+    (0, 30),     # 离预计完成还远：不超过最长间隔
+    (60, 20),    # 等待剩余时间的一半
+    (85, 5),     # 不越过预计完成前的密集窗口
+    (95, 1),     # 密集窗口内按最短间隔
+    (105, 1),
+    (120, 5),    # 超时后随超时时长放宽
+    (400, 30)
+])
+def test_next_delay_tightens_around_eta(elapsed, delay):
+    estimator = RenderETAEstimator(min_interval=1, max_interval=30)
+    assert estimator.next_delay(elapsed, 100) == pytest.approx(delay)
@@ -0,0 +1,100 @@
+# 轮询器测试：按预计完成时间安排的查询节奏、兜底轮询间隔和查询失败处理（使用假时钟）
+import pytest
+
+from video import task_poller
+from video.render_eta import RenderETAEstimator
+from video.task_poller import KlingTaskPoller, TaskFailedError
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+    
+    def time(self):
+        return self.now
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+    
+    def raise_for_status(self):
+        pass
+    
+    def json(self):
+        return {'code': 0, 'data': self._data}
+
+class FakeGenerator:
+    """按顺序返回预设的任务状态"""
+    
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+    
+    def _api_request(self, method, path, params=None):
+        self.requests.append(path)
+        status = self.statuses.pop(0)
+        if isinstance(status, Exception):
+            raise status
+        return FakeResponse(status)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(task_poller, 'time', clock)
+    return clock
+
+def make_poller(statuses, estimator=None, **kwargs):
+    poller = KlingTaskPoller(FakeGenerator(statuses), estimator or RenderETAEstimator(default_eta=100), use_list_query=False, **kwargs)
+    # 不启动后台线程，由测试按假时钟逐轮查询
+    poller._ensure_thread = lambda: None
+    return poller
+
+def poll_when_due(poller, clock, task_id):
+    """把时钟推进到任务的下一次查询时间并查询一轮，返回等待的秒数"""
+    delay = poller._tasks[task_id]['next_poll_at'] - clock.now
+    clock.now += delay
+    poller._poll_round([task_id])
+    return delay
+
+def test_poller_follows_eta_schedule_and_records_render_time(clock):
+    processing = {'task_id': 't1', 'task_status': 'processing'}
+    succeed = {
+        'task_id': 't1', 'task_status': 'succeed', 'created_at': 1000000, 'updated_at': 1091000,
+        'task_result': {'videos': [{'url': 'http://example.invalid/t1.mp4', 'duration': '5'}]}
+    }
+    estimator = RenderETAEstimator(default_eta=100)
+    poller = make_poller([processing] * 4 + [succeed], estimator)
+    future = poller.watch('t1', eta_key='k', submitted_at=clock.now)
+    
+    delays = [poll_when_due(poller, clock, 't1') for _ in range(5)]
+    
+    assert delays == [pytest.approx(value) for value in (30, 30, 20, 10, 1)]
+    result = future.result(timeout=0)
+    assert result['polls'] == 5
+    assert result['render_seconds'] == 91
+    assert estimator.estimate('k') == 91
+
+def test_callback_mode_polls_at_safety_interval(clock):
+    poller = make_poller([{'task_id': 't1', 'task_status': 'processing'}] * 2, safety_interval=120)
+    poller.watch('t1', submitted_at=clock.now)
+    
+    assert [poll_when_due(poller, clock, 't1') for _ in range(2)] == [120, 120]
+
+def test_poll_errors_retry_then_fail_task(clock):
+    poller = make_poller([RuntimeError('boom')] * 3, max_errors=3)
+    future = poller.watch('t1', submitted_at=clock.now)
+    
+    for _ in range(3):
+        poll_when_due(poller, clock, 't1')
+    
+    with pytest.raises(RuntimeError, match='boom'):
+        future.result(timeout=0)
+    assert poller.pending_count == 0
+
+def test_failed_status_raises_task_failed(clock):
+    poller = make_poller([{'task_id': 't1', 'task_status': 'failed', 'task_status_msg': '内容不合规'}])
+    future = poller.watch('t1', submitted_at=clock.now)
+    
+    poll_when_due(poller, clock, 't1')
+    
+    with pytest.raises(TaskFailedError, match='内容不合规'):
+        future.result(timeout=0)
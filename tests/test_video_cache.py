@@ -0,0 +1,86 @@
+# 视频缓存测试：命中与未命中、硬链接或复制输出以及并发写入
+import os
+import threading
+
+from video.video_cache import VideoCache
+
+REQUEST = {'model_name': 'kling-v1', 'prompt': '海边的日落', 'duration': '5', 'callback_url': 'http://a', 'external_task_id': 'job-0'}
+
+def write_video(path, content=b'mp4-data'):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+def test_key_ignores_volatile_fields():
+    key = VideoCache.make_key(REQUEST)
+    
+    assert VideoCache.make_key(dict(REQUEST, callback_url='http://b', external_task_id='job-1')) == key
+    assert VideoCache.make_key(dict(REQUEST, duration='10')) != key
+
+def test_store_and_fetch(tmp_path):
+    cache = VideoCache(str(tmp_path / 'cache'))
+    key = VideoCache.make_key(REQUEST)
+    output_path = str(tmp_path / 'out' / 'video.mp4')
+    
+    assert cache.fetch(key, output_path) is None
+    cache.store(key, write_video(tmp_path / 'downloaded.mp4'), 'task-1', REQUEST)
+    meta = cache.fetch(key, output_path)
+    
+    assert meta['task_id'] == 'task-1'
+    assert 'callback_url' not in meta['request']
+    with open(output_path, 'rb') as f:
+        assert f.read() == b'mp4-data'
+    # 同一文件系统上以硬链接输出，不复制视频内容
+    assert os.path.samefile(output_path, cache.data_path(key, '.mp4'))
+
+def test_entry_without_video_file_is_removed(tmp_path):
+    cache = VideoCache(str(tmp_path / 'cache'))
+    key = VideoCache.make_key(REQUEST)
+    cache.store(key, write_video(tmp_path / 'downloaded.mp4'), 'task-1', REQUEST)
+    os.remove(cache.data_path(key, '.mp4'))
+    
+    assert cache.fetch(key, str(tmp_path / 'video.mp4')) is None
+    assert cache.get(key) is None
+
+def test_link_or_copy_falls_back_to_copy(tmp_path, monkeypatch):
+    def cross_device(src, dst):
+        raise OSError(18, 'Invalid cross-device link')
+    monkeypatch.setattr(os, 'link', cross_device)
+    src = write_video(tmp_path / 'src.mp4')
+    dst = str(tmp_path / 'dst.mp4')
+    
+    VideoCache._link_or_copy(src, dst)
+    
+    with open(dst, 'rb') as f:
+        assert f.read() == b'mp4-data'
+    assert not os.path.samefile(src, dst)
+
+def test_concurrent_writers_use_separate_temp_files(tmp_path, monkeypatch):
+    # 复制比硬链接慢得多，写入方之间的临时文件更容易发生冲突
+    def cross_device(src, dst):
+        raise OSError(18, 'Invalid cross-device link')
+    monkeypatch.setattr(os, 'link', cross_device)
+    contents = [bytes([index]) * 200000 for index in range(8)]
+    sources = [write_video(tmp_path / f"src{index}.mp4", content) for index, content in enumerate(contents)]
+    dst = str(tmp_path / 'out' / 'video.mp4')
+    barrier = threading.Barrier(len(sources))
+    errors = []
+    
+    def writer(src):
+        barrier.wait()
+        try:
+            for _ in range(20):
+                VideoCache._link_or_copy(src, dst)
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=writer, args=(src,)) for src in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert errors == []
+    assert os.listdir(tmp_path / 'out') == ['video.mp4']
+    with open(dst, 'rb') as f:
+        assert f.read() in contents